@@ -0,0 +1,266 @@
+"""
+YAMLプロンプトのバッチ生成
+
+JSONL / CSV から comic_page のデータを読み込み、プロセスプールで並列にYAMLへ変換する。
+
+使い方:
+    python batch.py pages.jsonl -o out_dir          # 1レコード1ファイル
+    python batch.py pages.jsonl --combined all.yaml  # 1つのYAMLストリームにまとめる
+    python batch.py pages.csv --combined - -j 8      # 標準出力へ、8プロセスで
+    python batch.py pages.jsonl --combined all.yaml --dedup  # 重複する長文をアンカーで1回だけ書く
+    python batch.py pages.jsonl -o out_dir --compact         # 空のリストと余分な空白を省いたコンパクト出力
+    python batch.py pages.jsonl -o out_dir --validate        # 生成前にチェックし、error のあるレコードは書かない
+    python batch.py pages.jsonl -o out_dir --cache prompt_cache   # 前回と同じ内容のページはキャッシュから書く
+
+--cache を付けると、生成したYAMLを内容のハッシュをキーにしてディスクに残し（prompt_cache.py）、
+次回からは内容が変わっていないページを生成せずにファイルから読む。ワーカー全部で同じキャッシュを使い、
+最後に合計が --cache-max-mb を超えた分を長く使われていないものから消す。
+
+--combined は通常「---」区切りの複数文書になる。--dedup を付けると、ページをまたいで
+アンカーを共有するため「- comic_page :」のリスト1つの文書にまとめる。
+
+入力の1レコードは画面の output_data と同じ {"comic_page": {...}} の形。
+"id" があれば出力ファイル名に使う。省略された基本設定はサイドバーの既定値で埋める。
+CSV の場合は comic_page 列に JSON を入れるか、language / panels などの列を並べる
+（character_infos と panels は JSON 文字列）。
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from models import Page
+from prompt_cache import DEFAULT_MAX_BYTES, PromptCache
+from prompt_core import AnchorTable, as_list_item, fill_page_defaults, make_yaml_text
+from validate import format_issue, has_errors, validate_page
+
+# CSV の列のうち JSON として読むもの
+JSON_COLUMNS = ("comic_page", "character_infos", "panels")
+
+
+# --- 入力の読み込み ---
+def iter_records(path):
+    """
+    JSONL / CSV ファイルから (レコード番号, レコード) を1件ずつ返す
+    JSONL の行は文字列のまま返し、JSON の解析はワーカー側で行う
+    """
+    if path == "-":
+        f = sys.stdin
+    else:
+        f = open(path, encoding="utf-8", newline="")
+    try:
+        if path.lower().endswith(".csv"):
+            for i, row in enumerate(csv.DictReader(f), 1):
+                yield i, row
+        else:
+            for i, line in enumerate(f, 1):
+                if line.strip():
+                    yield i, line
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def record_to_page(record):
+    """
+    JSONL の1行 または CSV の1行を (id, output_data) に変換する
+    """
+    if isinstance(record, str):
+        data = json.loads(record)
+        cp = data["comic_page"]
+    else:
+        data = {k: v for k, v in record.items() if v not in (None, "")}
+        for key in JSON_COLUMNS:
+            if key in data:
+                data[key] = json.loads(data[key])
+        cp = data.pop("comic_page", None)
+        if cp is None:
+            cp = {k: v for k, v in data.items() if k != "id"}
+    return data.get("id"), {"comic_page": fill_page_defaults(cp)}
+
+
+# --- ワーカー ---
+# キャッシュのディレクトリ -> このプロセスの PromptCache
+_caches = {}
+
+
+def _worker_cache(directory):
+    cache = _caches.get(directory)
+    if cache is None:
+        cache = _caches[directory] = PromptCache(directory)
+    return cache
+
+
+def _render(task):
+    """
+    ワーカープロセスで1レコードを変換する
+    out_dir があればファイルに書いて文字数を、なければYAML文字列を返す
+    dedup のときはページ内の重複をアンカーにして、省けたバイト数も返す
+    validate のときは生成前にチェックし、warning の文字列のリストも返す（error があれば失敗にする）
+    cache_dir があればキャッシュを使い、キャッシュにあったか (True / False) も返す（使わなければ None）
+    """
+    num, record, out_dir, dedup, compact, validate, cache_dir = task
+    anchors = AnchorTable() if dedup else None
+    warnings = []
+    hit = None
+    try:
+        yaml_str = None
+        key = line_key = None
+        if cache_dir is not None:
+            cache = _worker_cache(cache_dir)
+            # 前と同じ行なら、まとめ出力ではレコードの JSON も読まない（ファイル名の id とチェックには要る）
+            if isinstance(record, str):
+                line_key = cache.line_key(record, compact)
+                yaml_str = cache.get_line(line_key)
+        if yaml_str is None or validate or out_dir is not None:
+            rec_id, page = record_to_page(record)
+        if cache_dir is not None:
+            if yaml_str is None:
+                key = cache.key(page, compact)
+                yaml_str = cache.get(key)
+            hit = yaml_str is not None
+        if validate:
+            issues = validate_page(Page.from_dict(page["comic_page"]))
+            if has_errors(issues):
+                errors = [format_issue(i) for i in issues if i["level"] == "error"]
+                return num, None, "; ".join(errors), 0, [], hit
+            warnings = [format_issue(i) for i in issues]
+        if cache_dir is None:
+            yaml_str = make_yaml_text(page, anchors=anchors, compact=compact)
+        else:
+            # アンカーにする前のYAMLをキャッシュする（アンカー化は生成済みの文字列の置き換えなので、後からでよい）
+            if not hit:
+                yaml_str = make_yaml_text(page, compact=compact)
+                cache.put(key, yaml_str)
+            if key is not None and line_key is not None:
+                # 次に同じ行が来たら JSON を読まずに引けるようにする
+                cache.put_line(line_key, key)
+            if anchors is not None:
+                yaml_str = anchors.apply(yaml_str)
+    except (KeyError, TypeError, ValueError) as e:
+        return num, None, f"{type(e).__name__}: {e}", 0, [], hit
+    saved = anchors.saved if dedup else 0
+
+    if out_dir is None:
+        return num, yaml_str, None, saved, warnings, hit
+    name = f"{rec_id}.yaml" if rec_id else f"page_{num:05d}.yaml"
+    with open(os.path.join(out_dir, name), "w", encoding="utf-8") as f:
+        f.write(yaml_str)
+    return num, len(yaml_str), None, saved, warnings, hit
+
+
+def run_batch(path, out_dir=None, combined=None, workers=None, chunksize=None, dedup=False, compact=False,
+              validate=False, cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES):
+    """
+    バッチ変換の本体
+    (成功件数, 失敗件数, 経過秒数, ページごとの省略バイト数のリスト, キャッシュの集計) を返す
+    キャッシュの集計は {"hits": ..., "misses": ..., "evicted": ...}（cache_dir がなければ None）
+    """
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    # 1件ずつ受け渡すとプロセス間通信の方が重くなるので、まとめて渡す
+    chunksize = chunksize or 64
+
+    # まとめ出力の dedup はページをまたぐので、ワーカーでは普通に生成して親プロセスでアンカー化する
+    shared = AnchorTable() if dedup and out_dir is None else None
+    tasks = ((num, record, out_dir, dedup and shared is None, compact, validate, cache_dir)
+             for num, record in iter_records(path))
+    if combined == "-":
+        out = sys.stdout
+    elif combined:
+        out = open(combined, "w", encoding="utf-8")
+    else:
+        out = None
+
+    ok = failed = 0
+    saved_per_page = []
+    cache_stats = {"hits": 0, "misses": 0, "evicted": 0} if cache_dir else None
+    start = time.perf_counter()
+    try:
+        if workers == 1:
+            results = map(_render, tasks)
+            pool = None
+        else:
+            pool = Pool(workers)
+            # imap は入力順を保つので、まとめ出力でもページ順がずれない
+            results = pool.imap(_render, tasks, chunksize)
+        for num, result, error, saved, warnings, hit in results:
+            if hit is not None:
+                cache_stats["hits" if hit else "misses"] += 1
+            for warning in warnings:
+                print(f"record {num}: {warning}", file=sys.stderr)
+            if error:
+                failed += 1
+                print(f"record {num}: {error}", file=sys.stderr)
+                continue
+            ok += 1
+            if shared is not None:
+                if ok > 1:
+                    out.write("\n")
+                out.write(shared.apply(as_list_item(result)))
+                shared.end_page()
+                continue
+            if dedup:
+                saved_per_page.append(saved)
+            if out is not None:
+                out.write("---\n")
+                out.write(result)
+                if not result.endswith("\n"):
+                    out.write("\n")
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    if shared is not None:
+        saved_per_page = shared.saved_per_page
+    elapsed = time.perf_counter() - start
+    if cache_dir:
+        # ワーカーが全部終わってから、親プロセスだけで古いものを消す
+        cache_stats["evicted"] = PromptCache(cache_dir, cache_max_bytes).prune()
+    return ok, failed, elapsed, saved_per_page, cache_stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="comic_page の JSONL / CSV からYAMLプロンプトをまとめて生成する")
+    parser.add_argument("input", help="入力ファイル (.jsonl / .csv、- で標準入力)")
+    parser.add_argument("-o", "--out-dir", help="1レコード1ファイルで書き出すディレクトリ")
+    parser.add_argument("--combined", help="全ページを1つのYAMLストリームにまとめて書き出すファイル (- で標準出力)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="ワーカープロセス数 (既定: CPUコア数)")
+    parser.add_argument("--chunksize", type=int, default=None, help="1回でワーカーに渡すレコード数")
+    parser.add_argument("--dedup", action="store_true", help="重複する長い文字列をYAMLのアンカー・エイリアスで1回だけ書く")
+    parser.add_argument("--compact", action="store_true", help="空のリストと余分な空白を省いたコンパクト出力にする")
+    parser.add_argument("--validate", action="store_true",
+                        help="生成前にチェックして warning を表示し、error のあるレコードは失敗にする")
+    parser.add_argument("--cache", metavar="DIR", help="生成したYAMLをこのディレクトリにキャッシュし、同じ内容のページは生成しない")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / 1024 / 1024,
+                        help=f"キャッシュの合計サイズの上限 (MB、既定: {DEFAULT_MAX_BYTES // 1024 // 1024})")
+    args = parser.parse_args(argv)
+
+    if bool(args.out_dir) == bool(args.combined):
+        parser.error("--out-dir か --combined のどちらか一方を指定してください")
+
+    ok, failed, elapsed, saved_per_page, cache_stats = run_batch(
+        args.input, args.out_dir, args.combined, args.workers, args.chunksize, args.dedup, args.compact, args.validate,
+        args.cache, int(args.cache_max_mb * 1024 * 1024))
+    rate = ok / elapsed if elapsed > 0 else 0.0
+    print(f"{ok} pages in {elapsed:.2f}s ({rate:.1f} pages/s), {failed} failed", file=sys.stderr)
+    if args.dedup and saved_per_page:
+        total = sum(saved_per_page)
+        print(f"dedup saved {total} bytes ({total / len(saved_per_page):.0f} bytes/page)", file=sys.stderr)
+    if cache_stats is not None:
+        looked_up = cache_stats["hits"] + cache_stats["misses"]
+        hit_rate = cache_stats["hits"] / looked_up if looked_up else 0.0
+        print(f"cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses ({hit_rate:.1%} hit), "
+              f"{cache_stats['evicted']} evicted", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,454 @@
+"""
+ベンチマーク
+
+ネットワークなしで動く。乱数のシードを固定した架空のプロジェクト（1〜10,000パネル）を作り、
+YAML生成と、Streamlit の AppTest での index.py の再実行にかかる時間を測る。
+コンパクト出力で出力サイズがどれだけ小さくなるかを表示し、読み込み (prompt_parser) の速さも測る。
+差分 (diff.py) の時間を測り、生成前のチェック (validate.py) とパネルの検索 (search.py) が十分速いかも確かめる。
+formats.py で4つの形式を1回で作る時間と、形式ごとに別々に作る時間も比べる。
+ディスクキャッシュ (prompt_cache.py) から読む時間と、生成する時間も比べる。
+台本の読み込み (script_import.py) が長い台本でも少ないメモリで済むかも確かめる。
+5,000パネルのページをレコード (models.py) で持つ場合と辞書で持つ場合のメモリと生成時間も比べる。
+
+使い方:
+    python bench.py --save          # 測定して bench_baseline.json に保存する
+    python bench.py                 # 測定して bench_baseline.json と比べる（遅くなっていたら終了コード1）
+    python bench.py --quick         # 大きいサイズを省いて手早く測る
+
+Streamlit が入っていない環境では、再実行の測定は飛ばす。
+時間に関係しない正しさのチェックは tests/ にある (python -m pytest)。
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from diff import diff
+from formats import FORMATS, render
+from history import History
+from models import Page
+from project import Project
+from project_store import ProjectStore
+from prompt_cache import PromptCache
+from prompt_core import PanelCache, make_yaml_text, size_report
+from prompt_parser import iter_pages, parse_page
+from script_import import ScriptImporter
+from search import SearchIndex
+# 架空のプロジェクトはテストと同じものを使う
+from tests.conftest import BACKGROUNDS, DESCRIPTIONS, LINES, NAMES, make_project
+from validate import validate_page
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+PANEL_SIZES = (1, 10, 100, 1000, 10000)
+# AppTest はパネルが多いと1回に何秒もかかるので、ここまでにしておく
+RERUN_SIZES = (1, 10, 100, 1000)
+# import だけで増える時間の上限（秒）
+IMPORT_BUDGET = 0.020
+# 10,000パネルのプロジェクトの読み込み時間の上限（秒）
+LOAD_BUDGET = 0.200
+# コンパクト出力でどれだけ小さくなるかを表示するパネル数（小さくなっていることは tests で確かめる）
+COMPACT_SIZES = (10, 100, 1000)
+# 読み込みの測定に使うコーパス（20パネルのページ × この数を「---」でつないだもの）
+PARSE_CORPUS_PAGES = 500
+# 1,000パネルの版同士の差分の目安（秒）
+DIFF_BUDGET = 0.020
+# 生成前のチェック (validate.py) で1秒あたりに調べられるパネル数の下限
+VALIDATE_MIN_RATE = 100000
+# 10,000パネルのプロジェクトの検索1回の目安（秒）と、測る語
+SEARCH_BUDGET = 0.010
+SEARCH_QUERIES = ("なのばなな", "放課後の教室", "aichan", "モニター 泣きながら", "ぷろ", "見つからない語")
+
+# 台本の読み込み (script_import.py) に使う台本の行数と、読み込み中に増えてよいメモリの上限（バイト）
+SCRIPT_LINES = 50000
+SCRIPT_MAX_PEAK = 1024 * 1024
+# レコード (models.py) と辞書でメモリと生成時間を比べるパネル数
+RECORDS_PANELS = 5000
+
+# --- 測定 ---
+def best_of(func, repeat=5, min_time=0.2):
+    """
+    func の1回あたりの時間（秒）を、何回か測った中の最小値で返す
+    """
+    # 短すぎると誤差が大きいので、1セットが min_time 秒くらいになるように回数を決める
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 4
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def bench_import():
+    """
+    prompt_core の import にかかる時間（別プロセスで測る）
+    """
+    code = "import time; t = time.perf_counter(); import prompt_core; print(time.perf_counter() - t)"
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = []
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True)
+        times.append(float(out.stdout))
+    return min(times)
+
+
+def bench_generator(sizes):
+    results = {}
+    for n in sizes:
+        page = make_project(n, seed=n)
+        output_data = {"comic_page": page.to_dict()}
+        repeat = 3 if n >= 10000 else 5
+        results[f"make_yaml_text/page/{n}"] = best_of(lambda: make_yaml_text(page), repeat)
+        results[f"make_yaml_text/dict/{n}"] = best_of(lambda: make_yaml_text(output_data), repeat)
+        results[f"make_yaml_text/compact/{n}"] = best_of(lambda: make_yaml_text(page, compact=True), repeat)
+        cache = PanelCache(maxsize=max(n, 1))
+        make_yaml_text(page, cache)
+        results[f"make_yaml_text/cached/{n}"] = best_of(lambda: make_yaml_text(page, cache), repeat)
+    return results
+
+
+def _traced(build):
+    """
+    build() の結果と、作ったあとに残っているメモリ・作るあいだのメモリの最大（バイト）
+    """
+    tracemalloc.start()
+    try:
+        obj = build()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return obj, current, peak
+
+
+def bench_records(n=RECORDS_PANELS):
+    """
+    n パネルのページをレコード (Page) で持つ場合と、もとの辞書で持つ場合のメモリと make_yaml_text の時間
+    どちらも JSON から作るので、文字列はそれぞれ別に持つ
+    """
+    line = json.dumps({"comic_page": make_project(n, seed=n).to_dict()}, ensure_ascii=False)
+    page, page_current, page_peak = _traced(lambda: Page.from_dict(json.loads(line)["comic_page"]))
+    data, dict_current, dict_peak = _traced(lambda: json.loads(line))
+    results = {
+        f"records/page/{n}": best_of(lambda: make_yaml_text(page), repeat=3),
+        f"records/dict/{n}": best_of(lambda: make_yaml_text(data), repeat=3),
+    }
+    memory = {"page": (page_current, page_peak), "dict": (dict_current, dict_peak)}
+    return results, memory
+
+
+def compact_sizes(sizes):
+    """
+    (パネル数, 通常のバイト数, コンパクト出力のバイト数, 推定トークン数, コンパクトの推定トークン数) のリスト
+    """
+    rows = []
+    for n in sizes:
+        page = make_project(n, seed=n)
+        normal = size_report(page)
+        compact = size_report(page, compact=True)
+        rows.append((n, sum(r["bytes"] for r in normal), sum(r["bytes"] for r in compact),
+                     sum(r["tokens"] for r in normal), sum(r["tokens"] for r in compact)))
+    return rows
+
+
+def bench_parser(n_pages=PARSE_CORPUS_PAGES):
+    """
+    複数ページのYAMLを読み込む時間と、そのコーパスの大きさ（バイト）
+    """
+    corpus = "".join("---\n" + make_yaml_text(make_project(20, seed=i)) for i in range(n_pages))
+    lines = corpus.splitlines(keepends=True)
+
+    def parse():
+        for _ in iter_pages(lines):
+            pass
+    return {f"parse/corpus/{n_pages}": best_of(parse, repeat=3, min_time=0)}, len(corpus.encode())
+
+
+def bench_diff(n=1000):
+    """
+    n パネルのプロジェクトと、20か所を直して10パネルを移動した版との差分にかかる時間
+    shared は履歴の版同士（変えていないパネルを共有）、parsed はYAMLから読み込んだ版（共有なし）
+    """
+    page = make_project(n, seed=n)
+    old = Project(page.character_infos, page.panels)
+    new = old
+    for i in range(0, n, max(n // 20, 1)):
+        panel = copy.deepcopy(new.panels[i])
+        panel.description += "（修正）"
+        new = new.apply({"op": "update_panel", "index": i, "panel": panel})
+    new = new.apply({"op": "move_panels", "start": 10, "stop": 20, "to": n // 2})
+    parsed = parse_page(make_yaml_text(page))
+    parsed = Project(parsed.character_infos, parsed.panels)
+    return {
+        f"diff/shared/{n}": best_of(lambda: diff(old, new), repeat=3),
+        f"diff/parsed/{n}": best_of(lambda: diff(parsed, new), repeat=3),
+    }
+
+
+def bench_validate(n=1000):
+    """
+    n パネルのページを、覚えている結果なしでチェックする時間
+    """
+    page = make_project(n, seed=n)
+    return {f"validate/{n}": best_of(lambda: validate_page(page), repeat=3)}
+
+
+def bench_formats(n=1000):
+    """
+    4つの形式を1回の render で作る時間と、形式ごとに別々に render する時間
+    """
+    page = make_project(n, seed=n)
+    return {
+        f"formats/one_pass/{n}": best_of(lambda: render(page, FORMATS)),
+        f"formats/separate/{n}": best_of(lambda: [render(page, (f,)) for f in FORMATS]),
+    }
+
+
+def bench_prompt_cache(n=100):
+    """
+    ディスクキャッシュにあるページを読む時間と、JSONL の1行から生成する時間
+    hit は行を読んで並べ直したキーで、hit_line は前と同じ行の近道 (line_key) で引く
+    """
+    line = json.dumps({"comic_page": make_project(n, seed=n).to_dict()}, ensure_ascii=False)
+    with tempfile.TemporaryDirectory() as d:
+        cache = PromptCache(d)
+        key = cache.key(line)
+        cache.put(key, make_yaml_text(json.loads(line)))
+        cache.put_line(cache.line_key(line), key)
+        return {
+            f"prompt_cache/hit/{n}": best_of(lambda: cache.get(cache.key(line))),
+            f"prompt_cache/hit_line/{n}": best_of(lambda: cache.get_line(cache.line_key(line))),
+            f"prompt_cache/generate/{n}": best_of(lambda: make_yaml_text(json.loads(line))),
+        }
+
+
+def write_script(path, n_lines, seed=0):
+    """
+    n_lines 行くらいの架空の台本（パネルの区切り・セリフ・モノローグ・ト書き）を書き出す
+    """
+    r = random.Random(seed)
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < n_lines:
+            f.write(f"# {r.choice(DESCRIPTIONS)}\n")
+            written += 1
+            for _ in range(r.randint(1, 5)):
+                k = r.random()
+                if k < 0.1:
+                    f.write("（彼女の旅は続くのであった）\n")
+                elif k < 0.2:
+                    f.write(f"{r.choice(BACKGROUNDS) or '静かな時間'}\n")
+                else:
+                    f.write(f"{r.choice(NAMES)}: {r.choice(LINES)}\n")
+                written += 1
+
+
+def bench_script_import(n_lines=SCRIPT_LINES):
+    """
+    台本を読み込んでパネルにする時間と、そのあいだに増えたメモリの最大（バイト）
+    パネルは数えるだけで溜めないので、メモリは台本の長さによらず小さいままのはず
+    """
+    chars = make_project(0).character_infos
+
+    def run():
+        with open(path, encoding="utf-8") as f:
+            return sum(1 for _ in ScriptImporter(chars).iter_panels(f))
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "script.txt")
+        write_script(path, n_lines)
+        results = {f"script_import/{n_lines}": best_of(run, repeat=3)}
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return results, peak
+
+
+def bench_search(n=10000, limit=50):
+    """
+    n パネルのプロジェクトで、画面と同じく先頭 limit 件まで検索する時間（SEARCH_QUERIES の中で一番遅いもの）
+    インデックスを作る時間と、1つ直したあとに更新する時間も測る
+    """
+    page = make_project(n, seed=n)
+    project = Project(page.character_infos, page.panels)
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.sync(project.panels)
+    results = {f"search/build/{n}": time.perf_counter() - start}
+    results[f"search/query/{n}"] = max(best_of(lambda: index.search(q, limit), repeat=3, min_time=0.05)
+                                       for q in SEARCH_QUERIES)
+    edited = project.apply({"op": "del_panel", "index": n // 2})
+
+    def resync():
+        index.sync(edited.panels)
+        index.sync(project.panels)
+    results[f"search/sync/{n}"] = best_of(resync, repeat=3) / 2
+    return results
+
+
+def bench_store(n=10000):
+    """
+    n パネルのプロジェクトを保存し、journal に100件追記した状態から読み込む時間
+    """
+    page = make_project(n, seed=n)
+    project = Project(page.character_infos, page.panels)
+    with tempfile.TemporaryDirectory() as root:
+        store = ProjectStore("bench", root=root)
+        store.save(project)
+        for i in range(100):
+            op = {"op": "del_panel", "index": i} if i % 2 else {"op": "add_panel", "panel": page.panels[i]}
+            project = project.apply(op)
+            store.append(op, project)
+        return {f"project_store/load/{n}": best_of(lambda: ProjectStore("bench", root=root).load(), repeat=3)}
+
+
+def bench_rerun(sizes):
+    """
+    AppTest で index.py を再実行する時間。Streamlit がなければ空の結果を返す
+    """
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("streamlit がないので再実行の測定は飛ばします", file=sys.stderr)
+        return {}
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.py")
+    results = {}
+    for n in sizes:
+        page = make_project(n, seed=n)
+        at = AppTest.from_file(script, default_timeout=120)
+        at.session_state["history"] = History(Project(page.character_infos, page.panels))
+        at.run()
+        results[f"rerun/{n}"] = best_of(at.run, repeat=3, min_time=0)
+
+        def click_generate():
+            for b in at.button:
+                if b.label == "YAMLを生成する":
+                    b.click()
+            at.run()
+        results[f"rerun_generate/{n}"] = best_of(click_generate, repeat=3, min_time=0)
+    return results
+
+
+def compare(results, baseline, tolerance, floor):
+    """
+    baseline より tolerance 倍以上遅くなった項目のリストを返す
+    floor 秒未満の差は誤差として無視する
+    """
+    slower = []
+    for key, now in sorted(results.items()):
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if now > before * tolerance and now - before > floor:
+            slower.append((key, before, now))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YAML生成と画面の再実行のベンチマーク")
+    parser.add_argument("--save", action="store_true", help="結果をベースラインとして保存する")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="ベースラインのJSONファイル")
+    parser.add_argument("--quick", action="store_true", help="10,000パネルと再実行の測定を省く")
+    parser.add_argument("--tolerance", type=float, default=1.3, help="この倍率より遅ければ失敗にする")
+    parser.add_argument("--floor", type=float, default=0.001, help="この秒数未満の差は無視する")
+    args = parser.parse_args(argv)
+
+    sizes = PANEL_SIZES[:-1] if args.quick else PANEL_SIZES
+    results = {"import/prompt_core": bench_import()}
+    results.update(bench_generator(sizes))
+    results.update(bench_store())
+    parse_results, corpus_bytes = bench_parser()
+    results.update(parse_results)
+    results.update(bench_diff())
+    results.update(bench_validate())
+    results.update(bench_search())
+    results.update(bench_formats())
+    results.update(bench_prompt_cache())
+    script_results, script_peak = bench_script_import()
+    results.update(script_results)
+    records_results, records_memory = bench_records()
+    results.update(records_results)
+    if not args.quick:
+        results.update(bench_rerun(RERUN_SIZES))
+
+    for key, sec in results.items():
+        print(f"{key:32s} {sec * 1000:10.3f} ms")
+
+    failed = False
+    for n, normal, compact, tokens, compact_tokens in compact_sizes(COMPACT_SIZES):
+        saving = 1 - compact / normal
+        print(f"size/{n:<27d} {normal:>10d} B -> {compact} B compact ({saving:.1%} smaller, "
+              f"~{tokens} -> ~{compact_tokens} tokens)")
+    for kind in ("page", "dict"):
+        current, peak = records_memory[kind]
+        print(f"records/{kind}/{RECORDS_PANELS}: {current / 1e6:.1f} MB held ({peak / 1e6:.1f} MB peak), "
+              f"make_yaml_text {results[f'records/{kind}/{RECORDS_PANELS}'] * 1000:.1f} ms")
+    parse_sec = results[f"parse/corpus/{PARSE_CORPUS_PAGES}"]
+    print(f"parse: {corpus_bytes / 1e6:.1f} MB corpus at {corpus_bytes / 1e6 / parse_sec:.1f} MB/s")
+    validate_rate = 1000 / results["validate/1000"]
+    print(f"validate: {validate_rate:,.0f} panels/s")
+    if validate_rate < VALIDATE_MIN_RATE:
+        print(f"validate が 1秒あたり {VALIDATE_MIN_RATE:,} パネルに届いていません", file=sys.stderr)
+        failed = True
+    if results["search/query/10000"] > SEARCH_BUDGET:
+        print(f"search/query/10000 が {SEARCH_BUDGET * 1000:.0f} ms を超えています", file=sys.stderr)
+        failed = True
+    print(f"formats: {len(FORMATS)} formats in one pass is "
+          f"{results['formats/separate/1000'] / results['formats/one_pass/1000']:.1f}x faster than separate calls")
+    print(f"prompt_cache: a cached 100-panel page is "
+          f"{results['prompt_cache/generate/100'] / results['prompt_cache/hit/100']:.1f}x faster than generating it "
+          f"({results['prompt_cache/generate/100'] / results['prompt_cache/hit_line/100']:.1f}x for an unchanged line)")
+    print(f"script_import: {SCRIPT_LINES:,} lines with a peak of {script_peak / 1024:.0f} KB")
+    if script_peak > SCRIPT_MAX_PEAK:
+        print(f"script_import のメモリが {SCRIPT_MAX_PEAK // 1024} KB を超えています", file=sys.stderr)
+        failed = True
+    if results["diff/shared/1000"] > DIFF_BUDGET:
+        print(f"diff/shared/1000 が {DIFF_BUDGET * 1000:.0f} ms を超えています", file=sys.stderr)
+        failed = True
+    if results["import/prompt_core"] > IMPORT_BUDGET:
+        print(f"import/prompt_core が {IMPORT_BUDGET * 1000:.0f} ms を超えています", file=sys.stderr)
+        failed = True
+    if results["project_store/load/10000"] > LOAD_BUDGET:
+        print(f"project_store/load/10000 が {LOAD_BUDGET * 1000:.0f} ms を超えています", file=sys.stderr)
+        failed = True
+
+    if args.save:
+        data = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        print(f"saved {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        slower = compare(results, baseline, args.tolerance, args.floor)
+        for key, before, now in slower:
+            print(f"SLOWER {key}: {before * 1000:.3f} ms -> {now * 1000:.3f} ms", file=sys.stderr)
+        failed = failed or bool(slower)
+    else:
+        print(f"{args.baseline} がないので比較しません（--save で作成）", file=sys.stderr)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+"""
+複数ページの章をまとめてYAMLにする
+
+章の JSON は次の形。基本設定とキャラクター一覧は全ページで共有し、省略した設定は既定値で埋める。
+    {"chapter": {"language": ..., "character_infos": [...], "pages": [{"panels": [...]}, ...]}}
+
+出力は2種類あり、1回の呼び出しでどちらか、または両方を書ける。
+    まとめ出力   ヘッダーとキャラクター一覧を1回だけ書き、その下に pages のリストを並べた1つの文書
+    ページ別出力 ページごとの comic_page のファイル（画面で作るYAMLと同じ形）
+
+ページのパネル部分はプロセスプールで並列に作る。ヘッダーは全ページ共通なので親プロセスで1回だけ作る。
+
+使い方:
+    python chapter.py chapter.json --combined chapter.yaml
+    python chapter.py chapter.json -o out_dir -j 4
+    python chapter.py chapter.json --combined chapter.yaml -o out_dir
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from prompt_core import header_text, iter_panel_chunks
+from prompt_parser import chapter_from_dict
+
+
+def load_chapter(path):
+    """
+    章の JSON ファイルを読み込んで Chapter を返す
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return chapter_from_dict(data["chapter"])
+
+
+def _indent(text, spaces):
+    # 空行には空白を入れない
+    pad = " " * spaces
+    return "\n".join([pad + l if l else l for l in text.split("\n")])
+
+
+def _render_page(task):
+    """
+    ワーカープロセスで1ページ分のパネル部分を作る
+    per_page なら comic_page の形のまま、combined ならまとめ出力用に字下げしたものも返す
+    """
+    index, panels, per_page, combined = task
+    text = "".join(iter_panel_chunks(panels))
+    # pages の要素の中では panels が2段深くなる
+    return index, text if per_page else None, _indent(text, 4) if combined else None
+
+
+def iter_rendered_pages(chapter, per_page=True, combined=True, workers=None, chunksize=4):
+    """
+    (ページ番号, comic_page のパネル部分, まとめ出力用のパネル部分) をページ順に返す
+    workers が2以上ならプロセスプールで並列に作る
+    """
+    tasks = [(i, panels, per_page, combined) for i, panels in enumerate(chapter.pages)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        yield from map(_render_page, tasks)
+        return
+    with Pool(workers) as pool:
+        # imap は入力順を保つので、ページ順がずれない
+        yield from pool.imap(_render_page, tasks, chunksize)
+
+
+def combined_header(chapter):
+    """
+    まとめ出力の先頭（chapter のヘッダーとキャラクター一覧、pages のキー）
+    """
+    return header_text(chapter, with_panels=False, root="chapter") + ("\n  pages :" if chapter.pages else "\n  pages : []")
+
+
+def combined_page(index, combined_text):
+    """
+    まとめ出力の pages の要素1つ分（combined_text は iter_rendered_pages の3番目）
+    """
+    return f"\n    - page : {index + 1}" + (("\n      panels :" + combined_text) if combined_text else "\n      panels : []")
+
+
+def iter_combined(chapter, workers=1):
+    """
+    まとめ出力を先頭からページ単位の文字列で返す（つなげると write_chapter の combined と同じ）
+    """
+    yield combined_header(chapter)
+    for index, _, combined_text in iter_rendered_pages(chapter, False, True, workers):
+        yield combined_page(index, combined_text)
+    yield "\n"
+
+
+def write_chapter(chapter, combined=None, out_dir=None, workers=None):
+    """
+    章を書き出す。combined はまとめ出力のファイル（- で標準出力）、
+    out_dir はページ別出力のディレクトリ（page_001.yaml, page_002.yaml, ...）
+    書き出したページ数を返す
+    """
+    if combined is None and out_dir is None:
+        raise ValueError("combined か out_dir のどちらかを指定してください")
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    # ヘッダーは全ページ共通なので1回だけ作る
+    page_header = header_text(chapter)
+    page_header_empty = header_text(chapter, with_panels=False)
+
+    if combined == "-":
+        out = sys.stdout
+    elif combined:
+        out = open(combined, "w", encoding="utf-8")
+    else:
+        out = None
+    count = 0
+    try:
+        if out is not None:
+            out.write(combined_header(chapter))
+        pages = iter_rendered_pages(chapter, out_dir is not None, out is not None, workers)
+        for index, page_text, combined_text in pages:
+            count += 1
+            if out_dir:
+                name = os.path.join(out_dir, f"page_{index + 1:03d}.yaml")
+                with open(name, "w", encoding="utf-8") as f:
+                    f.write((page_header if page_text else page_header_empty) + page_text)
+            if out is not None:
+                out.write(combined_page(index, combined_text))
+        if out is not None:
+            out.write("\n")
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数ページの章の JSON からYAMLプロンプトを生成する")
+    parser.add_argument("input", help="章の JSON ファイル")
+    parser.add_argument("--combined", help="ヘッダーを共有した1つのYAML文書に書き出すファイル (- で標準出力)")
+    parser.add_argument("-o", "--out-dir", help="ページごとのYAMLファイルを書き出すディレクトリ")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="ワーカープロセス数 (既定: CPUコア数)")
+    args = parser.parse_args(argv)
+
+    if not args.combined and not args.out_dir:
+        parser.error("--combined か --out-dir を指定してください")
+
+    chapter = load_chapter(args.input)
+    start = time.perf_counter()
+    count = write_chapter(chapter, args.combined, args.out_dir, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"{count} pages in {elapsed:.2f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
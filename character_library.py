@@ -0,0 +1,205 @@
+"""
+チームで共有するキャラクターライブラリ（キャスト）
+
+casts ディレクトリの JSON ファイル1つが1つのキャスト（よく使う登場キャラクターのまとまり）で、
+ファイル名（拡張子なし）がキャスト名になる。
+    {"label": "いつもの3人", "character_infos": [{"name": "aichan", "base_prompt": "1girl, ..."}, ...]}
+
+サーバー1つにつき CharacterLibrary を1つだけ作り（index.py では st.cache_resource）、
+読み込んだ CharacterInfo を全セッションで共有する。セッションのプロジェクトには同じオブジェクトを
+そのまま入れるので、50人が同じキャストを使っても長い base_prompt はメモリに1つしかない。
+CharacterInfo は書き換えず、変更は project.py の update_char で別のオブジェクトに置き換えるので、
+あるセッションで直したキャラクターだけがそのセッションのコピーになる（コピーオンライト）。
+画面で手入力したキャラクターも、ライブラリに同じ名前・同じ内容のものがあればそれを使う (intern)。
+
+キャストのファイルはプリセットと同じく、使うときに読み、更新時刻か大きさが変わったら読み直す。
+
+memory_report は、ライブラリにつないだ (attach) セッションごとに、共有のキャラクターを除いた
+履歴 (History) のおおよそのバイト数を出す。
+
+使い方:
+    library = CharacterLibrary()
+    cast = library.get("school")                  # CharacterInfo のタプル（書き換えないこと）
+    library.save("school", project.characters)    # 今のキャラクターをキャストとして保存する
+    char = library.intern(CharacterInfo(name, prompt))
+"""
+
+import json
+import os
+import sys
+import threading
+import weakref
+from collections import deque
+
+from models import CharacterInfo
+
+CAST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "casts")
+
+# deep_size で中をたどらないもの（クラス・関数・モジュールはセッションのデータではない）
+_ATOMIC = (str, bytes, int, float, bool, type(None))
+
+
+def deep_size(obj, seen=None):
+    """
+    obj からたどれるオブジェクトの sys.getsizeof の合計（おおよそのメモリ量）
+    seen に入っている id のオブジェクトは数えない（共有しているものを除くときに使う）
+    seen には数えたオブジェクトの id が足される
+    """
+    if seen is None:
+        seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, _ATOMIC):
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif isinstance(o, type) or callable(o):
+            continue
+        else:
+            for cls in type(o).__mro__:
+                for name in cls.__dict__.get("__slots__", ()):
+                    if name != "__weakref__" and hasattr(o, name):
+                        stack.append(getattr(o, name))
+            if hasattr(o, "__dict__"):
+                stack.append(vars(o))
+    return total
+
+
+def _check_name(name):
+    if not name or name.startswith(".") or "/" in name or "\\" in name:
+        raise ValueError(f"invalid cast name: {name!r}")
+
+
+class CharacterLibrary:
+    """
+    キャストを必要になったときに読み込んで、全セッションで共有する
+    Streamlit のセッションは別々のスレッドで動くので、中の表は lock で守る
+    """
+
+    def __init__(self, directory=CAST_DIR):
+        self.directory = directory
+        self.loads = 0
+        # キャスト名 -> ((更新時刻, 大きさ), CharacterInfo のタプル)
+        self._loaded = {}
+        # (name, base_prompt) -> 共有している CharacterInfo
+        self._shared = {}
+        self._sessions = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".json")
+
+    def names(self):
+        """
+        キャスト名の一覧。ファイルの中身は読まない
+        """
+        try:
+            return sorted(e.name[:-5] for e in os.scandir(self.directory)
+                          if e.name.endswith(".json") and e.is_file())
+        except FileNotFoundError:
+            return []
+
+    def get(self, name):
+        """
+        キャストの CharacterInfo のタプルを返す。ファイルが変わっていれば読み直す
+        ファイルがない名前は KeyError、読めないファイルは ValueError
+        """
+        _check_name(name)
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._loaded.pop(name, None)
+            raise KeyError(name) from None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._loaded.get(name)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"cast {name}: {e}") from None
+        try:
+            chars = [CharacterInfo.from_dict(c) for c in data["character_infos"]]
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"cast {name}: bad character_infos ({type(e).__name__}: {e})") from None
+        with self._lock:
+            cast = tuple([self._share(c) for c in chars])
+            self._loaded[name] = (stamp, cast)
+            self.loads += 1
+        return cast
+
+    def _share(self, char):
+        # lock の中で呼ぶ
+        key = (char.name, char.base_prompt)
+        shared = self._shared.get(key)
+        if shared is None:
+            shared = self._shared[key] = char
+        return shared
+
+    def save(self, name, characters, label=None):
+        """
+        characters をキャスト name として保存する（同じ名前のキャストは置き換える）
+        保存したキャラクターは以後、共有のオブジェクトになる
+        """
+        _check_name(name)
+        os.makedirs(self.directory, exist_ok=True)
+        data = {"label": label or name, "character_infos": [c.to_dict() for c in characters]}
+        path = self._path(name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        # 書き終わってから置き換えるので、読み込み中のセッションが途中までのファイルを読むことはない
+        os.replace(tmp_path, path)
+        return self.get(name)
+
+    def intern(self, char):
+        """
+        ライブラリに同じ名前・同じ内容のキャラクターがあればそれを、なければ char を返す
+        （ライブラリにないキャラクターは覚えない。キャストに入っているものだけを共有する）
+        """
+        return self._shared.get((char.name, char.base_prompt), char)
+
+    def is_shared(self, char):
+        return self._shared.get((char.name, char.base_prompt)) is char
+
+    def attach(self, history):
+        """
+        memory_report に出すセッションの履歴を登録する（弱参照なので、セッションが終われば消える）
+        """
+        with self._lock:
+            self._sessions.add(history)
+
+    def memory_report(self):
+        """
+        ライブラリと、つないでいる各セッションのおおよそのメモリ量の辞書のリスト
+            [{"what": "library", "characters": ..., "bytes": ...},
+             {"what": "session 1", "characters": ..., "shared": ..., "bytes": ...}, ...]
+        セッションの bytes は共有のキャラクターを除いた履歴全体（元に戻す履歴も含む）
+        """
+        with self._lock:
+            shared = list(self._shared.values())
+            sessions = list(self._sessions)
+        shared_ids = set()
+        rows = [{"what": "library", "characters": len(shared), "shared": len(shared),
+                 "bytes": deep_size(shared, shared_ids)}]
+        for i, history in enumerate(sessions, 1):
+            chars = history.current.characters
+            rows.append({
+                "what": f"session {i}",
+                "characters": len(chars),
+                "shared": sum(1 for c in chars if self.is_shared(c)),
+                "bytes": deep_size(history, set(shared_ids)),
+            })
+        return rows
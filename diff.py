@@ -0,0 +1,325 @@
+"""
+2つの版（Page または Project）の差分と、古い版を新しい版にするパッチ
+
+パネルとキャラクターは内容 (Panel.content_key など) を SequenceMatcher で並べて対応を取り、
+対応したパネル同士は項目ごと（characters[0].lines[1].text など）に比べる。
+Project 同士なら変更していない部分は同じオブジェクトを共有している (project.py) ので、
+両方の版にある同じオブジェクトは内容を比べずに id で対応させる。
+
+パッチは project.py の操作のリスト。履歴や journal と同じ形なので、
+Project.apply で当てることも、保存済みプロジェクトの journal に追記することもできる。
+パネルの番号は並び順から振るので比べない。Page の基本設定の違いは差分には出るが、パッチには入らない。
+
+使い方:
+    python diff.py old.yaml new.yaml                       # 差分を表示
+    python diff.py old.yaml new.yaml --patch patch.json    # パッチも書き出す
+    python diff.py project:第1話 new.yaml --patch p.json   # 保存済みプロジェクトと比べる
+    python diff.py --apply patch.json --project 第1話      # 保存済みプロジェクトにパッチを当てる
+"""
+
+import argparse
+import json
+import sys
+import time
+from difflib import SequenceMatcher
+
+from models import Page
+from project import Project
+from project_store import ProjectStore, op_from_json, op_to_json
+from prompt_parser import iter_pages
+
+PATCH_FORMAT = 1
+# Page 同士のときに比べる基本設定
+HEADER_FIELDS = ("language", "style", "writing_mode", "color_mode", "aspect_ratio",
+                 "instructions", "layout_constraints")
+
+
+def _parts(state):
+    # Page と Project のどちらからでも (キャラクター一覧, パネル一覧) を取り出す
+    if isinstance(state, Page):
+        return state.character_infos, state.panels
+    return state.characters, state.panels
+
+
+def _char_key(char):
+    return (char.name, char.base_prompt)
+
+
+def _panel_key(panel):
+    return panel.content_key()
+
+
+def _align(old, new, key):
+    """
+    old / new のリストの対応を SequenceMatcher の opcodes の形で返す
+    先頭と末尾の同じオブジェクトは除いてから比べる
+    """
+    n_old, n_new = len(old), len(new)
+    head = 0
+    while head < n_old and head < n_new and old[head] is new[head]:
+        head += 1
+    tail = 0
+    while tail < n_old - head and tail < n_new - head and old[n_old - 1 - tail] is new[n_new - 1 - tail]:
+        tail += 1
+
+    old_mid = old[head:n_old - tail]
+    new_mid = new[head:n_new - tail]
+    # 両方の版にある同じオブジェクトは変更していないので、中身を見ずに id で比べる
+    shared = {id(x) for x in old_mid}.intersection([id(x) for x in new_mid])
+    a = [id(x) if id(x) in shared else key(x) for x in old_mid]
+    b = [id(x) if id(x) in shared else key(x) for x in new_mid]
+    opcodes = []
+    if head:
+        opcodes.append(("equal", 0, head, 0, head))
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        opcodes.append((tag, head + i1, head + i2, head + j1, head + j2))
+    if tail:
+        opcodes.append(("equal", n_old - tail, n_old, n_new - tail, n_new))
+    return opcodes
+
+
+def _fields(a, b, path, out):
+    """
+    a と b の違う項目を (項目のパス, 古い値, 新しい値) として out に足す
+    リストで片方にしかない要素は、もう片方の値を None にする
+    """
+    if a is b:
+        return
+    slots = getattr(type(a), "__slots__", None)
+    if slots and type(a) is type(b):
+        for f in slots:
+            if f == "number":
+                continue
+            _fields(getattr(a, f), getattr(b, f), f"{path}.{f}" if path else f, out)
+    elif isinstance(a, list) and isinstance(b, list):
+        for i in range(min(len(a), len(b))):
+            _fields(a[i], b[i], f"{path}[{i}]", out)
+        for i in range(len(b), len(a)):
+            out.append((f"{path}[{i}]", a[i], None))
+        for i in range(len(a), len(b)):
+            out.append((f"{path}[{i}]", None, b[i]))
+    elif a != b:
+        out.append((path, a, b))
+
+
+def _diff_list(kind, old, new, opcodes, key):
+    """
+    1種類（panel / character）の差分を作る
+    消えたものと増えたもので内容が同じものを先に moved として対応させ、
+    残りを replace の範囲の中で前から順に changed として対応させる
+    """
+    blocks = [op for op in opcodes if op[0] != "equal"]
+    gone = {}
+    for _, i1, i2, _, _ in blocks:
+        for i in range(i1, i2):
+            gone.setdefault(key(old[i]), []).append(i)
+    moved_old = set()
+    moved_new = {}
+    for _, _, _, j1, j2 in blocks:
+        for j in range(j1, j2):
+            same = gone.get(key(new[j]))
+            if same:
+                i = same.pop(0)
+                moved_old.add(i)
+                moved_new[j] = i
+
+    changes = []
+    for tag, i1, i2, j1, j2 in blocks:
+        olds = [i for i in range(i1, i2) if i not in moved_old]
+        news = [j for j in range(j1, j2) if j not in moved_new]
+        paired = min(len(olds), len(news))
+        for i, j in zip(olds, news):
+            fields = []
+            _fields(old[i], new[j], "", fields)
+            changes.append({"type": kind, "change": "changed", "old": i, "new": j, "fields": fields})
+        for i in olds[paired:]:
+            changes.append({"type": kind, "change": "removed", "old": i})
+        for j in range(j1, j2):
+            if j in moved_new:
+                changes.append({"type": kind, "change": "moved", "old": moved_new[j], "new": j})
+        for j in news[paired:]:
+            changes.append({"type": kind, "change": "added", "new": j})
+    return changes
+
+
+def diff(old, new):
+    """
+    old から new への変更の辞書のリスト
+        {"type": "header", "change": "changed", "fields": [...]}              （Page 同士のみ）
+        {"type": "character" / "panel", "change": "changed", "old": i, "new": j, "fields": [(パス, 古い値, 新しい値), ...]}
+        {"type": ..., "change": "added", "new": j}
+        {"type": ..., "change": "removed", "old": i}
+        {"type": ..., "change": "moved", "old": i, "new": j}
+    i / j は 0 始まりの位置
+    """
+    changes = []
+    if isinstance(old, Page) and isinstance(new, Page):
+        fields = [(f, getattr(old, f), getattr(new, f)) for f in HEADER_FIELDS if getattr(old, f) != getattr(new, f)]
+        if fields:
+            changes.append({"type": "header", "change": "changed", "fields": fields})
+    old_chars, old_panels = _parts(old)
+    new_chars, new_panels = _parts(new)
+    old_chars, new_chars = list(old_chars), list(new_chars)
+    old_panels, new_panels = list(old_panels), list(new_panels)
+    changes.extend(_diff_list("character", old_chars, new_chars,
+                              _align(old_chars, new_chars, _char_key), _char_key))
+    changes.extend(_diff_list("panel", old_panels, new_panels,
+                              _align(old_panels, new_panels, _panel_key), _panel_key))
+    return changes
+
+
+def make_patch(old, new):
+    """
+    old を new にする操作のリスト（project.py の形）
+    後ろの変更から順に並べるので、前の位置がずれずにそのまま当てられる
+    """
+    old_chars, old_panels = _parts(old)
+    new_chars, new_panels = _parts(new)
+    old_chars, new_chars = list(old_chars), list(new_chars)
+    old_panels, new_panels = list(old_panels), list(new_panels)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in reversed(_align(old_panels, new_panels, _panel_key)):
+        if tag == "equal":
+            continue
+        paired = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+        if i1 + paired < i2:
+            ops.append({"op": "del_panels", "indices": list(range(i1 + paired, i2))})
+        if j1 + paired < j2:
+            start = i1 + paired
+            ops.append({"op": "restore_panels", "indices": list(range(start, start + j2 - j1 - paired)),
+                        "panels": new_panels[j1 + paired:j2]})
+        for t in range(paired):
+            ops.append({"op": "update_panel", "index": i1 + t, "panel": new_panels[j1 + t]})
+
+    for tag, i1, i2, j1, j2 in reversed(_align(old_chars, new_chars, _char_key)):
+        if tag == "equal":
+            continue
+        paired = min(i2 - i1, j2 - j1) if tag == "replace" else 0
+        for i in reversed(range(i1 + paired, i2)):
+            ops.append({"op": "del_char", "index": i})
+        for t, j in enumerate(range(j1 + paired, j2)):
+            ops.append({"op": "insert_char", "index": i1 + paired + t, "char": new_chars[j]})
+        for t in range(paired):
+            ops.append({"op": "update_char", "index": i1 + t, "char": new_chars[j1 + t]})
+    return ops
+
+
+def apply_patch(project, ops):
+    """
+    パッチを当てた新しい Project を返す
+    """
+    for op in ops:
+        project = project.apply(op)
+    return project
+
+
+def apply_patch_to_store(store, ops):
+    """
+    保存済みプロジェクトにパッチを当てる（操作ごとに journal に追記するので、書くのはパッチの分だけ）
+    """
+    project = store.load()
+    for op in ops:
+        project = project.apply(op)
+        store.append(op, project)
+    return project
+
+
+def save_patch(ops, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"format": PATCH_FORMAT, "ops": [op_to_json(op) for op in ops]}, f, ensure_ascii=False)
+
+
+def load_patch(path):
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("format") != PATCH_FORMAT:
+        raise ValueError(f"unsupported patch format: {data.get('format')}")
+    return [op_from_json(op) for op in data["ops"]]
+
+
+# --- 表示 ---
+def _show(value):
+    if value is None:
+        return "(なし)"
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def format_diff(changes):
+    """
+    diff の結果を人が読む文字列にする（番号は 1 始まり）
+    """
+    lines = []
+    for c in changes:
+        kind, change = c["type"], c["change"]
+        if kind == "header":
+            name = "基本設定"
+        else:
+            name = f"{kind} {c['new' if 'new' in c else 'old'] + 1}"
+        if change == "changed":
+            lines.append(f"~ {name}")
+            for path, a, b in c["fields"]:
+                lines.append(f"    {path}: {_show(a)} -> {_show(b)}")
+        elif change == "added":
+            lines.append(f"+ {name}")
+        elif change == "removed":
+            lines.append(f"- {name}")
+        elif change == "moved":
+            lines.append(f"> {name} (元 {c['old'] + 1} から移動)")
+    return "\n".join(lines)
+
+
+def _load_state(spec):
+    """
+    「project:名前」なら保存済みプロジェクト、それ以外はYAMLファイルの1ページ目
+    """
+    if spec.startswith("project:"):
+        return ProjectStore(spec[len("project:"):]).load()
+    with open(spec, encoding="utf-8") as f:
+        for page in iter_pages(f):
+            return page
+    raise ValueError(f"{spec}: comic_page がありません")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="2つの版の差分を表示し、パッチを作る・当てる")
+    parser.add_argument("old", nargs="?", help="古い版 (YAMLファイル または project:名前)")
+    parser.add_argument("new", nargs="?", help="新しい版 (YAMLファイル または project:名前)")
+    parser.add_argument("--patch", help="old を new にするパッチを書き出すファイル")
+    parser.add_argument("--apply", help="当てるパッチのファイル（--project と一緒に使う）")
+    parser.add_argument("--project", help="パッチを当てる保存済みプロジェクト名")
+    args = parser.parse_args(argv)
+
+    if args.apply:
+        if not args.project:
+            parser.error("--apply には --project が必要です")
+        ops = load_patch(args.apply)
+        project = apply_patch_to_store(ProjectStore(args.project), ops)
+        print(f"{len(ops)} ops applied to {args.project} "
+              f"({len(project.characters)} characters, {len(project.panels)} panels)", file=sys.stderr)
+        return 0
+    if not args.old or not args.new:
+        parser.error("old と new を指定してください")
+
+    old, new = _load_state(args.old), _load_state(args.new)
+    # 保存済みプロジェクトと Page を比べるときは、Page の方もキャラクターとパネルだけにする
+    if isinstance(old, Page) != isinstance(new, Page):
+        old, new = [Project(*_parts(x)) for x in (old, new)]
+    start = time.perf_counter()
+    changes = diff(old, new)
+    elapsed = time.perf_counter() - start
+    text = format_diff(changes)
+    if text:
+        print(text)
+    print(f"{len(changes)} changes in {elapsed * 1000:.1f} ms", file=sys.stderr)
+    if args.patch:
+        ops = make_patch(old, new)
+        save_patch(ops, args.patch)
+        print(f"wrote {len(ops)} ops to {args.patch}", file=sys.stderr)
+    return 1 if changes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
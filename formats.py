@@ -0,0 +1,285 @@
+"""
+1ページを中間表現にしてから、いろいろな形式で書き出す
+
+compile_page がページを1回だけたどって、平らな中間表現（タプルのリスト）を作る。
+各形式の書き出し (BACKENDS) は中間表現だけを見るので、新しい形式を足すときに
+ページをたどる処理をもう1つ書かなくてよい。
+
+    yaml     make_yaml_text と同じYAML（1バイトも違わない）
+    compact  make_yaml_text(..., compact=True) と同じコンパクト出力
+    json     {"comic_page": {...}}（YAMLを読み込んだ結果と同じ形。空の character_infos / panels も書く）
+    ndjson   パネル1つを1行のJSONにしたもの（パネルごとに処理したいツール用）
+
+中間表現 (CompiledPage.items) の1項目は (種類, 深さ, リストの要素の最初の項目か, キー, 値)。
+    STR    "..." で書く値          NUM    数値（number）
+    BLOCK  |- の長文ブロック        LIST   リストの始まり（値は要素の数。0 なら空のリスト）
+    ITEM_END  リストの要素の終わり（キーはリストのキー）  LIST_END  リストの終わり
+    MAP    comic_page の始まり      MAP_END  その終わり
+深さは字下げの段（comic_page が 0、その中のキーが 1、パネルのキーが 2 ...）で、
+実際に何文字下げるかは形式ごとに決める。
+
+画面やサーバーの YAML は、パネルの断片を覚えておける make_yaml_text をそのまま使う。
+このモジュールは1回の呼び出しで複数の形式がほしいときと、YAML以外の形式に使う。
+
+使い方:
+    texts = render(page, ("yaml", "json", "ndjson"))   # ページをたどるのは1回だけ
+    texts["json"]
+"""
+
+import json
+
+from prompt_core import as_panel, page_and_panels
+
+STR = 0
+NUM = 1
+BLOCK = 2
+LIST = 3
+ITEM_END = 4
+LIST_END = 5
+MAP = 6
+MAP_END = 7
+
+FORMATS = ("yaml", "compact", "json", "ndjson")
+CONTENT_TYPES = {
+    "yaml": "application/yaml; charset=utf-8",
+    "compact": "application/yaml; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+    "ndjson": "application/x-ndjson; charset=utf-8",
+}
+
+
+class CompiledPage:
+    """
+    compile_page の結果。items が中間表現のリストで、for で回すと items を順に返す
+    JSON と NDJSON の両方を作るときに同じ変換をしないよう、辞書に戻した結果と
+    パネルごとのJSON文字列は最初に必要になったときに作って覚えておく
+    """
+    __slots__ = ("items", "_tree", "_panel_json")
+
+    def __init__(self, items):
+        self.items = items
+        self._tree = None
+        self._panel_json = None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def tree(self):
+        if self._tree is None:
+            self._tree = to_tree(self.items)
+        return self._tree
+
+    def panel_json(self):
+        if self._panel_json is None:
+            self._panel_json = [json.dumps(p, ensure_ascii=False) for p in self.tree()["comic_page"]["panels"]]
+        return self._panel_json
+
+
+def compile_page(data):
+    """
+    Page か output_data の辞書を中間表現 (CompiledPage) にする
+    """
+    page, panels = page_and_panels(data)
+    ir = [
+        (MAP, 0, False, "comic_page", None),
+        (STR, 1, False, "language", page.language),
+        (STR, 1, False, "style", page.style),
+        (STR, 1, False, "writing-mode", page.writing_mode),
+        (STR, 1, False, "color_mode", page.color_mode),
+        (STR, 1, False, "aspect_ratio", page.aspect_ratio),
+        (BLOCK, 1, False, "instructions", page.instructions),
+        (BLOCK, 1, False, "layout_constraints", page.layout_constraints),
+        (LIST, 1, False, "character_infos", len(page.character_infos)),
+    ]
+    add = ir.append
+    for char in page.character_infos:
+        add((STR, 2, True, "name", char.name))
+        add((STR, 2, False, "base_prompt", char.base_prompt))
+        add((ITEM_END, 2, False, "character_infos", None))
+    add((LIST_END, 1, False, "character_infos", None))
+
+    add((LIST, 1, False, "panels", len(panels)))
+    for position, panel in enumerate(panels, 1):
+        if isinstance(panel, dict):
+            number = panel.get("number", position)
+            panel = as_panel(panel)
+        else:
+            number = panel.number if panel.number is not None else position
+        _compile_panel(panel, number, add)
+        add((ITEM_END, 2, False, "panels", None))
+    add((LIST_END, 1, False, "panels", None))
+    add((MAP_END, 0, False, "comic_page", None))
+    return CompiledPage(ir)
+
+
+def _compile_panel(panel, number, add):
+    add((NUM, 2, True, "number", number))
+    add((STR, 2, False, "page_position", panel.page_position))
+    add((STR, 2, False, "background", panel.background))
+    add((STR, 2, False, "description", panel.description))
+
+    add((LIST, 2, False, "objects", len(panel.objects)))
+    for obj_name in panel.objects:
+        add((STR, 3, True, "name", obj_name))
+        add((ITEM_END, 3, False, "objects", None))
+    add((LIST_END, 2, False, "objects", None))
+
+    add((LIST, 2, False, "characters", len(panel.characters)))
+    for p_char in panel.characters:
+        add((STR, 3, True, "name", p_char.name))
+        add((STR, 3, False, "panel_position", p_char.panel_position))
+        add((STR, 3, False, "emotion", p_char.emotion))
+        add((STR, 3, False, "facing", p_char.facing))
+        add((STR, 3, False, "shot", p_char.shot))
+        add((STR, 3, False, "pose", p_char.pose))
+        add((LIST, 3, False, "lines", len(p_char.lines)))
+        for line in p_char.lines:
+            add((STR, 4, True, "text", line.text))
+            add((STR, 4, False, "char_text_position", line.char_text_position))
+            add((STR, 4, False, "type", line.type))
+            add((ITEM_END, 4, False, "lines", None))
+        add((LIST_END, 3, False, "lines", None))
+        add((ITEM_END, 3, False, "characters", None))
+    add((LIST_END, 2, False, "characters", None))
+
+    # effects は今のところ常に空で出力する (make_yaml_text と同じ)
+    add((LIST, 2, False, "effects", 0))
+    add((LIST_END, 2, False, "effects", None))
+
+    add((LIST, 2, False, "monologues", len(panel.monologues)))
+    for mono in panel.monologues:
+        add((STR, 3, True, "text", mono.text))
+        add((STR, 3, False, "text_position", mono.text_position))
+        add((STR, 3, False, "balloon_shape", mono.balloon_shape))
+        add((ITEM_END, 3, False, "monologues", None))
+    add((LIST_END, 2, False, "monologues", None))
+
+    add((STR, 2, False, "camera_angle", panel.camera_angle))
+
+
+# --- YAML ---
+class _YamlStyle:
+    """
+    YAMLの書き方の違い（深さごとの字下げ、「:」の前の空白、空のリストと空行の扱い）
+    """
+
+    def __init__(self, columns, sep, block_step, empty_list, omit_empty, spaced):
+        # 深さ -> キーの前の字下げ、リストの要素の最初のキーの前（「- 」まで）
+        self.indent = [" " * c for c in columns]
+        self.first = [" " * (c - 2) + "- " if c >= 2 else "" for c in columns]
+        self.block = [" " * (c + block_step) for c in columns]
+        self.sep = sep
+        # 空のリストの書き方（None なら書かない）と、空でも書かないリスト
+        self.empty_list = empty_list
+        self.omit_empty = omit_empty
+        # 要素のあとに空行を入れるリスト
+        self.spaced = spaced
+
+
+YAML_STYLE = _YamlStyle((0, 2, 6, 8, 10), " :", 2, "[]", frozenset(("character_infos", "panels")),
+                        frozenset(("character_infos", "panels")))
+COMPACT_STYLE = _YamlStyle((0, 1, 3, 5, 7), ":", 1, None, frozenset(), frozenset())
+
+
+def _emit_yaml(ir, style):
+    indent = style.indent
+    first = style.first
+    sep = style.sep
+    lines = []
+    add = lines.append
+    for op, depth, is_first, key, value in ir:
+        prefix = first[depth] if is_first else indent[depth]
+        if op == STR:
+            add(f'{prefix}{key}{sep} "{value}"')
+        elif op == LIST:
+            if value:
+                add(f"{prefix}{key}{sep}")
+            elif style.empty_list is not None and key not in style.omit_empty:
+                add(f"{prefix}{key}{sep} {style.empty_list}")
+        elif op == ITEM_END:
+            if key in style.spaced:
+                add("")
+        elif op == NUM:
+            add(f"{prefix}{key}{sep} {value}")
+        elif op == BLOCK:
+            add(f"{prefix}{key}{sep} |-")
+            body = style.block[depth]
+            lines.extend([body + l for l in value.split("\n")])
+        elif op == MAP:
+            add(f"{prefix}{key}{sep}")
+    return "\n".join(lines)
+
+
+def emit_yaml(ir):
+    return _emit_yaml(ir, YAML_STYLE)
+
+
+def emit_compact(ir):
+    return _emit_yaml(ir, COMPACT_STYLE)
+
+
+# --- JSON ---
+def to_tree(ir):
+    """
+    中間表現を辞書とリストに戻す（{"comic_page": {...}}）
+    """
+    root = {}
+    stack = [root]
+    for op, depth, is_first, key, value in ir:
+        if is_first:
+            # リストの要素の始まり
+            item = {}
+            stack[-1].append(item)
+            stack.append(item)
+        top = stack[-1]
+        if op == STR or op == NUM or op == BLOCK:
+            top[key] = value
+        elif op == ITEM_END or op == LIST_END or op == MAP_END:
+            stack.pop()
+        elif op == LIST:
+            top[key] = []
+            stack.append(top[key])
+        elif op == MAP:
+            top[key] = {}
+            stack.append(top[key])
+    return root
+
+
+def emit_json(compiled):
+    """
+    json.dumps(compiled.tree(), ensure_ascii=False) と同じ文字列
+    パネルの部分は NDJSON と同じパネルごとの文字列をつなげて作る
+    """
+    page = dict(compiled.tree()["comic_page"], panels=[])
+    # panels は comic_page の最後のキーなので、末尾の「[]}}」にパネルを入れる
+    text = json.dumps({"comic_page": page}, ensure_ascii=False)
+    return text[:-4] + "[" + ", ".join(compiled.panel_json()) + "]}}"
+
+
+def emit_ndjson(compiled):
+    return "".join([p + "\n" for p in compiled.panel_json()])
+
+
+# 形式名 -> CompiledPage を受け取って文字列を返す関数
+BACKENDS = {
+    "yaml": emit_yaml,
+    "compact": emit_compact,
+    "json": emit_json,
+    "ndjson": emit_ndjson,
+}
+
+
+def render(data, formats=("yaml",)):
+    """
+    formats のそれぞれの形式の文字列を {形式名: 文字列} で返す
+    ページをたどって中間表現を作るのは、形式がいくつあっても1回だけ
+    知らない形式名は ValueError
+    """
+    unknown = [f for f in formats if f not in BACKENDS]
+    if unknown:
+        raise ValueError(f"unknown format: {', '.join(unknown)} (choose from {', '.join(BACKENDS)})")
+    ir = compile_page(data)
+    return {f: BACKENDS[f](ir) for f in formats}
@@ -0,0 +1,76 @@
+"""
+元に戻す／やり直すの履歴
+
+ステップごとに変更前の Project をそのまま覚えておく。Project は変更できず、
+変わっていない部分は前後で共有されている (project.py) ので、1ステップで増えるメモリは
+パネル数ではなく変更の大きさで決まる。
+"""
+
+from collections import deque
+
+from project import Project
+
+
+class History:
+    """
+    current が今の Project
+    depth ステップより古い履歴は捨てる
+    """
+
+    def __init__(self, project=None, depth=100):
+        self.current = project if project is not None else Project()
+        # (変更前の Project, 操作, 元に戻す操作)
+        self._undo = deque(maxlen=depth)
+        # (変更後の Project, 操作, 元に戻す操作)
+        self._redo = []
+
+    @property
+    def depth(self):
+        return self._undo.maxlen
+
+    def set_depth(self, depth):
+        """
+        覚えておくステップ数を変える（減らしたときは古いものから捨てる）
+        """
+        if depth != self._undo.maxlen:
+            self._undo = deque(self._undo, maxlen=depth)
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def apply(self, op):
+        """
+        操作を適用して履歴に積む。やり直しの履歴は消える
+        """
+        inverse = self.current.inverse(op)
+        new = self.current.apply(op)
+        self._undo.append((self.current, op, inverse))
+        self._redo.clear()
+        self.current = new
+        return new
+
+    def undo(self):
+        """
+        1つ前の状態に戻し、戻すのに相当する操作を返す（journal に書くため）
+        戻せなければ None
+        """
+        if not self._undo:
+            return None
+        before, op, inverse = self._undo.pop()
+        self._redo.append((self.current, op, inverse))
+        self.current = before
+        return inverse
+
+    def redo(self):
+        """
+        元に戻した操作をやり直し、その操作を返す。やり直せなければ None
+        """
+        if not self._redo:
+            return None
+        after, op, inverse = self._redo.pop()
+        self._undo.append((self.current, op, inverse))
+        self.current = after
+        return op
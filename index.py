@@ -1,18 +1,63 @@
+import csv
+import functools
+import io
+from collections import deque
+
 import streamlit as st
 
+from models import CharacterInfo, Line, Monologue, Panel, PanelCharacter
+from character_library import CharacterLibrary
+from diff import diff, format_diff
+from formats import CONTENT_TYPES, render
+from history import History
+from project import Project
+from project_store import ProjectStore, list_projects
+from script_import import ScriptImporter
+from search import SearchIndex
+from presets import DEFAULT_PRESET, PresetLibrary
+from prompt_core import (
+    AnchorTable,
+    PanelCache,
+    estimate_tokens,
+    make_yaml_text,
+    size_report,
+)
+from prompt_parser import ParseError, iter_pages
+from timing import Timings, profile_result, setup_logging, start_profile
+from validate import Validator, format_issue, has_errors
+
 # ページ設定
 st.set_page_config(page_title="Manga Prompt Generator", layout="wide")
 
+# --- 処理時間の記録 ---
+# 区間ごとの時間は timing.py の Timings に記録する（サイドバー下の「デバッグ」で表示）
+setup_logging()
+if "timing_recent" not in st.session_state:
+    # フラグメントだけの再実行も含めた最近の記録
+    st.session_state.timing_recent = deque(maxlen=200)
+timings = Timings(st.session_state.timing_recent)
+st.session_state.timings = timings
+# 「1回の再実行をプロファイルする」を押したときは、この再実行全体を cProfile で測る
+# st.rerun() で最後まで行かずに終わった再実行のプロファイルは、ここで止める
+stale = st.session_state.pop("profiler", None)
+if stale is not None:
+    stale.disable()
+profiler = start_profile() if st.session_state.pop("profile_next", False) else None
+st.session_state.profiler = profiler
+
 st.title("漫画用のyamlプロンプト作成補助ツールVer.1")
 st.markdown("nanobananaの漫画プロンプトをyamlで作るとき、コードが長くて一つ一つ目で見ていくのが大変だったからフォーム化してみたよ。")
 st.markdown("Pythonの勉強はじめたばかりだから細かい部分は大目に見てね。")
 st.markdown("＜使い方＞")
 st.markdown("画面左の★基礎設定で希望のものを選択→①キャラクター登録→② パネル(コマ)作成→③ プロンプト生成　の順で入力")
 # --- セッション状態の初期化 ---
-if "character_infos" not in st.session_state:
-    st.session_state.character_infos = []
-if "panels" not in st.session_state:
-    st.session_state.panels = []
+# キャラクター・パネルは models.py のレコードで持つ（保存するときは to_dict で辞書に戻す）
+# 今の状態は history.current（project.py の Project）で、変更はすべて edit_project から行う
+if "history" not in st.session_state:
+    st.session_state.history = History()
+if "panel_cache" not in st.session_state:
+    # 変更のないパネルは前回のYAML断片を使い回す
+    st.session_state.panel_cache = PanelCache()
 
 # --- サイドバー：基礎設定 ---
 st.sidebar.header("★基礎設定")
@@ -32,160 +77,192 @@ color_mode_val = st.sidebar.radio(
     horizontal=True
 )
 
-# 固定設定（表示のみ）
+# プリセット（style・writing-mode・aspect_ratio・長文ブロック）
+@st.cache_resource
+def preset_library():
+    # 全セッションで1つを共有する（読み込んだプリセットはファイルが変わるまで使い回す）
+    return PresetLibrary()
+
+
+def get_preset(name, where=st.sidebar):
+    """
+    プリセットを読み込む。読めなければ where にエラーを表示して既定のプリセットにする
+    （フラグメントの中からはサイドバーに書けないので、where=st で呼ぶ）
+    """
+    library = preset_library()
+    try:
+        return library.get(name)
+    except (KeyError, ValueError) as e:
+        where.error(f"プリセット {name} を読み込めませんでした: {e}")
+        return library.get(DEFAULT_PRESET)
+
+
 st.sidebar.markdown("---")
-st.sidebar.markdown("**固定設定**")
-st.sidebar.info("""
-- Style: japanese syonen manga
-- Writing-mode: vertical-rl
-- Aspect Ratio: 1:1.41
-""")
-
-# 固定テキストブロック
-INSTRUCTIONS_BLOCK = """このYAMLは漫画ページの仕様です。添付の画像データ（キャラクター等、コマ割り画像）がある場合は、
-それらを外見の基準として忠実に反映し、このプロンプトの指示に従ってページを生成してください。"""
-
-LAYOUT_CONSTRAINTS_BLOCK = """指示: 以下のレイアウト制約を厳守して画像を生成してください。
-- ページ全体のアスペクト比は 1:1.4（幅:高さ）を絶対に厳守する。
-- パネルの追加・削除・結合・回転・順序入替えは禁止。
-- 各パネルの内容は必ず枠内に収める。
-- 読み順は panel.number の昇順。
-- writing-mode が vertical-rl の場合、同一パネル内で会話があるときは「先に読ませたいセリフのキャラクターほど右側に配置する」こと。"""
-
-# --- ヘルパー関数: 手動YAML生成 ---
-def make_yaml_text(data_dict):
+st.sidebar.markdown("**プリセット**")
+# 一覧はファイル名だけで作り、中身は選んだプリセットだけ読む
+preset_name = st.sidebar.selectbox("プリセット", preset_library().names(), key="preset_name")
+preset = get_preset(preset_name)
+st.sidebar.info(f"**{preset.label}**\n{preset.summary()}")
+
+# キャラクターライブラリ（キャスト）
+@st.cache_resource
+def character_library():
+    # 全セッションで1つを共有する（同じキャラクターはセッションごとにコピーせず、同じオブジェクトを使う）
+    return CharacterLibrary()
+
+
+def share_characters(project):
     """
-    辞書データをYAML形式の文字列に変換する簡易関数
+    ライブラリにあるキャラクターを共有のオブジェクトに置き換えた Project（なければそのまま）
     """
-    lines = []
-    
-    def add_line(text, indent=0):
-        lines.append("  " * indent + text)
-
-    # comic_page
-    add_line("comic_page :", 0)
-    cp = data_dict["comic_page"]
-    
-    # 基本プロパティ
-    add_line(f'language : "{cp["language"]}"', 1)
-    add_line(f'style : "{cp["style"]}"', 1)
-    add_line(f'writing-mode : "{cp["writing-mode"]}"', 1)
-    add_line(f'color_mode : "{cp["color_mode"]}"', 1)
-    add_line(f'aspect_ratio : "{cp["aspect_ratio"]}"', 1)
-    
-    # 長文ブロック
-    add_line("instructions : |-", 1)
-    for l in cp["instructions"].split("\n"):
-        add_line(l, 2)
-        
-    add_line("layout_constraints : |-", 1)
-    for l in cp["layout_constraints"].split("\n"):
-        add_line(l, 2)
-
-    # Character Infos
-    if cp["character_infos"]:
-        add_line("character_infos :", 1)
-        for char in cp["character_infos"]:
-            add_line(f'- name : "{char["name"]}"', 2)
-            add_line(f'  base_prompt : "{char["base_prompt"]}"', 2)
-            add_line("", 0)
-
-    # Panels
-    if cp["panels"]:
-        add_line("panels :", 1)
-        for panel in cp["panels"]:
-            add_line(f'- number : {panel["number"]}', 2)
-            add_line(f'  page_position : "{panel["page_position"]}"', 2)
-            add_line(f'  background : "{panel["background"]}"', 2)
-            add_line(f'  description : "{panel["description"]}"', 2)
-            
-            # Objects
-            if panel["objects"]:
-                add_line("  objects :", 2)
-                for obj in panel["objects"]:
-                    add_line(f'- name : "{obj["name"]}"', 3)
-            else:
-                add_line("  objects : []", 2)
-
-            # Characters in panel
-            if panel["characters"]:
-                add_line("  characters :", 2)
-                for p_char in panel["characters"]:
-                    # nameが空文字の場合でも出力する
-                    add_line(f'- name : "{p_char["name"]}"', 3)
-                    add_line(f'  panel_position : "{p_char["panel_position"]}"', 3)
-                    add_line(f'  emotion : "{p_char.get("emotion", "")}"', 3)
-                    add_line(f'  facing : "{p_char["facing"]}"', 3)
-                    add_line(f'  shot : "{p_char["shot"]}"', 3)
-                    add_line(f'  pose : "{p_char.get("pose", "")}"', 3)
-                    
-                    # Lines
-                    if p_char["lines"]:
-                        add_line("  lines :", 3)
-                        for line in p_char["lines"]:
-                            add_line(f'- text : "{line["text"]}"', 4)
-                            add_line(f'  char_text_position : "{line["char_text_position"]}"', 4)
-                            add_line(f'  type : "{line["type"]}"', 4)
-                    else:
-                        add_line("  lines : []", 3)
-            else:
-                add_line("  characters : []", 2)
-            
-            # Effects
-            add_line("  effects : []", 2)
-
-            # Monologues
-            if panel["monologues"]:
-                add_line("  monologues :", 2)
-                for mono in panel["monologues"]:
-                    add_line(f'- text : "{mono["text"]}"', 3)
-                    add_line(f'  text_position : "{mono["text_position"]}"', 3)
-                    add_line(f'  balloon_shape : "{mono["balloon_shape"]}"', 3)
-            else:
-                add_line("  monologues : []", 2)
-            
-            add_line(f'  camera_angle : "{panel["camera_angle"]}"', 2)
-            add_line("", 0)
+    library = character_library()
+    chars = [library.intern(c) for c in project.characters]
+    if all(a is b for a, b in zip(chars, project.characters)):
+        return project
+    return Project(chars, project.panels)
 
-    return "\n".join(lines)
 
-# --- メインエリア ---
+# --- プロジェクトの保存・読み込み ---
+st.sidebar.markdown("---")
+st.sidebar.markdown("**プロジェクト**")
+project_name = st.sidebar.text_input("プロジェクト名", key="project_name")
+saved_names = list_projects()
+if saved_names:
+    st.sidebar.caption("保存済み: " + ", ".join(saved_names))
+col_load, col_save = st.sidebar.columns(2)
+if col_load.button("読み込む") and project_name:
+    try:
+        store = ProjectStore(project_name)
+    except ValueError:
+        st.sidebar.error("その名前は使えません")
+    else:
+        if store.exists():
+            st.session_state.history = History(share_characters(store.load()), st.session_state.history.depth)
+            st.session_state.store = store
+            st.sidebar.success(f"{project_name} を読み込みました")
+        else:
+            st.sidebar.error(f"{project_name} は保存されていません")
+if col_save.button("保存") and project_name:
+    try:
+        store = st.session_state.get("store")
+        if store is None or store.name != project_name:
+            store = ProjectStore(project_name)
+        store.save(st.session_state.history.current)
+        st.session_state.store = store
+        st.sidebar.success(f"{project_name} に保存しました（以降の変更は自動で追記されます）")
+    except ValueError:
+        st.sidebar.error("その名前は使えません")
 
-tab1, tab2, tab3 = st.tabs(["① キャラクター登録", "② パネル(コマ)作成", "③ プロンプト生成"])
+# 以前このツールで作ったYAMLからキャラクターとパネルを読み込む
+uploaded = st.sidebar.file_uploader("作成済みのYAMLから読み込む", type=["yaml", "yml"])
+if uploaded is not None and st.sidebar.button("YAMLの内容で置き換える"):
+    try:
+        pages = list(iter_pages(uploaded.getvalue().decode("utf-8").splitlines()))
+    except (ParseError, KeyError, TypeError, UnicodeDecodeError) as e:
+        st.sidebar.error(f"読み込めませんでした: {e}")
+    else:
+        if not pages:
+            st.sidebar.error("comic_page が見つかりませんでした")
+        else:
+            page = pages[0]
+            # 番号は並び順から振り直す
+            for p in page.panels:
+                p.number = None
+            st.session_state.history = History(share_characters(Project(page.character_infos, page.panels)),
+                                               st.session_state.history.depth)
+            # 別の内容になったので、開いていたプロジェクトへの自動追記はやめる（保存し直せば続けられる）
+            st.session_state.store = None
+            st.sidebar.success(f"キャラクター {len(page.character_infos)} 人・パネル {len(page.panels)} 個を読み込みました")
+            if len(pages) > 1:
+                st.sidebar.info(f"{len(pages)} ページのうち1ページ目を読み込みました")
 
-# === タブ1: キャラクター登録 ===
-with tab1:
-    st.header("登場キャラクターの登録")
-    with st.form("add_char_form", clear_on_submit=True):
-        c_name = st.text_input("キャラクター名 (name)", placeholder="例: aichan")
-        st.markdown("※登場させるキャラクターの画像を参照させる場合、画像の名前とこのキャラ名を一致させるとよきです。")
-        c_prompt = st.text_area("外見プロンプト (base_prompt)", placeholder="例: 1girl, solo, she has gold long hair, ...")
-        submitted = st.form_submit_button("キャラクターを追加")
-        if submitted and c_name:
-            st.session_state.character_infos.append({
-                "name": c_name,
-                "base_prompt": c_prompt
-            })
-            st.success(f"{c_name} を追加しました")
 
-    if st.session_state.character_infos:
-        st.markdown("### 登録済みキャラクター")
-        for i, char in enumerate(st.session_state.character_infos):
-            col1, col2 = st.columns([4, 1])
-            with col1:
-                st.text(f"{char['name']} : {char['base_prompt']}")
-            with col2:
-                if st.button("削除", key=f"del_char_{i}"):
-                    st.session_state.character_infos.pop(i)
-                    st.rerun()
+def _journal(op):
+    # プロジェクトを開いていれば、操作を journal に追記する
+    store = st.session_state.get("store")
+    if store is not None:
+        store.append(op, st.session_state.history.current)
 
-# === タブ2: パネル作成 ===
-with tab2:
-    st.header("コマ(Panel)の構成")
-    
+
+def edit_project(op):
+    """
+    キャラクター・パネルの追加／削除を画面のデータに適用する（元に戻せる）
+    """
+    st.session_state.history.apply(op)
+    _journal(op)
+
+
+def get_validator():
+    """
+    今の登録キャラクターに合わせたチェッカー（キャラクターが変わるまで同じものを使い、
+    パネルごとの結果を覚えておく）
+    """
+    characters = st.session_state.history.current.characters
+    validator = st.session_state.get("validator")
+    if validator is None or validator.names != frozenset(c.name for c in characters):
+        validator = st.session_state.validator = Validator(characters)
+    return validator
+
+
+def _clear_panel_selection():
+    # パネル一覧のチェックは位置で覚えているので、並びが変わったら外す
+    st.session_state.selected_panels = set()
+    for key in [k for k in st.session_state if str(k).startswith("sel_panel_")]:
+        del st.session_state[key]
+
+
+def _undo():
+    op = st.session_state.history.undo()
+    if op is not None:
+        _journal(op)
+        _clear_panel_selection()
+
+
+def _redo():
+    op = st.session_state.history.redo()
+    if op is not None:
+        _journal(op)
+        _clear_panel_selection()
+
+
+# --- 元に戻す／やり直す ---
+# フラグメント内の編集ではサイドバーが再実行されないので、ボタンは無効化せず、
+# 押されたときに戻せるものがなければ何もしない
+st.sidebar.markdown("---")
+st.sidebar.markdown("**編集履歴**")
+st.session_state.history.set_depth(
+    st.sidebar.number_input("元に戻せる回数", min_value=1, max_value=1000, value=100, step=10))
+col_undo, col_redo = st.sidebar.columns(2)
+col_undo.button("↩ 元に戻す", on_click=_undo)
+col_redo.button("↪ やり直す", on_click=_redo)
+timings.lap("sidebar")
+
+
+def timed(name):
+    """
+    関数の実行時間を name として記録するデコレーター
+    フラグメントだけの再実行でも測れるように、@st.fragment の内側に付ける
+    """
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            with st.session_state.timings.phase(name):
+                return func(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# --- フラグメント ---
+# ボタンやウィジェットを操作したとき、画面全体ではなくこの関数の中だけを再実行する
+# （パネル数が増えても、1回の操作で作り直す部品の数が増えないようにするため）
+
+@st.fragment
+@timed("panel_builder")
+def panel_builder():
+    """
+    タブ2: 新しいコマの入力欄とキャラ／セリフの追加リスト
+    """
     with st.expander("新しいコマを作成する", expanded=True):
-        p_num = len(st.session_state.panels) + 1
-        
         # --- コマの基本設定 ---
         st.subheader("1. コマの基本設定")
         col_p1, col_p2 = st.columns(2)
@@ -195,24 +272,24 @@ with tab2:
         with col_p2:
             p_cam = st.text_input("カメラアングル", placeholder="例: from side, front", key="new_p_cam")
             p_desc = st.text_input("コマが表してる状況を書いておく", placeholder="例: ナノバナナProが世間を賑わしている", key="new_p_desc")
-        
+
         p_obj_str = st.text_input("登場させたいモノ (カンマ区切り)", placeholder="例: モニター, スマホ, ベッド", key="new_p_obj")
 
         st.markdown("---")
-        
+
         # --- キャラクター・セリフ設定 ---
         st.subheader("2. キャラクターとセリフの追加")
-        
+
         if "temp_panel_chars" not in st.session_state:
             st.session_state.temp_panel_chars = []
 
-        reg_char_names = [c["name"] for c in st.session_state.character_infos]
-        
+        reg_char_names = [c.name for c in st.session_state.history.current.characters]
+
         # 入力フォーム
         with st.container():
             # 話者（キャラクター）選択
             tp_name = st.selectbox("話者選択（空白なら名前なし）", [""] + reg_char_names, key="tp_name")
-            
+
             # --- セリフ設定エリア ---
             col_l1, col_l2 = st.columns([3, 1])
             with col_l1:
@@ -234,123 +311,473 @@ with tab2:
             # --- 追加ボタンエリア ---
             # 【改善点②】追加ボタンを2つに分離
             col_btn1, col_btn2 = st.columns(2)
-            
+
             # ボタンA: キャラとセリフ両方追加
             if col_btn1.button("👤 キャラ＋セリフを追加"):
-                st.session_state.temp_panel_chars.append({
-                    "name": tp_name,
-                    "panel_position": tp_pos,
-                    "shot": tp_shot,
-                    "facing": tp_face,
-                    "pose": "",
-                    "lines": [{"text": tp_line, "char_text_position": tp_text_pos, "type": "speech"}] if tp_line else []
-                })
+                st.session_state.temp_panel_chars.append(PanelCharacter(
+                    name=tp_name,
+                    panel_position=tp_pos,
+                    shot=tp_shot,
+                    facing=tp_face,
+                    lines=[Line(tp_line, tp_text_pos, "speech")] if tp_line else []
+                ))
 
             # ボタンB: セリフのみ追加（吹き出しのみ）
             if col_btn2.button("💬 セリフ(吹き出し)のみ追加"):
                 # 外見データを空文字にして追加
-                st.session_state.temp_panel_chars.append({
-                    "name": tp_name, # 名前は紐づける（誰のセリフか）
-                    "panel_position": "",
-                    "shot": "",
-                    "facing": "",
-                    "pose": "",
-                    "lines": [{"text": tp_line, "char_text_position": tp_text_pos, "type": "speech"}]
-                })
+                st.session_state.temp_panel_chars.append(PanelCharacter(
+                    name=tp_name, # 名前は紐づける（誰のセリフか）
+                    lines=[Line(tp_line, tp_text_pos, "speech")]
+                ))
 
             # --- 追加済みリスト表示 ---
             if st.session_state.temp_panel_chars:
                 st.info("このコマに追加される要素:")
                 for idx, tc in enumerate(st.session_state.temp_panel_chars):
                     # 表示用にわかりやすく整形
-                    disp_name = tc['name'] if tc['name'] else "（名前なし）"
-                    if tc['panel_position']:
+                    disp_name = tc.name if tc.name else "（名前なし）"
+                    if tc.panel_position:
                         type_label = "【キャラ＋セリフ】"
-                        detail = f"{tc['shot']} / {tc['facing']}"
+                        detail = f"{tc.shot} / {tc.facing}"
                     else:
                         type_label = "【吹き出しのみ】"
                         detail = "外見指定なし"
-                    
-                    line_text = tc['lines'][0]['text'] if tc['lines'] else "（セリフなし）"
-                    line_pos = tc['lines'][0]['char_text_position'] if tc['lines'] else "-"
-                    
+
+                    line_text = tc.lines[0].text if tc.lines else "（セリフなし）"
+                    line_pos = tc.lines[0].char_text_position if tc.lines else "-"
+
                     st.text(f"{idx+1}. {type_label} {disp_name}: 「{line_text}」 (位置:{line_pos})")
-                
+
                 if st.button("追加リストをクリア"):
                     st.session_state.temp_panel_chars = []
+                    st.rerun(scope="fragment")
 
         st.markdown("---")
-        
+
         # --- モノローグ ---
         st.subheader("3. その他 (モノローグ)")
         p_mono = st.text_input("モノローグ内容", placeholder="例: 彼女の旅は続くのであった", key="new_p_mono")
-        
+
+        n_panels = len(st.session_state.history.current.panels)
+        if (st.session_state.get("new_p_before") or 0) > n_panels:
+            st.session_state.new_p_before = None
+        p_before = st.number_input("このパネル番号の前に挿入（空なら最後に追加）", min_value=1,
+                                   max_value=max(n_panels, 1), value=None, step=1, key="new_p_before")
+
         # --- 決定ボタン ---
         if st.button("この内容でコマを確定・追加", type="primary"):
-            objects_list = [{"name": x.strip()} for x in p_obj_str.split(",")] if p_obj_str else []
+            if p_before is not None and p_before <= n_panels:
+                p_num = p_before
+            else:
+                p_num = n_panels + 1
+            objects_list = [x.strip() for x in p_obj_str.split(",")] if p_obj_str else []
             monologues_list = []
             if p_mono:
-                monologues_list.append({
-                    "text": p_mono,
-                    "text_position": "top-left",
-                    "balloon_shape": "長方形"
-                })
-
-            new_panel = {
-                "number": p_num,
-                "page_position": p_pos,
-                "background": p_bg,
-                "description": p_desc,
-                "objects": objects_list,
-                "characters": st.session_state.temp_panel_chars, # リストをそのままコピー
-                "effects": [],
-                "monologues": monologues_list,
-                "camera_angle": p_cam
-            }
-            
-            st.session_state.panels.append(new_panel)
+                monologues_list.append(Monologue(p_mono, "top-left", "長方形"))
+
+            # number は出力するときに並び順から振る
+            new_panel = Panel(
+                page_position=p_pos,
+                background=p_bg,
+                description=p_desc,
+                objects=objects_list,
+                characters=st.session_state.temp_panel_chars, # リストをそのままコピー
+                monologues=monologues_list,
+                camera_angle=p_cam
+            )
+
+            if p_num <= n_panels:
+                _edit_panels({"op": "insert_panel", "index": p_num - 1, "panel": new_panel})
+            else:
+                edit_project({"op": "add_panel", "panel": new_panel})
             st.session_state.temp_panel_chars = [] # リセット
             st.success(f"Panel {p_num} を追加しました！")
+            # パネル一覧も更新するため、ここだけは画面全体を再実行する
             st.rerun()
 
-    # 登録済みパネル一覧
+
+def _open_panel(num):
+    """
+    パネル番号 num があるページを開き、詳細も開く
+    """
+    panels = st.session_state.history.current.panels
+    if num is None or num > len(panels):
+        return
+    st.session_state.list_page = (num - 1) // st.session_state.list_page_size + 1
+    st.session_state.open_panels.add(id(panels[num - 1]))
+
+
+# 検索結果を表示する最大件数
+SEARCH_LIMIT = 50
+
+
+def _jump_to_panel():
+    # 「パネル番号へ移動」が変わったとき
+    _open_panel(st.session_state.list_jump)
+
+
+def _toggle_panel_selected(i):
+    selected = st.session_state.selected_panels
+    if st.session_state[f"sel_panel_{i}"]:
+        selected.add(i)
+    else:
+        selected.discard(i)
+
+
+def _edit_panels(op):
+    """
+    パネルの並びを変える操作を適用する（範囲の指定が正しくなければエラーを表示する）
+    """
+    try:
+        edit_project(op)
+    except (IndexError, ValueError) as e:
+        st.session_state.bulk_error = str(e)
+        return
+    _clear_panel_selection()
+
+
+def _toggle_panel_detail(panel):
+    opened = st.session_state.open_panels
+    if id(panel) in opened:
+        opened.discard(id(panel))
+    else:
+        opened.add(id(panel))
+
+
+@st.fragment
+@timed("panel_list")
+def panel_list():
+    """
+    タブ2: 作成済みパネル一覧
+    ページ送りで表示中のパネルだけ部品を作り、詳細は「詳細」を押したパネルだけ作る
+    """
     st.markdown("### 作成済みパネル一覧")
-    for i, p in enumerate(st.session_state.panels):
-        with st.expander(f"Panel {p['number']}: {p['description']}"):
-            st.text(f"位置: {p['page_position']}")
-            st.text(f"背景: {p['background']}")
-            # キャラ内容の簡易表示
-            if p['characters']:
-                st.caption("含まれるキャラ/セリフ:")
-                for c in p['characters']:
-                    l = c['lines'][0]['text'] if c['lines'] else ""
-                    st.text(f"- {c['name']}: {l}")
-            
-            if st.button("このパネルを削除", key=f"del_panel_{i}"):
-                st.session_state.panels.pop(i)
-                for idx, panel in enumerate(st.session_state.panels):
-                    panel['number'] = idx + 1
-                st.rerun()
+    panels = st.session_state.history.current.panels
+    if not panels:
+        return
+    if "open_panels" not in st.session_state:
+        # 詳細を開いているパネル (id で持つので、削除で番号がずれても開いたまま)
+        st.session_state.open_panels = set()
+    if "selected_panels" not in st.session_state:
+        # チェックを入れたパネルの位置 (0始まり)
+        st.session_state.selected_panels = set()
 
-# === タブ3: 生成 ===
-with tab3:
+    # --- まとめて編集 ---
+    with st.expander("まとめて編集（選択削除・範囲の移動／複製）"):
+        selected = st.session_state.selected_panels
+        if st.button(f"チェックしたパネルを削除 ({len(selected)}件)", disabled=not selected):
+            _edit_panels({"op": "del_panels", "indices": sorted(selected)})
+            st.rerun(scope="fragment")
+        # 削除でパネル数が減ったときは上限に合わせる
+        for key, top in (("bulk_start", len(panels)), ("bulk_end", len(panels)), ("bulk_to", len(panels) + 1)):
+            if st.session_state.get(key, 1) > top:
+                st.session_state[key] = top
+        col_r1, col_r2, col_r3 = st.columns(3)
+        r_start = col_r1.number_input("範囲の最初の番号", min_value=1, max_value=len(panels), step=1, key="bulk_start")
+        r_end = col_r2.number_input("範囲の最後の番号", min_value=1, max_value=len(panels), step=1, key="bulk_end")
+        r_to = col_r3.number_input("移動先（この番号の前へ。最後なら 全数+1）", min_value=1,
+                                   max_value=len(panels) + 1, step=1, key="bulk_to")
+        col_b1, col_b2 = st.columns(2)
+        if r_start > r_end:
+            st.warning("範囲の最初の番号は最後の番号以下にしてください")
+        else:
+            if col_b1.button("範囲を移動"):
+                _edit_panels({"op": "move_panels", "start": r_start - 1, "stop": r_end, "to": r_to - 1})
+                st.rerun(scope="fragment")
+            if col_b2.button("範囲を複製（すぐ後ろに入れる）"):
+                _edit_panels({"op": "dup_panels", "start": r_start - 1, "stop": r_end})
+                st.rerun(scope="fragment")
+        if st.session_state.get("bulk_error"):
+            st.error(f"できませんでした: {st.session_state.pop('bulk_error')}")
+
+    # --- チェック ---
+    # 直したパネルだけ調べ直すので、毎回全体を調べても軽い
+    issues_by_panel = {}
+    for issue in get_validator().check_panels(panels):
+        issues_by_panel.setdefault(issue["panel"], []).append(issue)
+    if issues_by_panel:
+        n_errors = sum(has_errors(v) for v in issues_by_panel.values())
+        st.caption(f"問題のあるパネル: {len(issues_by_panel)}個（うち YAML が壊れるもの {n_errors}個）。"
+                   "番号の横の ❌ / ⚠ のパネルは「詳細」で確認できます")
+
+    # --- 検索 ---
+    query = st.text_input("パネルを検索（セリフ・状況・背景・モノローグ・キャラ名。空白区切りで全部含むもの）",
+                          key="panel_search")
+    if query:
+        if "search_index" not in st.session_state:
+            # 登録済みのパネルは覚えておき、増えた・消えたパネルの分だけ更新する
+            st.session_state.search_index = SearchIndex()
+        index = st.session_state.search_index
+        index.sync(panels)
+        hits = index.search(query, limit=SEARCH_LIMIT)
+        if not hits:
+            st.caption("見つかりませんでした")
+        else:
+            st.caption(f"{len(hits)}件" + ("以上（先頭のみ表示）" if len(hits) >= SEARCH_LIMIT else "")
+                       + "。押すとそのパネルを開きます")
+            for position, _, field, text in hits:
+                st.button(f"Panel {position + 1} ・ {field}: {text}", key=f"search_hit_{position}",
+                          on_click=_open_panel, args=(position + 1,))
+
+    col_s1, col_s2, col_s3 = st.columns(3)
+    with col_s1:
+        page_size = st.selectbox("1ページの表示数", [10, 20, 50, 100], key="list_page_size")
+    n_pages = (len(panels) + page_size - 1) // page_size
+    # 削除でページ数が減ったときは最後のページに合わせる
+    if st.session_state.get("list_page", 1) > n_pages:
+        st.session_state.list_page = n_pages
+    with col_s2:
+        page = st.number_input(f"ページ (全{n_pages}ページ)", min_value=1, max_value=n_pages, step=1, key="list_page")
+    with col_s3:
+        st.number_input("パネル番号へ移動", min_value=1, max_value=len(panels), value=None, step=1,
+                        key="list_jump", on_change=_jump_to_panel)
+
+    start = (page - 1) * page_size
+    for i, p in enumerate(panels[start:start + page_size], start):
+        col_c, col_t, col_d, col_x = st.columns([1, 6, 1, 1])
+        if f"sel_panel_{i}" not in st.session_state:
+            # 別のページを見ているあいだに消えたチェックボックスの状態を戻す
+            st.session_state[f"sel_panel_{i}"] = i in st.session_state.selected_panels
+        col_c.checkbox("選択", key=f"sel_panel_{i}", on_change=_toggle_panel_selected, args=(i,),
+                       label_visibility="collapsed")
+        row_issues = issues_by_panel.get(i + 1)
+        mark = "" if not row_issues else (" ❌" if has_errors(row_issues) else " ⚠")
+        col_t.markdown(f"**Panel {i + 1}**{mark}: {p.description}")
+        col_d.button("詳細", key=f"detail_panel_{i}", on_click=_toggle_panel_detail, args=(p,))
+        if col_x.button("削除", key=f"del_panel_{i}"):
+            st.session_state.open_panels.discard(id(p))
+            _edit_panels({"op": "del_panel", "index": i})
+            st.rerun(scope="fragment")
+
+        if id(p) in st.session_state.open_panels:
+            with st.container(border=True):
+                for issue in row_issues or []:
+                    (st.error if issue["level"] == "error" else st.warning)(f"{issue['field']}: {issue['message']}")
+                st.text(f"位置: {p.page_position}")
+                st.text(f"背景: {p.background}")
+                # キャラ内容の簡易表示
+                if p.characters:
+                    st.caption("含まれるキャラ/セリフ:")
+                    for c in p.characters:
+                        l = c.lines[0].text if c.lines else ""
+                        st.text(f"- {c.name}: {l}")
+
+
+@st.fragment
+@timed("script_importer")
+def script_importer(writing_mode):
+    """
+    台本（テキスト / CSV）からパネルをまとめて追加する（1回の「元に戻す」で全部取り消せる）
+    """
+    with st.expander("台本から読み込む（セリフをまとめて追加）"):
+        # 追加したあとは画面全体を再実行するので、結果のメッセージは session_state に残して次の実行で出す
+        result = st.session_state.pop("script_import_result", None)
+        if result is not None:
+            st.success(result["message"])
+            if result["unknown"]:
+                st.warning("登録されていない話者: " + result["unknown"])
+        st.caption("「# 説明」か「---」の行でパネルを区切り、「aichan: セリフ」「aichan「セリフ」」をセリフ、"
+                   "「（…）」をモノローグ、それ以外の行を description にします。"
+                   "CSV は panel / speaker / text の列です。")
+        script = st.file_uploader("台本", type=["txt", "csv"], key="script_file")
+        if script is None or not st.button("台本のパネルを追加する"):
+            return
+        project = st.session_state.history.current
+        importer = ScriptImporter(project.characters, writing_mode)
+        # アップロードされたファイルも1行ずつ読む（全体を文字列にしない）
+        f = io.TextIOWrapper(script, encoding="utf-8", newline="")
+        try:
+            panels = list(importer.iter_panels(f, csv_format=script.name.lower().endswith(".csv")))
+        except (UnicodeDecodeError, csv.Error) as e:
+            st.error(f"読み込めませんでした: {e}")
+            return
+        finally:
+            # TextIOWrapper が閉じられるときにアップロードされたファイルまで閉じないようにする
+            f.detach()
+        if not panels:
+            st.warning("パネルが見つかりませんでした")
+            return
+        start = len(project.panels)
+        edit_project({"op": "restore_panels", "indices": list(range(start, start + len(panels))), "panels": panels})
+        st.session_state.script_import_result = {
+            "message": f"{importer.lines_read} 行からパネル {len(panels)} 個を追加しました",
+            "unknown": ", ".join(f"{name} ({count}回)" for name, count
+                                 in sorted(importer.unknown.items(), key=lambda item: -item[1])),
+        }
+        # パネル一覧やチェックの表示も更新するため、panel_builder と同じく画面全体を再実行する
+        st.rerun()
+
+
+@st.fragment
+@timed("generation_tab")
+def generation_tab(language_val, color_mode_val, preset_name):
+    """
+    タブ3: YAMLの生成と表示
+    サイドバーの設定は画面全体の再実行で変わるので、引数で受け取る
+    """
     st.header("プロンプト生成結果")
-    
+    use_dedup = st.checkbox("同じ長い文字列は2回目からアンカー(*)で参照する", value=False)
+    use_compact = st.checkbox("コンパクト出力（空のリスト・余分な空白・空行を省いて文字数を減らす）", value=False)
+
     if st.button("YAMLを生成する"):
-        output_data = {
-            "comic_page": {
-                "language": language_val,
-                "style": "japanese syonen manga",
-                "writing-mode": "vertical-rl",
-                "color_mode": color_mode_val,
-                "aspect_ratio": "1:1.41",
-                "instructions": INSTRUCTIONS_BLOCK,
-                "layout_constraints": LAYOUT_CONSTRAINTS_BLOCK,
-                "character_infos": st.session_state.character_infos,
-                "panels": st.session_state.panels
-            }
-        }
-        
-        yaml_str = make_yaml_text(output_data)
-        st.code(yaml_str, language="yaml")
+        project = st.session_state.history.current
+        # 生成のたびに取り直すので、プリセットのファイルを直せば次の生成から反映される
+        output_data = get_preset(preset_name, st).page(language_val, color_mode_val, project.characters, project.panels)
+
+        timings = st.session_state.timings
+        with timings.phase("validate") as info:
+            issues = get_validator().check_page(output_data)
+            info["size"] = len(issues)
+        if issues:
+            with st.expander(f"チェックで見つかった問題 ({len(issues)}件)", expanded=has_errors(issues)):
+                if has_errors(issues):
+                    st.error("error のある項目はYAMLが正しく読めなくなります。直してから使ってください。")
+                st.text("\n".join(format_issue(i) for i in issues))
+
+        anchors = AnchorTable() if use_dedup else None
+        with timings.phase("make_yaml_text") as info:
+            yaml_str = make_yaml_text(output_data, st.session_state.panel_cache, anchors, use_compact)
+            info["size"] = len(yaml_str)
+        with timings.phase("st.code") as info:
+            st.code(yaml_str, language="yaml")
+            info["size"] = len(yaml_str)
+        if anchors is not None:
+            st.caption(f"アンカーで {anchors.saved} バイト省略しました")
         st.info("右上のコピーボタンからコピーして使用してください。")
+
+        # --- JSON での出力 ---
+        # ページをたどるのは1回だけで、JSON と NDJSON（パネル1つを1行）の両方を作る
+        with timings.phase("formats") as info:
+            others = render(output_data, ("json", "ndjson"))
+            info["size"] = len(others["json"])
+        col_json, col_ndjson = st.columns(2)
+        with col_json:
+            st.download_button("JSON をダウンロード", others["json"], file_name="comic_page.json",
+                               mime=CONTENT_TYPES["json"])
+        with col_ndjson:
+            st.download_button("NDJSON（パネルごと）をダウンロード", others["ndjson"], file_name="panels.ndjson",
+                               mime=CONTENT_TYPES["ndjson"])
+
+        # --- サイズ ---
+        # 画像生成モデルの料金は入力の長さで決まるので、どこが長いかを見られるようにする
+        st.caption(f"サイズ: {len(yaml_str.encode()):,} バイト / 推定 約 {estimate_tokens(yaml_str):,} トークン")
+        with st.expander("セクション別のサイズ" + ("（アンカーで省略する前）" if anchors is not None else "")):
+            with timings.phase("size_report"):
+                report = size_report(output_data, use_compact)
+            st.dataframe(report, use_container_width=True)
+
+        # --- 前回の生成からの変更 ---
+        # Project は変更できず共有されているので、前回の Project をそのまま取っておくだけでよい
+        last = st.session_state.get("last_generated")
+        if last is not None:
+            with timings.phase("diff") as info:
+                changes = diff(last, project)
+                info["size"] = len(changes)
+            with st.expander(f"前回の生成からの変更 ({len(changes)}件)"):
+                st.text(format_diff(changes) or "変更はありません")
+        st.session_state.last_generated = project
+
+
+# --- メインエリア ---
+
+tab1, tab2, tab3 = st.tabs(["① キャラクター登録", "② パネル(コマ)作成", "③ プロンプト生成"])
+
+# === タブ1: キャラクター登録 ===
+with tab1:
+    st.header("登場キャラクターの登録")
+    with st.form("add_char_form", clear_on_submit=True):
+        c_name = st.text_input("キャラクター名 (name)", placeholder="例: aichan")
+        st.markdown("※登場させるキャラクターの画像を参照させる場合、画像の名前とこのキャラ名を一致させるとよきです。")
+        c_prompt = st.text_area("外見プロンプト (base_prompt)", placeholder="例: 1girl, solo, she has gold long hair, ...")
+        submitted = st.form_submit_button("キャラクターを追加")
+        if submitted and c_name:
+            edit_project({"op": "add_char", "char": character_library().intern(CharacterInfo(c_name, c_prompt))})
+            st.success(f"{c_name} を追加しました")
+
+    # --- キャラクターライブラリ ---
+    # チームでよく使うキャラクターをキャストとして保存しておき、毎回登録し直さずに追加する
+    with st.expander("キャラクターライブラリ（チームで共有）"):
+        library = character_library()
+        cast_names = library.names()
+        if cast_names:
+            cast_name = st.selectbox("キャスト", cast_names, key="cast_name")
+            if st.button("このキャストのキャラクターを追加"):
+                try:
+                    cast = library.get(cast_name)
+                except (KeyError, ValueError) as e:
+                    st.error(f"キャスト {cast_name} を読み込めませんでした: {e}")
+                else:
+                    registered = {c.name for c in st.session_state.history.current.characters}
+                    added = [c for c in cast if c.name not in registered]
+                    # 共有のオブジェクトをそのまま入れる（編集したときだけ、このセッションの分が別になる）
+                    for char in added:
+                        edit_project({"op": "add_char", "char": char})
+                    st.success(f"{len(added)} 人を追加しました（登録済みの名前は飛ばしました）")
+        else:
+            st.caption("まだキャストがありません。下で今のキャラクターを保存できます。")
+        new_cast = st.text_input("キャスト名", placeholder="例: school", key="new_cast_name")
+        if st.button("今のキャラクターをキャストとして保存") and new_cast:
+            characters = st.session_state.history.current.characters
+            if not characters:
+                st.error("登録済みのキャラクターがありません")
+            else:
+                try:
+                    library.save(new_cast, characters)
+                except ValueError:
+                    st.error("その名前は使えません")
+                else:
+                    st.success(f"キャスト {new_cast} に {len(characters)} 人を保存しました")
+
+    characters = st.session_state.history.current.characters
+    if characters:
+        st.markdown("### 登録済みキャラクター")
+        for i, char in enumerate(characters):
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                st.text(f"{char.name} : {char.base_prompt}")
+            with col2:
+                if st.button("削除", key=f"del_char_{i}"):
+                    edit_project({"op": "del_char", "index": i})
+                    st.rerun()
+timings.lap("tab1")
+
+# === タブ2: パネル作成 ===
+with tab2:
+    st.header("コマ(Panel)の構成")
+    script_importer(preset.writing_mode)
+    panel_builder()
+    panel_list()
+
+# === タブ3: 生成 ===
+with tab3:
+    generation_tab(language_val, color_mode_val, preset_name)
+
+
+# --- デバッグ: 処理時間とプロファイル ---
+def _profile_next():
+    st.session_state.profile_next = True
+
+
+character_library().attach(st.session_state.history)
+timings.finish()
+if st.session_state.pop("profiler", None) is not None:
+    profiler.disable()
+    st.session_state.profile_data = profile_result(profiler)
+
+st.sidebar.markdown("---")
+if st.sidebar.checkbox("デバッグ（処理時間を表示）", key="debug_timing"):
+    st.sidebar.caption(f"この再実行: {timings.total * 1000:.1f} ms")
+    st.sidebar.dataframe(timings.rows(), use_container_width=True)
+    with st.sidebar.expander("最近の記録（フラグメントだけの再実行も含む）"):
+        st.dataframe(list(reversed(st.session_state.timing_recent)), use_container_width=True)
+    st.sidebar.button("1回の再実行をプロファイルする", on_click=_profile_next)
+    if "profile_data" in st.session_state:
+        data, text = st.session_state.profile_data
+        st.sidebar.download_button("プロファイル (.prof) をダウンロード", data, file_name="rerun.prof")
+        with st.sidebar.expander("プロファイルの上位（累積時間順）"):
+            st.text(text)
+    # 全セッションの履歴をたどるので、押したときだけ測る
+    if st.sidebar.button("メモリを測る（セッションごと）"):
+        report = character_library().memory_report()
+        st.sidebar.caption("session の bytes は共有のキャラクターを除いた、元に戻す履歴を含む量（おおよそ）")
+        st.sidebar.dataframe(report, use_container_width=True)
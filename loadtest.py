@@ -0,0 +1,162 @@
+"""
+server.py の負荷テスト
+
+クライアントごとに keep-alive の接続を1本持ち、決めた時間のあいだ POST /page（--chapter なら /chapter）を
+送り続けて、応答時間の p50 / p90 / p99 と 1秒あたりのリクエスト数を表示する。
+送るページは bench.py の架空のプロジェクト（乱数のシードを固定しているので毎回同じ内容）。
+
+--url を指定しなければ、空いているポートでサーバーを別プロセスとして起動してから測る。
+
+使い方:
+    python loadtest.py                          # 100 クライアント × 10秒、20パネルのページ
+    python loadtest.py -c 100 -d 30 --panels 100 --compact
+    python loadtest.py --url http://127.0.0.1:8765 --chapter
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import sys
+import time
+from multiprocessing import Event, Process
+from urllib.parse import urlsplit
+
+from tests.conftest import make_project
+import server
+
+# 応答の内容が違うページの種類（クライアントはこの中から順に使う）
+PAYLOAD_VARIANTS = 10
+
+
+def make_payloads(n_panels, chapter=False):
+    """
+    送る本文のリスト
+    """
+    payloads = []
+    for seed in range(PAYLOAD_VARIANTS):
+        page = make_project(n_panels, seed=seed).to_dict()
+        if chapter:
+            panels = page.pop("panels")
+            page["pages"] = [{"panels": panels[i:i + 5]} for i in range(0, len(panels), 5)]
+            data = {"chapter": page}
+        else:
+            data = {"comic_page": page}
+        payloads.append(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    return payloads
+
+
+async def _read_response(reader):
+    """
+    応答を1つ読んで (ステータス, 本文のバイト数) を返す
+    """
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        length = int(headers["content-length"])
+        await reader.readexactly(length)
+        return status, length
+    size = 0
+    while True:
+        chunk = int((await reader.readline()).strip(), 16)
+        await reader.readexactly(chunk + 2)
+        if chunk == 0:
+            return status, size
+        size += chunk
+
+
+async def _client(host, port, path, payloads, offset, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    heads = [(f"POST {path} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+              f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body for body in payloads]
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(heads[i % len(heads)])
+            status, _ = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, p):
+    """
+    並べ替え済みのリストの p パーセンタイル（nearest-rank）
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+
+async def run_load(host, port, path, payloads, clients, duration):
+    """
+    (応答時間のリスト, エラーのステータスのリスト, 経過秒数)
+    """
+    latencies = []
+    errors = []
+    start = time.perf_counter()
+    await asyncio.gather(*[_client(host, port, path, payloads, i, start + duration, latencies, errors)
+                           for i in range(clients)])
+    return latencies, errors, time.perf_counter() - start
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="server.py の負荷テスト（p50/p99 と req/s）")
+    parser.add_argument("--url", help="測るサーバー (省略時はサーバーを起動する)")
+    parser.add_argument("-c", "--clients", type=int, default=100, help="同時クライアント数 (既定: 100)")
+    parser.add_argument("-d", "--duration", type=float, default=10, help="測る秒数 (既定: 10)")
+    parser.add_argument("--panels", type=int, default=20, help="1リクエストのパネル数 (既定: 20)")
+    parser.add_argument("--compact", action="store_true", help="コンパクト出力を頼む")
+    parser.add_argument("--chapter", action="store_true", help="/chapter に5パネルずつのページの章を送る")
+    args = parser.parse_args(argv)
+
+    proc = None
+    if args.url:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        host, port = "127.0.0.1", _free_port()
+        ready = Event()
+        proc = Process(target=server.run, args=(host, port, False, ready), daemon=True)
+        proc.start()
+        if not ready.wait(30):
+            print("サーバーが起動しませんでした", file=sys.stderr)
+            return 1
+
+    path = "/chapter" if args.chapter else "/page" + ("?compact=1" if args.compact else "")
+    payloads = make_payloads(args.panels, args.chapter)
+    try:
+        latencies, errors, elapsed = asyncio.run(
+            run_load(host, port, path, payloads, args.clients, args.duration))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.join()
+
+    latencies.sort()
+    print(f"{len(latencies)} requests from {args.clients} clients in {elapsed:.1f}s "
+          f"({len(latencies) / elapsed:.0f} req/s), {len(errors)} errors")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.1f} ms / p90 {percentile(latencies, 90) * 1000:.1f} ms / "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms / max {latencies[-1] * 1000 if latencies else 0:.1f} ms")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,8 @@
 import streamlit as st
 
+from presets import DEFAULT_PRESET, PresetLibrary
+from prompt_core import PanelCache, make_yaml_text
+
 # ページ設定
 st.set_page_config(page_title="Manga Prompt Generator", layout="wide")
 
@@ -11,6 +14,9 @@ if "character_infos" not in st.session_state:
     st.session_state.character_infos = []
 if "panels" not in st.session_state:
     st.session_state.panels = []
+if "panel_cache" not in st.session_state:
+    # 変更のないパネルは前回のYAML断片を使い回す
+    st.session_state.panel_cache = PanelCache()
 
 # --- サイドバー：基礎設定 ---
 st.sidebar.header("1. 基礎設定")
@@ -30,122 +36,20 @@ color_mode_val = st.sidebar.radio(
     horizontal=True
 )
 
-# 固定設定（表示のみ）
-st.sidebar.markdown("---")
-st.sidebar.markdown("**固定設定**")
-st.sidebar.info("""
-- Style: japanese syonen manga
-- Writing-mode: vertical-rl
-- Aspect Ratio: 1:1.41
-""")
-
-# 固定テキストブロック
-INSTRUCTIONS_BLOCK = """このYAMLは漫画ページの仕様です。添付の画像データ（キャラクター等、コマ割り画像）がある場合は、
-それらを外見の基準として忠実に反映し、このプロンプトの指示に従ってページを生成してください。"""
-
-LAYOUT_CONSTRAINTS_BLOCK = """指示: 以下のレイアウト制約を厳守して画像を生成してください。
-- ページ全体のアスペクト比は 1:1.4（幅:高さ）を絶対に厳守する。
-- パネルの追加・削除・結合・回転・順序入替えは禁止。
-- 各パネルの内容は必ず枠内に収める。
-- 読み順は panel.number の昇順。
-- writing-mode が vertical-rl の場合、同一パネル内で会話があるときは「先に読ませたいセリフのキャラクターほど右側に配置する」こと。"""
-
-# --- ヘルパー関数: 手動YAML生成 ---
-def make_yaml_text(data_dict):
-    """
-    辞書データをYAML形式の文字列に変換する簡易関数
-    PyYAMLを使わずに整形を行う
-    """
-    lines = []
-    
-    def add_line(text, indent=0):
-        lines.append("  " * indent + text)
-
-    # comic_page
-    add_line("comic_page :", 0)
-    cp = data_dict["comic_page"]
-    
-    # 基本プロパティ
-    add_line(f'language : "{cp["language"]}"', 1)
-    add_line(f'style : "{cp["style"]}"', 1)
-    add_line(f'writing-mode : "{cp["writing-mode"]}"', 1)
-    add_line(f'color_mode : "{cp["color_mode"]}"', 1)
-    add_line(f'aspect_ratio : "{cp["aspect_ratio"]}"', 1)
-    
-    # 長文ブロック (Block Style)
-    add_line("instructions : |-", 1)
-    for l in cp["instructions"].split("\n"):
-        add_line(l, 2)
-        
-    add_line("layout_constraints : |-", 1)
-    for l in cp["layout_constraints"].split("\n"):
-        add_line(l, 2)
-
-    # Character Infos
-    if cp["character_infos"]:
-        add_line("character_infos :", 1)
-        for char in cp["character_infos"]:
-            add_line(f'- name : "{char["name"]}"', 2)
-            add_line(f'  base_prompt : "{char["base_prompt"]}"', 2)
-            add_line("", 0) # 空行
+# プリセット（style・writing-mode・aspect_ratio・長文ブロック）
+@st.cache_resource
+def preset_library():
+    return PresetLibrary()
 
-    # Panels
-    if cp["panels"]:
-        add_line("panels :", 1)
-        for panel in cp["panels"]:
-            add_line(f'- number : {panel["number"]}', 2)
-            add_line(f'  page_position : "{panel["page_position"]}"', 2)
-            add_line(f'  background : "{panel["background"]}"', 2)
-            add_line(f'  description : "{panel["description"]}"', 2)
-            
-            # Objects
-            if panel["objects"]:
-                add_line("  objects :", 2)
-                for obj in panel["objects"]:
-                    add_line(f'- name : "{obj["name"]}"', 3)
-            else:
-                add_line("  objects : []", 2)
 
-            # Characters in panel
-            if panel["characters"]:
-                add_line("  characters :", 2)
-                for p_char in panel["characters"]:
-                    add_line(f'- name : "{p_char["name"]}"', 3)
-                    add_line(f'  panel_position : "{p_char["panel_position"]}"', 3)
-                    add_line(f'  emotion : "{p_char.get("emotion", "")}"', 3) # 安全に取得
-                    add_line(f'  facing : "{p_char["facing"]}"', 3)
-                    add_line(f'  shot : "{p_char["shot"]}"', 3)
-                    add_line(f'  pose : "{p_char.get("pose", "")}"', 3)
-                    
-                    # Lines
-                    if p_char["lines"]:
-                        add_line("  lines :", 3)
-                        for line in p_char["lines"]:
-                            add_line(f'- text : "{line["text"]}"', 4)
-                            add_line(f'  char_text_position : "{line["char_text_position"]}"', 4)
-                            add_line(f'  type : "{line["type"]}"', 4)
-                    else:
-                        add_line("  lines : []", 3)
-            else:
-                add_line("  characters : []", 2)
-            
-            # Effects
-            add_line("  effects : []", 2)
-
-            # Monologues
-            if panel["monologues"]:
-                add_line("  monologues :", 2)
-                for mono in panel["monologues"]:
-                    add_line(f'- text : "{mono["text"]}"', 3)
-                    add_line(f'  text_position : "{mono["text_position"]}"', 3)
-                    add_line(f'  balloon_shape : "{mono["balloon_shape"]}"', 3)
-            else:
-                add_line("  monologues : []", 2)
-            
-            add_line(f'  camera_angle : "{panel["camera_angle"]}"', 2)
-            add_line("", 0) # パネル区切りの空行
-
-    return "\n".join(lines)
+st.sidebar.markdown("---")
+preset_name = st.sidebar.selectbox("プリセット", preset_library().names())
+try:
+    preset = preset_library().get(preset_name)
+except (KeyError, ValueError) as e:
+    st.sidebar.error(f"プリセット {preset_name} を読み込めませんでした: {e}")
+    preset = preset_library().get(DEFAULT_PRESET)
+st.sidebar.info(f"**{preset.label}**\n{preset.summary()}")
 
 # --- メインエリア ---
 
@@ -293,19 +197,19 @@ with tab3:
         output_data = {
             "comic_page": {
                 "language": language_val,
-                "style": "japanese syonen manga",
-                "writing-mode": "vertical-rl",
+                "style": preset.style,
+                "writing-mode": preset.writing_mode,
                 "color_mode": color_mode_val,
-                "aspect_ratio": "1:1.41",
-                "instructions": INSTRUCTIONS_BLOCK,
-                "layout_constraints": LAYOUT_CONSTRAINTS_BLOCK,
+                "aspect_ratio": preset.aspect_ratio,
+                "instructions": preset.instructions,
+                "layout_constraints": preset.layout_constraints,
                 "character_infos": st.session_state.character_infos,
                 "panels": st.session_state.panels
             }
         }
         
         # カスタム関数でYAML文字列化
-        yaml_str = make_yaml_text(output_data)
+        yaml_str = make_yaml_text(output_data, st.session_state.panel_cache)
         
         st.code(yaml_str, language="yaml")
         st.info("右上のコピーボタンからコピーして使用してください。")
\ No newline at end of file
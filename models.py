@@ -0,0 +1,343 @@
+"""
+ページ・パネルなどのデータを表すレコードクラス
+
+index.py の session_state はこのレコードで持つ。バッチ入力などの辞書は from_dict で変換し、
+to_dict で output_data と同じ形の辞書に戻せる。
+from_dict はコンパクト出力で省かれる空のリスト (objects / characters / monologues / lines) がなくてもよい。
+to_row / from_row はキー名を持たない入れ子のリストとの変換で、保存ファイルを小さくするために使う。
+__slots__ を使っているので、同じキー文字列を持つ辞書を大量に作るより軽い。
+"""
+
+
+class _Record:
+    """
+    レコードクラス共通の比較・表示
+    """
+    __slots__ = ()
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class CharacterInfo(_Record):
+    """
+    登録キャラクター (character_infos の1件)
+    """
+    __slots__ = ("name", "base_prompt")
+
+    def __init__(self, name, base_prompt=""):
+        self.name = name
+        self.base_prompt = base_prompt
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["name"], d["base_prompt"])
+
+    def to_dict(self):
+        return {"name": self.name, "base_prompt": self.base_prompt}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.name, self.base_prompt]
+
+
+class Line(_Record):
+    """
+    キャラクターのセリフ1つ
+    """
+    __slots__ = ("text", "char_text_position", "type")
+
+    def __init__(self, text, char_text_position="right", type="speech"):
+        self.text = text
+        self.char_text_position = char_text_position
+        self.type = type
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["text"], d["char_text_position"], d["type"])
+
+    def to_dict(self):
+        return {"text": self.text, "char_text_position": self.char_text_position, "type": self.type}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.text, self.char_text_position, self.type]
+
+
+class Monologue(_Record):
+    """
+    モノローグ1つ
+    """
+    __slots__ = ("text", "text_position", "balloon_shape")
+
+    def __init__(self, text, text_position="top-left", balloon_shape="長方形"):
+        self.text = text
+        self.text_position = text_position
+        self.balloon_shape = balloon_shape
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["text"], d["text_position"], d["balloon_shape"])
+
+    def to_dict(self):
+        return {"text": self.text, "text_position": self.text_position, "balloon_shape": self.balloon_shape}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.text, self.text_position, self.balloon_shape]
+
+
+class PanelCharacter(_Record):
+    """
+    コマに登場するキャラクター (temp_panel_chars の1件)
+    「セリフのみ」の場合は外見の項目が空文字になる
+    """
+    __slots__ = ("name", "panel_position", "emotion", "facing", "shot", "pose", "lines")
+
+    def __init__(self, name="", panel_position="", emotion="", facing="", shot="", pose="", lines=None):
+        self.name = name
+        self.panel_position = panel_position
+        self.emotion = emotion
+        self.facing = facing
+        self.shot = shot
+        self.pose = pose
+        self.lines = lines if lines is not None else []
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d["name"],
+            d["panel_position"],
+            d.get("emotion", ""),
+            d["facing"],
+            d["shot"],
+            d.get("pose", ""),
+            [Line.from_dict(l) for l in d.get("lines") or []],
+        )
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "panel_position": self.panel_position,
+            "shot": self.shot,
+            "facing": self.facing,
+            "pose": self.pose,
+            "lines": [l.to_dict() for l in self.lines],
+        }
+        # 画面で作るデータには emotion がないので、空なら入れない
+        if self.emotion:
+            d["emotion"] = self.emotion
+        return d
+
+    @classmethod
+    def from_row(cls, row):
+        name, panel_position, emotion, facing, shot, pose, lines = row
+        return cls(name, panel_position, emotion, facing, shot, pose, [Line(*l) for l in lines])
+
+    def to_row(self):
+        return [self.name, self.panel_position, self.emotion, self.facing, self.shot, self.pose,
+                [l.to_row() for l in self.lines]]
+
+
+class Panel(_Record):
+    """
+    コマ1つ
+    objects は名前の文字列だけを持つ
+    number が None のときは、出力するときにページ内の並び順から番号を振る
+    """
+    __slots__ = ("number", "page_position", "background", "description", "objects",
+                 "characters", "effects", "monologues", "camera_angle")
+
+    def __init__(self, number=None, page_position="", background="", description="", objects=None,
+                 characters=None, effects=None, monologues=None, camera_angle=""):
+        self.number = number
+        self.page_position = page_position
+        self.background = background
+        self.description = description
+        self.objects = objects if objects is not None else []
+        self.characters = characters if characters is not None else []
+        self.effects = effects if effects is not None else []
+        self.monologues = monologues if monologues is not None else []
+        self.camera_angle = camera_angle
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            d.get("number"),
+            d["page_position"],
+            d["background"],
+            d["description"],
+            [o["name"] for o in d.get("objects") or []],
+            [PanelCharacter.from_dict(c) for c in d.get("characters") or []],
+            list(d.get("effects") or []),
+            [Monologue.from_dict(m) for m in d.get("monologues") or []],
+            d["camera_angle"],
+        )
+
+    def to_dict(self, position=None):
+        """
+        position は number が None のときに使う番号（ページ内の並び順）
+        """
+        return {
+            "number": self.number if self.number is not None else position,
+            "page_position": self.page_position,
+            "background": self.background,
+            "description": self.description,
+            "objects": [{"name": o} for o in self.objects],
+            "characters": [c.to_dict() for c in self.characters],
+            "effects": list(self.effects),
+            "monologues": [m.to_dict() for m in self.monologues],
+            "camera_angle": self.camera_angle,
+        }
+
+    @classmethod
+    def from_row(cls, row):
+        number, page_position, background, description, objects, characters, effects, monologues, camera_angle = row
+        return cls(number, page_position, background, description, objects,
+                   [PanelCharacter.from_row(c) for c in characters], effects,
+                   [Monologue(*m) for m in monologues], camera_angle)
+
+    def to_row(self):
+        return [self.number, self.page_position, self.background, self.description, list(self.objects),
+                [c.to_row() for c in self.characters], list(self.effects),
+                [m.to_row() for m in self.monologues], self.camera_angle]
+
+    def content_key(self):
+        """
+        YAMLに出る内容のうち number 以外のタプル（パネルキャッシュのキー）
+        毎回の生成で全パネル分呼ばれるので、getattr のループを使わずに直接組み立てる
+        effects は常に [] で出力されるので含めない
+        """
+        chars = []
+        for c in self.characters:
+            lines = tuple([(l.text, l.char_text_position, l.type) for l in c.lines])
+            chars.append((c.name, c.panel_position, c.emotion, c.facing, c.shot, c.pose, lines))
+        monos = tuple([(m.text, m.text_position, m.balloon_shape) for m in self.monologues])
+        return (self.page_position, self.background, self.description, tuple(self.objects),
+                tuple(chars), monos, self.camera_angle)
+
+
+class Page(_Record):
+    """
+    漫画1ページ分 (output_data["comic_page"])
+    writing-mode は属性名に - が使えないので writing_mode にしている
+    """
+    __slots__ = ("language", "style", "writing_mode", "color_mode", "aspect_ratio",
+                 "instructions", "layout_constraints", "character_infos", "panels")
+
+    def __init__(self, language, style, writing_mode, color_mode, aspect_ratio,
+                 instructions, layout_constraints, character_infos=None, panels=None):
+        self.language = language
+        self.style = style
+        self.writing_mode = writing_mode
+        self.color_mode = color_mode
+        self.aspect_ratio = aspect_ratio
+        self.instructions = instructions
+        self.layout_constraints = layout_constraints
+        self.character_infos = character_infos if character_infos is not None else []
+        self.panels = panels if panels is not None else []
+
+    @classmethod
+    def from_dict(cls, cp, with_panels=True):
+        """
+        comic_page の辞書から作る
+        with_panels=False ならパネルは変換しない（少しずつ変換したいとき用）
+        """
+        return cls(
+            cp["language"],
+            cp["style"],
+            cp["writing-mode"],
+            cp["color_mode"],
+            cp["aspect_ratio"],
+            cp["instructions"],
+            cp["layout_constraints"],
+            [CharacterInfo.from_dict(c) for c in cp["character_infos"]],
+            [Panel.from_dict(p) for p in cp["panels"]] if with_panels else [],
+        )
+
+    def to_dict(self):
+        return {
+            "language": self.language,
+            "style": self.style,
+            "writing-mode": self.writing_mode,
+            "color_mode": self.color_mode,
+            "aspect_ratio": self.aspect_ratio,
+            "instructions": self.instructions,
+            "layout_constraints": self.layout_constraints,
+            "character_infos": [c.to_dict() for c in self.character_infos],
+            "panels": [p.to_dict(i) for i, p in enumerate(self.panels, 1)],
+        }
+
+
+class Chapter(_Record):
+    """
+    複数ページをまとめた章 ({"chapter": {...}})
+    基本設定・長文ブロック・キャラクター一覧は全ページで1つを共有し、
+    pages はページごとのパネルのリスト（パネルの number はページごとに1から）
+    """
+    __slots__ = ("language", "style", "writing_mode", "color_mode", "aspect_ratio",
+                 "instructions", "layout_constraints", "character_infos", "pages")
+
+    def __init__(self, language, style, writing_mode, color_mode, aspect_ratio,
+                 instructions, layout_constraints, character_infos=None, pages=None):
+        self.language = language
+        self.style = style
+        self.writing_mode = writing_mode
+        self.color_mode = color_mode
+        self.aspect_ratio = aspect_ratio
+        self.instructions = instructions
+        self.layout_constraints = layout_constraints
+        self.character_infos = character_infos if character_infos is not None else []
+        self.pages = pages if pages is not None else []
+
+    def page(self, index):
+        """
+        index 番目のページを、共有の設定とキャラクター一覧を持つ Page として返す
+        """
+        return Page(self.language, self.style, self.writing_mode, self.color_mode, self.aspect_ratio,
+                    self.instructions, self.layout_constraints, self.character_infos, self.pages[index])
+
+    @classmethod
+    def from_dict(cls, ch):
+        """
+        chapter の辞書から作る。pages の各要素は {"panels": [...]}
+        """
+        return cls(
+            ch["language"],
+            ch["style"],
+            ch["writing-mode"],
+            ch["color_mode"],
+            ch["aspect_ratio"],
+            ch["instructions"],
+            ch["layout_constraints"],
+            [CharacterInfo.from_dict(c) for c in ch["character_infos"]],
+            [[Panel.from_dict(p) for p in pg["panels"]] for pg in ch["pages"]],
+        )
+
+    def to_dict(self):
+        return {
+            "language": self.language,
+            "style": self.style,
+            "writing-mode": self.writing_mode,
+            "color_mode": self.color_mode,
+            "aspect_ratio": self.aspect_ratio,
+            "instructions": self.instructions,
+            "layout_constraints": self.layout_constraints,
+            "character_infos": [c.to_dict() for c in self.character_infos],
+            "pages": [{"panels": [p.to_dict(i) for i, p in enumerate(panels, 1)]} for panels in self.pages],
+        }
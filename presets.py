@@ -0,0 +1,135 @@
+"""
+ページの基本設定のプリセット（style・writing-mode・aspect_ratio・長文ブロック）
+
+presets ディレクトリの JSON ファイル1つが1つのプリセットで、ファイル名（拡張子なし）がプリセット名になる。
+    {"label": "青年漫画", "style": "japanese seinen manga", "writing-mode": "vertical-rl",
+     "aspect_ratio": "1:1.41", "instructions": "...", "layout_constraints": "..."}
+書かなかった項目は既定のプリセット (DEFAULT_PRESET) の値になる。
+既定のプリセットは prompt_core の DEFAULT_PAGE_SETTINGS で、ファイルがなくても使える。
+
+ファイルは一覧を出すときには読まず、そのプリセットを初めて使うときに読む。
+読んだ内容は覚えておき、ファイルの更新時刻か大きさが変わったら読み直す。
+YAMLのヘッダー部分は prompt_core.settings_text が内容ごとに1回だけ作って使い回す。
+
+使い方:
+    library = PresetLibrary()
+    preset = library.get("seinen")
+    page = preset.page("Japanese", "白黒", characters, panels)
+"""
+
+import json
+import os
+
+from models import Page
+from prompt_core import DEFAULT_PAGE_SETTINGS
+
+PRESET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "presets")
+DEFAULT_PRESET = "syonen"
+# JSON のキーと Preset の属性名
+FIELDS = (
+    ("style", "style"),
+    ("writing-mode", "writing_mode"),
+    ("aspect_ratio", "aspect_ratio"),
+    ("instructions", "instructions"),
+    ("layout_constraints", "layout_constraints"),
+)
+
+
+class Preset:
+    """
+    プリセット1つ分。language と color_mode はサイドバーで選ぶので持たない
+    """
+    __slots__ = ("name", "label", "style", "writing_mode", "aspect_ratio", "instructions", "layout_constraints")
+
+    def __init__(self, name, label, style, writing_mode, aspect_ratio, instructions, layout_constraints):
+        self.name = name
+        self.label = label
+        self.style = style
+        self.writing_mode = writing_mode
+        self.aspect_ratio = aspect_ratio
+        self.instructions = instructions
+        self.layout_constraints = layout_constraints
+
+    @classmethod
+    def from_dict(cls, name, d, base=None):
+        """
+        プリセットの JSON の辞書から作る。書かれていない項目は base の値にする
+        """
+        values = {}
+        for key, attr in FIELDS:
+            value = d.get(key, getattr(base, attr, None))
+            if not isinstance(value, str):
+                raise ValueError(f"preset {name}: {key} must be a string")
+            values[attr] = value
+        return cls(name, d.get("label") or name, **values)
+
+    def page(self, language, color_mode, character_infos, panels):
+        """
+        このプリセットの設定で Page を作る
+        """
+        return Page(language, self.style, self.writing_mode, color_mode, self.aspect_ratio,
+                    self.instructions, self.layout_constraints, character_infos, panels)
+
+    def summary(self):
+        # サイドバーに表示する設定の一覧
+        return f"- Style: {self.style}\n- Writing-mode: {self.writing_mode}\n- Aspect Ratio: {self.aspect_ratio}\n"
+
+
+def default_preset():
+    return Preset.from_dict(DEFAULT_PRESET, dict(DEFAULT_PAGE_SETTINGS, label="少年漫画（既定）"))
+
+
+class PresetLibrary:
+    """
+    ディレクトリのプリセットを必要になったときに読み込んで覚えておく
+    """
+
+    def __init__(self, directory=PRESET_DIR):
+        self.directory = directory
+        self.loads = 0
+        self._default = default_preset()
+        # 名前 -> ((更新時刻, 大きさ), Preset)
+        self._loaded = {}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + ".json")
+
+    def names(self):
+        """
+        使えるプリセット名の一覧（既定のプリセットが先頭）。ファイルの中身は読まない
+        """
+        try:
+            files = sorted(e.name[:-5] for e in os.scandir(self.directory)
+                           if e.name.endswith(".json") and e.is_file())
+        except FileNotFoundError:
+            files = []
+        return [DEFAULT_PRESET] + [n for n in files if n != DEFAULT_PRESET]
+
+    def get(self, name):
+        """
+        プリセットを返す。ファイルが変わっていれば読み直す
+        ファイルがない名前は KeyError、読めないファイルは ValueError
+        """
+        path = self._path(name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            if name == DEFAULT_PRESET:
+                return self._default
+            self._loaded.pop(name, None)
+            raise KeyError(name) from None
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = self._loaded.get(name)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"preset {name}: {e}") from None
+        if not isinstance(data, dict):
+            raise ValueError(f"preset {name}: expected a JSON object")
+        preset = Preset.from_dict(name, data, self._default)
+        self._loaded[name] = (stamp, preset)
+        self.loads += 1
+        return preset
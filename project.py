@@ -0,0 +1,144 @@
+"""
+プロジェクト（キャラクター一覧とパネル一覧）と、それを変更する操作
+
+Project は変更できないデータで、操作を適用すると新しい Project を返す。
+一覧は PVector で持つので、変更前後の Project は変わっていない部分のデータを共有する。
+元に戻す履歴 (history.py) は変更前の Project をそのまま取っておくだけでよい。
+
+パネルの number は持たない（None）。YAMLに出すときに並び順から振るので、
+途中のパネルを削除しても後ろのパネルを書き換えずに済む。
+
+操作は次の形の辞書
+    {"op": "add_char", "char": CharacterInfo}
+    {"op": "del_char", "index": i}
+    {"op": "insert_char", "index": i, "char": CharacterInfo}
+    {"op": "update_char", "index": i, "char": CharacterInfo}
+    {"op": "add_panel", "panel": Panel}
+    {"op": "del_panel", "index": i}
+    {"op": "insert_panel", "index": i, "panel": Panel}
+    {"op": "update_panel", "index": i, "panel": Panel}
+    {"op": "del_panels", "indices": [i, ...]}
+    {"op": "restore_panels", "indices": [i, ...], "panels": [Panel, ...]}
+    {"op": "move_panels", "start": s, "stop": e, "to": t}
+    {"op": "dup_panels", "start": s, "stop": e}
+update_char / update_panel は i 番目を置き換える。
+restore_panels は、挿入し終えたときに indices の位置に来るようにパネルを入れる（del_panels の逆）。
+move_panels は [s, e) のパネルを、移動前の並びで t 番目のパネルの前へ移す。
+dup_panels は [s, e) の複製をすぐ後ろに入れる。
+どの操作も、かかる時間は変更するパネルの数 × log(パネル数) で、残りのパネルには触らない。
+"""
+
+import copy
+
+from pvector import PVector
+
+
+class Project:
+    """
+    キャラクター一覧 characters とパネル一覧 panels の組
+    """
+    __slots__ = ("characters", "panels")
+
+    def __init__(self, characters=(), panels=()):
+        self.characters = characters if isinstance(characters, PVector) else PVector(characters)
+        self.panels = panels if isinstance(panels, PVector) else PVector(panels)
+
+    def apply(self, op):
+        """
+        操作を1つ適用した新しい Project を返す
+        """
+        kind = op["op"]
+        chars, panels = self.characters, self.panels
+        if kind == "add_char":
+            chars = chars.append(op["char"])
+        elif kind == "del_char":
+            chars = chars.delete(op["index"])
+        elif kind == "insert_char":
+            chars = chars.insert(op["index"], op["char"])
+        elif kind == "update_char":
+            chars = chars.set(op["index"], op["char"])
+        elif kind == "add_panel":
+            panels = panels.append(op["panel"])
+        elif kind == "del_panel":
+            panels = panels.delete(op["index"])
+        elif kind == "insert_panel":
+            panels = panels.insert(op["index"], op["panel"])
+        elif kind == "update_panel":
+            panels = panels.set(op["index"], op["panel"])
+        elif kind == "del_panels":
+            # 後ろから消せば、まだ消していない位置がずれない
+            for i in sorted(op["indices"], reverse=True):
+                panels = panels.delete(i)
+        elif kind == "restore_panels":
+            for i, panel in sorted(zip(op["indices"], op["panels"]), key=lambda item: item[0]):
+                panels = panels.insert(i, panel)
+        elif kind == "move_panels":
+            panels = _move(panels, op["start"], op["stop"], op["to"])
+        elif kind == "dup_panels":
+            _check_range(panels, op["start"], op["stop"], kind)
+            # 同じオブジェクトが2か所に入ると、id で覚えている画面の状態が混ざるので浅いコピーにする
+            copies = PVector([copy.copy(p) for p in panels[op["start"]:op["stop"]]])
+            panels = panels.insert_all(op["stop"], copies)
+        else:
+            raise ValueError(f"unknown op: {kind}")
+        return Project(chars, panels)
+
+    def inverse(self, op):
+        """
+        self に op を適用した結果を、self に戻す操作を返す
+        """
+        kind = op["op"]
+        if kind == "add_char":
+            return {"op": "del_char", "index": len(self.characters)}
+        if kind == "del_char":
+            return {"op": "insert_char", "index": op["index"], "char": self.characters[op["index"]]}
+        if kind == "insert_char":
+            return {"op": "del_char", "index": op["index"]}
+        if kind == "update_char":
+            return {"op": "update_char", "index": op["index"], "char": self.characters[op["index"]]}
+        if kind == "add_panel":
+            return {"op": "del_panel", "index": len(self.panels)}
+        if kind == "del_panel":
+            return {"op": "insert_panel", "index": op["index"], "panel": self.panels[op["index"]]}
+        if kind == "insert_panel":
+            return {"op": "del_panel", "index": op["index"]}
+        if kind == "update_panel":
+            return {"op": "update_panel", "index": op["index"], "panel": self.panels[op["index"]]}
+        if kind == "del_panels":
+            indices = sorted(op["indices"])
+            return {"op": "restore_panels", "indices": indices, "panels": [self.panels[i] for i in indices]}
+        if kind == "restore_panels":
+            return {"op": "del_panels", "indices": sorted(op["indices"])}
+        if kind == "move_panels":
+            start, stop, to = op["start"], op["stop"], op["to"]
+            size = stop - start
+            moved_to = to if to <= start else to - size
+            return {"op": "move_panels", "start": moved_to, "stop": moved_to + size,
+                    "to": start if start <= moved_to else start + size}
+        if kind == "dup_panels":
+            _check_range(self.panels, op["start"], op["stop"], kind)
+            stop = op["stop"]
+            return {"op": "del_panels", "indices": list(range(stop, stop + stop - op["start"]))}
+        raise ValueError(f"unknown op: {kind}")
+
+
+def _check_range(panels, start, stop, kind):
+    """
+    [start, stop) が panels の中に収まっていなければ IndexError
+    """
+    if not 0 <= start <= stop <= len(panels):
+        raise IndexError(f"{kind}: range out of bounds")
+
+
+def _move(panels, start, stop, to):
+    """
+    [start, stop) を取り出して、取り出す前の位置 to の前に入れ直す
+    """
+    _check_range(panels, start, stop, "move_panels")
+    if not 0 <= to <= len(panels):
+        raise IndexError("move_panels: range out of bounds")
+    if start < to < stop:
+        raise ValueError("move_panels: destination is inside the range")
+    block = panels.slice(start, stop)
+    rest = panels.delete_range(start, stop)
+    return rest.insert_all(to if to <= start else to - (stop - start), block)
@@ -0,0 +1,174 @@
+"""
+プロジェクト（キャラクター一覧とパネル一覧）のローカル保存
+
+projects/<プロジェクト名>/ の下に2つのファイルを置く。
+    snapshot.json  ある時点の全データ（キー名なしの入れ子リストで小さくしている）
+    journal.jsonl  それ以降の追加・削除の操作を1行ずつ追記したもの
+
+操作のたびにファイル全体を書き直さず journal に1行追記するだけにして、
+journal が compact_every 行を超えたら snapshot を書き直して journal を空にする（コンパクション）。
+読み込みは snapshot を読んでから journal の操作を順に適用する。
+元に戻す／やり直すも、それに相当する操作として journal に追記する。
+
+操作の形は project.py を参照（ファイルには char / panel を to_row したものを書く）
+"""
+
+import gc
+import json
+import os
+
+from models import CharacterInfo, Panel
+from project import Project
+
+FORMAT_VERSION = 1
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "projects")
+
+
+# --- 操作の保存形式 ---
+def op_to_json(op):
+    """
+    操作をファイルに書ける形にする（レコードを to_row したもの）
+    """
+    d = dict(op)
+    if "char" in d:
+        d["char"] = d["char"].to_row()
+    if "panel" in d:
+        d["panel"] = d["panel"].to_row()
+    if "panels" in d:
+        d["panels"] = [p.to_row() for p in d["panels"]]
+    return d
+
+
+def op_from_json(d):
+    """
+    op_to_json の逆
+    """
+    if "char" in d:
+        d["char"] = CharacterInfo.from_row(d["char"])
+    if "panel" in d:
+        d["panel"] = Panel.from_row(d["panel"])
+    if "panels" in d:
+        d["panels"] = [Panel.from_row(r) for r in d["panels"]]
+    return d
+
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class ProjectStore:
+    """
+    1つのプロジェクトの保存先
+    journal の各行には通し番号 seq を付け、snapshot にはどこまで反映済みかを書いておく。
+    snapshot を書き直した直後に journal を空にする前に落ちても、二重に適用されない。
+    """
+
+    def __init__(self, name, root=DEFAULT_ROOT, compact_every=500):
+        if not name or name.startswith(".") or "/" in name or "\\" in name:
+            raise ValueError(f"invalid project name: {name!r}")
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.snapshot_path = os.path.join(self.dir, "snapshot.json")
+        self.journal_path = os.path.join(self.dir, "journal.jsonl")
+        self.compact_every = compact_every
+        self.seq = 0
+        self.journal_lines = 0
+
+    def exists(self):
+        return os.path.exists(self.snapshot_path) or os.path.exists(self.journal_path)
+
+    def load(self):
+        """
+        Project を読み込んで返す。保存がなければ空の Project
+        """
+        # 大量の小さなオブジェクトを作るあいだ GC が何度も走ると読み込みが倍以上遅くなるので止めておく
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self._load()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _load(self):
+        characters, panels = [], []
+        snap_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snap = json.load(f)
+            if snap.get("format") != FORMAT_VERSION:
+                raise ValueError(f"unsupported project format: {snap.get('format')}")
+            snap_seq = snap["seq"]
+            characters = [CharacterInfo.from_row(r) for r in snap["character_infos"]]
+            panels = [Panel.from_row(r) for r in snap["panels"]]
+        project = Project(characters, panels)
+
+        self.seq = snap_seq
+        self.journal_lines = 0
+        if os.path.exists(self.journal_path):
+            # 最後まで読めた行の終わりの位置（バイト）
+            good_end = 0
+            with open(self.journal_path, "rb") as f:
+                for line in f:
+                    # 改行で終わっていない行は、追記の途中で落ちたもの
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.strip():
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            break
+                        self.journal_lines += 1
+                        if entry["seq"] > snap_seq:
+                            project = project.apply(op_from_json(entry["op"]))
+                            self.seq = entry["seq"]
+                    good_end += len(line)
+                torn = f.seek(0, os.SEEK_END) > good_end
+            if torn:
+                # 壊れた最後の行を切り捨てておく。残したままだと次の append がその行の続きに書かれ、
+                # 以後の操作が読み込めなくなる
+                os.truncate(self.journal_path, good_end)
+        return project
+
+    def append(self, op, project):
+        """
+        適用済みの操作を journal に追記する
+        project は操作を適用したあとの状態（コンパクションのときに使う）
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        self.seq += 1
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(_dumps({"seq": self.seq, "op": op_to_json(op)}) + "\n")
+        self.journal_lines += 1
+        if self.journal_lines >= self.compact_every:
+            self.save(project)
+
+    def save(self, project):
+        """
+        全データを snapshot に書き、journal を空にする
+        """
+        os.makedirs(self.dir, exist_ok=True)
+        snap = {
+            "format": FORMAT_VERSION,
+            "seq": self.seq,
+            "character_infos": [c.to_row() for c in project.characters],
+            "panels": [p.to_row() for p in project.panels],
+        }
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_dumps(snap))
+            f.flush()
+            os.fsync(f.fileno())
+        # 書き終わってから置き換えるので、途中で落ちても古い snapshot が残る
+        os.replace(tmp_path, self.snapshot_path)
+        open(self.journal_path, "w").close()
+        self.journal_lines = 0
+
+
+def list_projects(root=DEFAULT_ROOT):
+    """
+    保存されているプロジェクト名の一覧
+    """
+    if not os.path.isdir(root):
+        return []
+    return sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
@@ -0,0 +1,202 @@
+"""
+生成したYAMLのディスクキャッシュ（内容アドレス方式）
+
+キーは、省略された項目を既定値で埋めた comic_page をキーの順に並べた JSON と、生成器のバージョン
+(prompt_core.GENERATOR_VERSION)・既定のプリセットの内容 (DEFAULT_PAGE_SETTINGS)・出力の書き方のハッシュ (SHA-256)。
+プリセットの内容は基本設定として comic_page に入っているので、プリセットが変わればキーも変わる。
+キーの順番や \u3042 のようなエスケープの書き方だけが違う行も、内容が同じなら同じキーになる。
+
+JSONL の1行を JSON として読んで並べ直すのは、それだけでYAMLを作るのと同じくらい時間がかかる。
+そこで、行の文字列そのもののハッシュ (line_key) から上のキーへの対応も残しておき、
+前と1文字も変わらない行は JSON を読まずにキャッシュから返せるようにする (get_line / put_line)。
+これはキーの前に1回多く引くだけで、見つからなければいつものキーで引く。
+
+ファイルは <ディレクトリ>/<ハッシュの先頭2文字>/<ハッシュ>.yaml に、行からキーへの対応は
+同じ場所の <行のハッシュ>.line に置く。
+書き込みは同じディレクトリの一時ファイルに書いてから os.replace で置き換えるので、
+複数のワーカープロセスが同じキャッシュを同時に使っても、書きかけのファイルを読むことはない。
+使ったファイルは更新時刻を今にしておき、prune で合計サイズが上限を超えた分を
+更新時刻の古いもの（長く使われていないもの）から消す (LRU)。
+
+使い方:
+    cache = PromptCache("prompt_cache")
+    line_key = cache.line_key(line, compact=False)
+    text = cache.get_line(line_key)
+    if text is None:
+        page = record_to_page(line)[1]
+        key = cache.key(page, compact=False)
+        text = cache.get(key)
+        if text is None:
+            text = make_yaml_text(page)
+            cache.put(key, text)
+        cache.put_line(line_key, key)
+    cache.prune()
+"""
+
+import hashlib
+import json
+import os
+import time
+
+from prompt_core import DEFAULT_PAGE_SETTINGS, GENERATOR_VERSION, fill_page_defaults
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_cache")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# これより古い一時ファイルは、書いている途中で落ちたものとして prune で消す（秒）
+STALE_TMP_AGE = 3600
+# 生成器のバージョンと既定のプリセットの内容（どのキーにも入れる）
+_SALT = hashlib.sha256(
+    f"v{GENERATOR_VERSION}\n{json.dumps(DEFAULT_PAGE_SETTINGS, ensure_ascii=False, sort_keys=True)}".encode("utf-8")
+).digest()
+
+
+class PromptCache:
+    """
+    hits / misses / writes / evicted はこのオブジェクトで数えた回数
+    （ワーカープロセスごとに別のオブジェクトになるので、バッチでは親プロセスで足し合わせる）
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evicted = 0
+
+    @staticmethod
+    def key(record, compact=False):
+        """
+        レコード（JSONL の1行の文字列か、{"comic_page": {...}} の辞書）と書き方から作るキー（16進の文字列）
+        キーの順番や書き方が違っても、省略された既定値を埋めた内容が同じなら同じキーになる
+        """
+        data = json.loads(record) if isinstance(record, str) else record
+        canonical = json.dumps(fill_page_defaults(data["comic_page"]), sort_keys=True, ensure_ascii=False,
+                               separators=(",", ":"))
+        return _hash(b"compact\n" if compact else b"yaml\n", canonical)
+
+    @staticmethod
+    def line_key(line, compact=False):
+        """
+        JSONL の1行の文字列そのもの（前後の空白は除く）から作るキー。get_line / put_line で使う
+        """
+        return _hash(b"line compact\n" if compact else b"line yaml\n", line.strip())
+
+    def _path(self, key, ext=".yaml"):
+        return os.path.join(self.directory, key[:2], key + ext)
+
+    def get(self, key):
+        """
+        キャッシュしたYAML。なければ None
+        """
+        text = self._read(self._path(key))
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def get_line(self, line_key):
+        """
+        前に put_line した行なら、そのキーのYAML。なければ None（hits は数えるが misses は数えない）
+        None のときは、行を読んで key を作って get で引き直す
+        """
+        key = self._read(self._path(line_key, ".line"))
+        text = self._read(self._path(key)) if key is not None else None
+        if text is not None:
+            self.hits += 1
+        return text
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, encoding="utf-8", newline="") as f:
+                text = f.read()
+            # LRU のために使った時刻を残す（atime は記録しない設定のことが多いので mtime を使う）
+            os.utime(path)
+        except FileNotFoundError:
+            # 他のプロセスの prune で消された直後も、なかったものとして扱う
+            return None
+        return text
+
+    def put(self, key, text):
+        self._write(self._path(key), text)
+        self.writes += 1
+
+    def put_line(self, line_key, key):
+        """
+        line_key の行の内容は key で引ける、と残しておく
+        """
+        self._write(self._path(line_key, ".line"), key)
+
+    @staticmethod
+    def _write(path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def entries(self):
+        """
+        (更新時刻, バイト数, パス) のリスト（行からキーへの対応も含め、一時ファイルは含めない）
+        """
+        rows = []
+        try:
+            subdirs = [e.path for e in os.scandir(self.directory) if e.is_dir()]
+        except FileNotFoundError:
+            return rows
+        now = time.time()
+        for sub in subdirs:
+            for e in os.scandir(sub):
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                if e.name.endswith((".yaml", ".line")):
+                    rows.append((st.st_mtime, st.st_size, e.path))
+                elif ".tmp-" in e.name and now - st.st_mtime > STALE_TMP_AGE:
+                    _remove(e.path)
+        return rows
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def prune(self, max_bytes=None):
+        """
+        合計が max_bytes（省略時は self.max_bytes）以下になるまで、長く使われていないものから消す
+        消したファイルの数を返す
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        rows = self.entries()
+        total = sum(size for _, size, _ in rows)
+        removed = 0
+        if total <= limit:
+            return removed
+        rows.sort()
+        for _, size, path in rows:
+            if total <= limit:
+                break
+            if _remove(path):
+                removed += 1
+            total -= size
+        self.evicted += removed
+        return removed
+
+    def clear(self):
+        return self.prune(0)
+
+
+def _hash(kind, text):
+    h = hashlib.sha256(_SALT)
+    h.update(kind)
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
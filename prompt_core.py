@@ -0,0 +1,560 @@
+"""
+漫画プロンプト生成のコア部分
+
+Streamlit に依存しないので、バッチ処理などから UI を起動せずに import できる。
+index.py / mangaPrompt.py はここから定数と make_yaml_text を読み込んで使う。
+import を軽く保つため、このモジュールでは標準ライブラリ以外を import しないこと。
+"""
+
+import marshal
+from functools import lru_cache
+
+from models import Page, Panel
+
+# 生成するYAMLの書き方を変えたら1つ増やす（ディスクキャッシュ prompt_cache.py の古い結果を使わないように）
+GENERATOR_VERSION = 1
+
+# 固定テキストブロック
+INSTRUCTIONS_BLOCK = """このYAMLは漫画ページの仕様です。添付の画像データ（キャラクター等、コマ割り画像）がある場合は、
+それらを外見の基準として忠実に反映し、このプロンプトの指示に従ってページを生成してください。"""
+
+LAYOUT_CONSTRAINTS_BLOCK = """指示: 以下のレイアウト制約を厳守して画像を生成してください。
+- ページ全体のアスペクト比は 1:1.4（幅:高さ）を絶対に厳守する。
+- パネルの追加・削除・結合・回転・順序入替えは禁止。
+- 各パネルの内容は必ず枠内に収める。
+- 読み順は panel.number の昇順。
+- writing-mode が vertical-rl の場合、同一パネル内で会話があるときは「先に読ませたいセリフのキャラクターほど右側に配置する」こと。"""
+
+
+# サイドバーの固定設定と同じ既定値（バッチ入力で省略された項目に使う）
+DEFAULT_PAGE_SETTINGS = {
+    "language": "Japanese",
+    "style": "japanese syonen manga",
+    "writing-mode": "vertical-rl",
+    "color_mode": "白黒",
+    "aspect_ratio": "1:1.41",
+    "instructions": INSTRUCTIONS_BLOCK,
+    "layout_constraints": LAYOUT_CONSTRAINTS_BLOCK,
+}
+
+
+def fill_page_defaults(comic_page):
+    """
+    comic_page 辞書の足りない項目を既定値で埋めた新しい辞書を返す
+    """
+    cp = dict(DEFAULT_PAGE_SETTINGS)
+    cp["character_infos"] = []
+    cp["panels"] = []
+    cp.update(comic_page)
+    return cp
+
+
+# --- 重複する長い文字列のアンカー化 ---
+class AnchorTable:
+    """
+    min_length 文字以上の文字列を、最初の1回だけ &アンカー 付きで書き、
+    2回目以降は *エイリアス で参照するための表
+    生成済みの行を書き換えるので、アンカーを使わない通常の生成は遅くならない
+    複数ページで同じ表を使うと、ページをまたいで重複を省ける（1つのYAML文書に書く場合のみ）
+    saved は省けたバイト数の合計、saved_per_page はページごとの内訳
+    """
+
+    def __init__(self, min_length=32):
+        self.min_length = min_length
+        self.saved = 0
+        self.saved_per_page = []
+        self._names = {}
+        self._page_start = 0
+
+    def _ref(self, value):
+        """
+        値の代わりに書く "&名前 " か "*名前" を返す。短い文字列は None
+        """
+        if len(value) < self.min_length:
+            return None
+        name = self._names.get(value)
+        if name is not None:
+            return "*" + name
+        name = f"s{len(self._names) + 1}"
+        self._names[value] = name
+        return f"&{name} "
+
+    def apply(self, chunk):
+        """
+        YAMLの断片の「key : "値"」と「key : |-」の長文ブロックをアンカー・エイリアスに置き換える
+        コンパクト出力の「key: "値"」「key: |-」も同じように扱う
+        """
+        src = chunk.split("\n")
+        out = []
+        i = 0
+        while i < len(src):
+            line = src[i]
+            i += 1
+            if line.endswith(": |-"):
+                # 長文ブロック: 1段深い行が続くあいだが本文（1段はコンパクト出力なら1文字、通常は2文字）
+                head = line[:-2]
+                step = 2 if line.endswith(" : |-") else 1
+                body_indent = " " * (len(line) - len(line.lstrip(" ")) + step)
+                start = i
+                while i < len(src) and src[i].startswith(body_indent):
+                    i += 1
+                body = src[start:i]
+                ref = self._ref("\n".join([l[len(body_indent):] for l in body]))
+                if ref is None:
+                    out.append(line)
+                    out.extend(body)
+                elif ref.startswith("*"):
+                    out.append(head + ref)
+                else:
+                    out.append(head + ref + "|-")
+                    out.extend(body)
+                continue
+
+            # 「key : "値"」（コンパクト出力では「key: "値"」）
+            pos = line.find(': "')
+            if pos >= 0 and line.endswith('"'):
+                ref = self._ref(line[pos + 3:-1])
+                if ref is not None:
+                    if ref.startswith("*"):
+                        line = line[:pos + 2] + ref
+                    else:
+                        line = line[:pos + 2] + ref + line[pos + 2:]
+            out.append(line)
+
+        result = "\n".join(out)
+        self.saved += len(chunk.encode()) - len(result.encode())
+        return result
+
+    def end_page(self):
+        """
+        前回の end_page からの省略バイト数を1ページ分として saved_per_page に記録する
+        """
+        self.saved_per_page.append(self.saved - self._page_start)
+        self._page_start = self.saved
+
+
+# --- ヘルパー関数: 手動YAML生成 ---
+def _settings_lines(page):
+    """
+    comic_page の基本プロパティと長文ブロックの行リスト
+    """
+    lines = []
+
+    def add_line(text, indent=0):
+        lines.append("  " * indent + text)
+
+    # comic_page
+    add_line("comic_page :", 0)
+
+    # 基本プロパティ
+    add_line(f'language : "{page.language}"', 1)
+    add_line(f'style : "{page.style}"', 1)
+    add_line(f'writing-mode : "{page.writing_mode}"', 1)
+    add_line(f'color_mode : "{page.color_mode}"', 1)
+    add_line(f'aspect_ratio : "{page.aspect_ratio}"', 1)
+
+    # 長文ブロック (Block Style)
+    add_line("instructions : |-", 1)
+    for l in page.instructions.split("\n"):
+        add_line(l, 2)
+
+    add_line("layout_constraints : |-", 1)
+    for l in page.layout_constraints.split("\n"):
+        add_line(l, 2)
+    return lines
+
+
+# 基本プロパティと長文ブロックの部分は、同じ設定（プリセット）なら毎回同じ文字列になるので覚えておく
+def settings_text(page, compact=False):
+    """
+    comic_page の基本プロパティと長文ブロックの部分（「comic_page :」の行から）
+    同じ内容の設定は一度だけ作って使い回す（長文ブロックの分割と字下げを毎回しない）
+    内容そのものをキーにするので、プリセットのファイルが変わって中身が変われば作り直す
+    """
+    return _settings_text(compact, page.language, page.style, page.writing_mode, page.color_mode,
+                          page.aspect_ratio, page.instructions, page.layout_constraints)
+
+
+# Streamlit はセッションごとに別のスレッドで動くので、自前の辞書ではなくスレッドから使える lru_cache で覚える
+@lru_cache(maxsize=64)
+def _settings_text(compact, *settings):
+    page = Page(*settings)
+    return "\n".join(_compact_settings_lines(page) if compact else _settings_lines(page))
+
+
+def _character_lines(page):
+    """
+    キャラ一覧の行リスト（登録がなければ空）
+    """
+    lines = []
+
+    def add_line(text, indent=0):
+        lines.append("  " * indent + text)
+
+    # Character Infos
+    if page.character_infos:
+        add_line("character_infos :", 1)
+        for char in page.character_infos:
+            add_line(f'- name : "{char.name}"', 2)
+            add_line(f'  base_prompt : "{char.base_prompt}"', 2)
+            add_line("", 0) # 空行
+
+    return lines
+
+
+def _panel_lines(panel, number):
+    """
+    パネル1つ分の行リストを作る（最後はパネル区切りの空行）
+    """
+    lines = []
+
+    def add_line(text, indent=0):
+        lines.append("  " * indent + text)
+
+    add_line(f'- number : {number}', 2)
+    add_line(f'  page_position : "{panel.page_position}"', 2)
+    add_line(f'  background : "{panel.background}"', 2)
+    add_line(f'  description : "{panel.description}"', 2)
+
+    # Objects
+    if panel.objects:
+        add_line("  objects :", 2)
+        for obj_name in panel.objects:
+            add_line(f'- name : "{obj_name}"', 3)
+    else:
+        add_line("  objects : []", 2)
+
+    # Characters in panel
+    if panel.characters:
+        add_line("  characters :", 2)
+        for p_char in panel.characters:
+            # nameが空文字の場合でも出力する
+            add_line(f'- name : "{p_char.name}"', 3)
+            add_line(f'  panel_position : "{p_char.panel_position}"', 3)
+            add_line(f'  emotion : "{p_char.emotion}"', 3)
+            add_line(f'  facing : "{p_char.facing}"', 3)
+            add_line(f'  shot : "{p_char.shot}"', 3)
+            add_line(f'  pose : "{p_char.pose}"', 3)
+
+            # Lines
+            if p_char.lines:
+                add_line("  lines :", 3)
+                for line in p_char.lines:
+                    add_line(f'- text : "{line.text}"', 4)
+                    add_line(f'  char_text_position : "{line.char_text_position}"', 4)
+                    add_line(f'  type : "{line.type}"', 4)
+            else:
+                add_line("  lines : []", 3)
+    else:
+        add_line("  characters : []", 2)
+
+    # Effects
+    add_line("  effects : []", 2)
+
+    # Monologues
+    if panel.monologues:
+        add_line("  monologues :", 2)
+        for mono in panel.monologues:
+            add_line(f'- text : "{mono.text}"', 3)
+            add_line(f'  text_position : "{mono.text_position}"', 3)
+            add_line(f'  balloon_shape : "{mono.balloon_shape}"', 3)
+    else:
+        add_line("  monologues : []", 2)
+
+    add_line(f'  camera_angle : "{panel.camera_angle}"', 2)
+    add_line("", 0) # パネル区切りの空行
+    return lines
+
+
+# --- コンパクト出力 ---
+# 画像生成モデルに渡す文字数を減らすための書き方。読み込んだ結果は通常の出力と同じ意味になる
+# （空のリスト objects / characters / effects / monologues / lines を書かない点だけが違う）。
+#   ・「key : "値"」の「:」の前の空白を書かない
+#   ・字下げは1段1文字、リストの「-」はキーと同じ深さに書く
+#   ・区切りの空行を書かない
+def _compact_settings_lines(page):
+    lines = [
+        "comic_page:",
+        f' language: "{page.language}"',
+        f' style: "{page.style}"',
+        f' writing-mode: "{page.writing_mode}"',
+        f' color_mode: "{page.color_mode}"',
+        f' aspect_ratio: "{page.aspect_ratio}"',
+        " instructions: |-",
+    ]
+    lines.extend(["  " + l for l in page.instructions.split("\n")])
+    lines.append(" layout_constraints: |-")
+    lines.extend(["  " + l for l in page.layout_constraints.split("\n")])
+    return lines
+
+
+def _compact_character_lines(page):
+    if not page.character_infos:
+        return []
+    lines = [" character_infos:"]
+    for char in page.character_infos:
+        lines.append(f' - name: "{char.name}"')
+        lines.append(f'   base_prompt: "{char.base_prompt}"')
+    return lines
+
+
+def _compact_panel_lines(panel, number):
+    lines = [
+        f' - number: {number}',
+        f'   page_position: "{panel.page_position}"',
+        f'   background: "{panel.background}"',
+        f'   description: "{panel.description}"',
+    ]
+    if panel.objects:
+        lines.append("   objects:")
+        for obj_name in panel.objects:
+            lines.append(f'   - name: "{obj_name}"')
+    if panel.characters:
+        lines.append("   characters:")
+        for p_char in panel.characters:
+            lines.append(f'   - name: "{p_char.name}"')
+            lines.append(f'     panel_position: "{p_char.panel_position}"')
+            lines.append(f'     emotion: "{p_char.emotion}"')
+            lines.append(f'     facing: "{p_char.facing}"')
+            lines.append(f'     shot: "{p_char.shot}"')
+            lines.append(f'     pose: "{p_char.pose}"')
+            if p_char.lines:
+                lines.append("     lines:")
+                for line in p_char.lines:
+                    lines.append(f'     - text: "{line.text}"')
+                    lines.append(f'       char_text_position: "{line.char_text_position}"')
+                    lines.append(f'       type: "{line.type}"')
+    if panel.monologues:
+        lines.append("   monologues:")
+        for mono in panel.monologues:
+            lines.append(f'   - text: "{mono.text}"')
+            lines.append(f'     text_position: "{mono.text_position}"')
+            lines.append(f'     balloon_shape: "{mono.balloon_shape}"')
+    lines.append(f'   camera_angle: "{panel.camera_angle}"')
+    return lines
+
+
+class PanelCache:
+    """
+    パネル1つ分のYAML断片を、パネルの内容をキーにして覚えておくキャッシュ
+    maxsize を超えたら一番長く使われていないものから捨てる (LRU)
+    number はキーに含めないので、パネル削除で番号がずれてもキャッシュは効く
+    通常の出力とコンパクト出力は別々に覚える（maxsize はそれぞれの上限）
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = {}
+        self._compact = {}
+
+    def __len__(self):
+        return len(self._data) + len(self._compact)
+
+    def clear(self):
+        self._data.clear()
+        self._compact.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(panel):
+        """
+        number 以外の内容（辞書のキー＝内容ハッシュとして使う）
+        Panel ならタプル、辞書ならバイト列にする
+        """
+        if isinstance(panel, Panel):
+            return panel.content_key()
+        items = [item for item in panel.items() if item[0] != "number"]
+        try:
+            # marshal は文字列化より数倍速い（version 2 は参照共有の有無で結果が変わらない）
+            return marshal.dumps(items, 2)
+        except ValueError:
+            # dict/list/str 以外が混ざっているとき
+            return repr(items)
+
+    def panel_chunk(self, panel, number, compact=False):
+        """
+        iter_yaml_chunks が返すのと同じ、パネル1つ分の断片を返す
+        panel は Panel でも辞書でもよい（辞書はキャッシュにないときだけ変換する）
+        """
+        key = self._key(panel)
+        data = self._compact if compact else self._data
+        # dict は挿入順を保つので、使うたびに入れ直して末尾＝最近使ったもの、にする
+        body = data.pop(key, None)
+        if body is None:
+            self.misses += 1
+            render = _compact_panel_lines if compact else _panel_lines
+            body = "\n".join(render(as_panel(panel), number)[1:])
+            if len(data) >= self.maxsize:
+                del data[next(iter(data))]
+        else:
+            self.hits += 1
+        data[key] = body
+        if compact:
+            return f'\n - number: {number}\n' + body
+        return f'\n    - number : {number}\n' + body
+
+
+def as_panel(panel):
+    """
+    Panel かパネルの辞書を Panel にする（Panel はそのまま返す）
+    """
+    if isinstance(panel, Panel):
+        return panel
+    return Panel.from_dict(panel)
+
+
+def page_and_panels(data):
+    """
+    Page か output_data の辞書から (ヘッダー用の Page, パネルのリスト) を取り出す
+    """
+    if isinstance(data, Page):
+        return data, data.panels
+    cp = data["comic_page"]
+    return Page.from_dict(cp, with_panels=False), cp["panels"]
+
+
+def iter_yaml_chunks(data, cache=None, anchors=None, compact=False):
+    """
+    YAML文字列をヘッダー → パネル1つずつ の順に少しずつ返すジェネレーター
+    全部つなげると make_yaml_text の結果と完全に同じになる
+    data は output_data の形の辞書か Page（辞書のパネルは1つずつ Panel に変換する）
+    cache に PanelCache を渡すと、前回と同じ内容のパネルは作り直さない
+    anchors に AnchorTable を渡すと、重複する長い文字列をエイリアスにする（このとき cache は使わない）
+    compact=True ならコンパクト出力にする
+    """
+    page, panels = page_and_panels(data)
+    if anchors is not None:
+        cache = None
+
+    chunk = header_text(page, bool(panels), compact=compact)
+    yield chunk if anchors is None else anchors.apply(chunk)
+    yield from iter_panel_chunks(panels, cache, anchors, compact)
+
+    if anchors is not None:
+        anchors.end_page()
+
+
+def header_text(page, with_panels=True, root="comic_page", compact=False):
+    """
+    パネルより前の部分（with_panels なら最後の「panels :」の行まで）
+    page は Page か、同じ属性を持つもの（Chapter など）。root は一番上のキー名
+    """
+    text = settings_text(page, compact)
+    if root != "comic_page":
+        text = (f"{root}:" if compact else f"{root} :") + text[text.index("\n"):]
+    chars = _compact_character_lines(page) if compact else _character_lines(page)
+    if chars:
+        text += "\n" + "\n".join(chars)
+    if with_panels:
+        text += "\n panels:" if compact else "\n  panels :"
+    return text
+
+
+def iter_panel_chunks(panels, cache=None, anchors=None, compact=False):
+    """
+    パネル部分を1つずつ返す（iter_yaml_chunks の2つ目以降の断片）
+    """
+    render = _compact_panel_lines if compact else _panel_lines
+    # 2つ目以降の断片は、直前の行の改行から始める
+    # number のないパネルは並び順で番号を振る
+    for position, panel in enumerate(panels, 1):
+        if isinstance(panel, Panel):
+            number = panel.number if panel.number is not None else position
+        else:
+            number = panel.get("number", position)
+        if cache is not None:
+            yield cache.panel_chunk(panel, number, compact)
+            continue
+        chunk = "\n" + "\n".join(render(as_panel(panel), number))
+        yield chunk if anchors is None else anchors.apply(chunk)
+
+
+# --- サイズの計測 ---
+def estimate_tokens(text):
+    """
+    トークン数のおおよその見積もり（実際の数はモデルのトークナイザーで変わる）
+    英数字・記号は4文字で1トークン、日本語などそれ以外は1文字1トークンとして数える
+    """
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return (ascii_chars + 3) // 4 + len(text) - ascii_chars
+
+
+def size_report(data, compact=False):
+    """
+    セクションごとのバイト数（UTF-8）と推定トークン数の辞書のリストを返す
+        [{"section": "header", "bytes": ..., "tokens": ...},
+         {"section": "character_infos", ...}, {"section": "panel 1", ...}, ...]
+    header は基本プロパティ・長文ブロックと「panels :」の行。全部のバイト数を足すと
+    make_yaml_text(data, compact=compact) のバイト数になる
+    """
+    page, panels = page_and_panels(data)
+    header = settings_text(page, compact)
+    if compact:
+        chars = _compact_character_lines(page)
+        if panels:
+            header += "\n panels:"
+    else:
+        chars = _character_lines(page)
+        if panels:
+            header += "\n  panels :"
+
+    report = []
+
+    def add(section, text):
+        report.append({"section": section, "bytes": len(text.encode()), "tokens": estimate_tokens(text)})
+
+    add("header", header)
+    if chars:
+        add("character_infos", "\n" + "\n".join(chars))
+    for i, chunk in enumerate(iter_panel_chunks(panels, compact=compact), 1):
+        add(f"panel {i}", chunk)
+    return report
+
+
+def as_list_item(yaml_text):
+    """
+    make_yaml_text の結果（またはその断片）を「- comic_page :」のリストの要素になるよう1段下げる
+    空行には空白を入れない
+    """
+    text = "\n".join(["  " + l if l else l for l in yaml_text.split("\n")])
+    if text.startswith("  comic_page"):
+        text = "- " + text[2:]
+    return text
+
+
+def iter_pages_chunks(pages, anchors=None):
+    """
+    複数ページを「- comic_page :」のリスト1つのYAML文書として少しずつ返す
+    同じ anchors を全ページで使うので、ページをまたいだ重複もエイリアスにできる
+    """
+    for i, page in enumerate(pages):
+        if i:
+            yield "\n"
+        for chunk in iter_yaml_chunks(page):
+            text = as_list_item(chunk)
+            yield text if anchors is None else anchors.apply(text)
+        if anchors is not None:
+            anchors.end_page()
+
+
+def write_yaml(data, stream, cache=None, anchors=None, compact=False):
+    """
+    YAMLをパネル単位で stream（ファイル・ソケットの makefile など write を持つもの）に書き出す
+    書き込んだ文字数を返す
+    """
+    total = 0
+    for chunk in iter_yaml_chunks(data, cache, anchors, compact):
+        stream.write(chunk)
+        total += len(chunk)
+    return total
+
+
+def make_yaml_text(data, cache=None, anchors=None, compact=False):
+    """
+    辞書データ (または Page) をYAML形式の文字列に変換する簡易関数
+    PyYAMLを使わずに整形を行う
+    """
+    return "".join(iter_yaml_chunks(data, cache, anchors, compact))
@@ -0,0 +1,318 @@
+"""
+make_yaml_text が書き出したYAMLを読み込んで、レコード (models.py) に戻す
+
+標準ライブラリだけで動く。YAMLの全機能ではなく、このツールが書き出す形だけを読む。
+    ・「key : "値"」「key: "値"」（コンパクト出力）、数値、[]、「|-」の長文ブロック
+    ・「- key : 値」で始まるリスト（「-」がキーより深くても同じ深さでもよい）
+    ・&アンカー と *エイリアス（--dedup / AnchorTable の出力）
+    ・「---」区切りの複数文書、「- comic_page :」のリスト（batch.py のまとめ出力）、
+      chapter の文書（chapter.py のまとめ出力）
+"値" の中はエスケープを解釈せず、最初と最後の " の間をそのまま値にする（書き出し側も何もエスケープしないため）。
+
+ファイルは1行ずつ読み、ページを1つ読み終えるたびに返すので、大きなファイルでも全体をメモリに載せない。
+
+使い方:
+    with open("prompts.yaml", encoding="utf-8") as f:
+        for page in iter_pages(f):
+            ...
+
+    python prompt_parser.py old/*.yaml -o pages.jsonl   # batch.py で読める JSONL にまとめる
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+
+from models import Chapter, Page
+from prompt_core import DEFAULT_PAGE_SETTINGS, fill_page_defaults
+
+# 行の字下げの代わりに入れる印
+_BLANK = -2       # 空行・コメント行
+_SEPARATOR = -1   # 文書の区切り「---」
+
+
+class ParseError(ValueError):
+    """
+    読めない形のYAML
+    """
+
+
+def _tokens(lines):
+    """
+    1行ずつ (字下げ, 「- 」で始まるか, キー, 値の文字列, 元の行, 行番号) に分ける
+    長文ブロックの本文は「元の行」の方を使う
+    """
+    for line_no, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        body = line.lstrip(" ")
+        if not body or body[0] == "#":
+            yield (_BLANK, False, None, None, line, line_no)
+            continue
+        indent = len(line) - len(body)
+        if body[0] == "-":
+            if indent == 0 and body == "---":
+                yield (_SEPARATOR, False, None, None, line, line_no)
+                continue
+            is_item = len(body) == 1 or body[1] == " "
+            if is_item:
+                body = body[2:]
+        else:
+            is_item = False
+        # キーに「:」は入らないので、最初の「: 」か行末の「:」がキーの終わり
+        key, sep, raw = body.partition(": ")
+        if sep:
+            yield (indent, is_item, key.rstrip(), raw.strip(), line, line_no)
+        elif body.endswith(":"):
+            yield (indent, is_item, body[:-1].rstrip(), "", line, line_no)
+        else:
+            yield (indent, is_item, None, body.strip(), line, line_no)
+
+
+class _Reader:
+    """
+    _tokens の結果を1つ先読みしながら読む
+    """
+
+    def __init__(self, lines):
+        # 終わりに達したら None を返す next
+        self._read = partial(next, _tokens(lines), None)
+        self.anchors = {}
+        self.tok = self._read()
+
+    def peek(self):
+        """
+        次の空行でない行を返す。ファイルの終わりなら None
+        """
+        tok = self.tok
+        while tok is not None and tok[0] == _BLANK:
+            tok = self.tok = self._read()
+        return tok
+
+    def skip(self):
+        """
+        peek した行を読み終えたことにする
+        """
+        self.tok = self._read()
+
+    def block(self, key_indent):
+        """
+        「|-」の長文ブロックの本文を読む（key_indent より深い行と空行が続くあいだ）
+        """
+        lines = []
+        tok = self.tok
+        while tok is not None and (tok[0] == _BLANK or tok[0] > key_indent):
+            lines.append(tok[4])
+            tok = self._read()
+        self.tok = tok
+        # |- なので最後の空行は捨てる
+        while lines and not lines[-1].strip():
+            lines.pop()
+        if not lines:
+            return ""
+        # 本文の字下げは一番浅い行に合わせる（最初の行が空白で始まる値もあるため）
+        cut = min([len(l) - len(l.lstrip(" ")) for l in lines if l.strip()])
+        return "\n".join([l[cut:] for l in lines])
+
+    def error(self, message):
+        line_no = self.tok[5] if self.tok is not None else "EOF"
+        return ParseError(f"line {line_no}: {message}")
+
+
+def _value(reader, raw, key_indent):
+    """
+    「key :」の後ろの文字列 raw を値にする。raw が空なら次の行からの入れ子を読む
+    """
+    if not raw:
+        tok = reader.peek()
+        if tok is None or tok[0] == _SEPARATOR:
+            return None
+        indent, is_item = tok[0], tok[1]
+        # 入れ子は1段深いか、コンパクト出力のように同じ深さの「- 」で始まるリスト
+        if indent > key_indent or (is_item and indent == key_indent):
+            return _node(reader)
+        return None
+    c = raw[0]
+    if c == '"':
+        return raw[1:-1]
+    if c == "|":
+        return reader.block(key_indent)
+    if c == "[":
+        if raw == "[]":
+            return []
+        raise reader.error(f"unsupported flow sequence: {raw}")
+    if c == "&":
+        name, _, rest = raw[1:].partition(" ")
+        value = _value(reader, rest.strip(), key_indent)
+        reader.anchors[name] = value
+        return value
+    if c == "*":
+        try:
+            return reader.anchors[raw[1:]]
+        except KeyError:
+            raise reader.error(f"unknown alias: {raw}") from None
+    if raw.isdigit():
+        return int(raw)
+    if raw == "null" or raw == "~":
+        return None
+    return raw
+
+
+def _node(reader):
+    """
+    次の行から始まるリストかマッピングを読む
+    """
+    tok = reader.peek()
+    if tok[1]:
+        return _sequence(reader, tok[0])
+    return _mapping(reader, tok[0], {})
+
+
+def _mapping(reader, indent, d):
+    """
+    字下げ indent の「key : 値」の行が続くあいだを d に入れる
+    """
+    peek = reader.peek
+    skip = reader.skip
+    while True:
+        tok = peek()
+        if tok is None or tok[0] != indent or tok[1]:
+            return d
+        skip()
+        key = tok[2]
+        if key is None:
+            raise reader.error(f"expected 'key : value': {tok[3]}")
+        raw = tok[3]
+        # ほとんどの行は "値" なので、関数を呼ばずに済ませる
+        if raw[:1] == '"':
+            d[key] = raw[1:-1]
+        else:
+            d[key] = _value(reader, raw, indent)
+
+
+def _item(reader):
+    """
+    「- 」で始まるリストの要素を1つ読む（次の行が「- 」を指していること）
+    """
+    indent, _, key, raw, _, _ = reader.peek()
+    reader.skip()
+    if key is None:
+        return _value(reader, raw, indent)
+    # 「- key : 値」の続きのキーは「- 」の2文字分深い位置に並ぶ
+    d = {key: _value(reader, raw, indent + 2)}
+    return _mapping(reader, indent + 2, d)
+
+
+def _sequence(reader, indent):
+    items = []
+    while True:
+        tok = reader.peek()
+        if tok is None or tok[0] != indent or not tok[1]:
+            return items
+        items.append(_item(reader))
+
+
+def iter_documents(lines):
+    """
+    YAMLの行（ファイルオブジェクトなど）から、最上位の値を1つずつ返す
+    「- 」で始まる最上位のリストは、要素を1つ読むたびに返す
+    """
+    reader = _Reader(lines)
+    while True:
+        tok = reader.peek()
+        if tok is None:
+            return
+        if tok[0] == _SEPARATOR:
+            reader.skip()
+            # アンカーは文書ごと
+            reader.anchors = {}
+            continue
+        if tok[1]:
+            indent = tok[0]
+            while True:
+                yield _item(reader)
+                tok = reader.peek()
+                if tok is None or tok[0] != indent or not tok[1]:
+                    break
+        else:
+            yield _mapping(reader, tok[0], {})
+        tok = reader.peek()
+        if tok is not None and tok[0] != _SEPARATOR:
+            raise reader.error(f"unexpected line: {tok[2] or tok[3]}")
+
+
+def page_from_dict(cp):
+    """
+    読み込んだ comic_page の辞書を Page にする
+    コンパクト出力で省かれた空のリストや、書かれていない基本設定は補う
+    """
+    return Page.from_dict(fill_page_defaults(cp))
+
+
+def chapter_from_dict(ch):
+    data = dict(DEFAULT_PAGE_SETTINGS)
+    data["character_infos"] = []
+    data["pages"] = []
+    data.update(ch)
+    data["pages"] = [{"panels": pg.get("panels") or []} for pg in data["pages"] or []]
+    return Chapter.from_dict(data)
+
+
+def iter_pages(lines):
+    """
+    YAMLの行から Page を1つずつ返す
+    comic_page の文書・そのリスト・chapter の文書（各ページを Page にする）を読める
+    """
+    for doc in iter_documents(lines):
+        if not isinstance(doc, dict):
+            raise ParseError(f"expected comic_page or chapter, got {type(doc).__name__}")
+        if "comic_page" in doc:
+            yield page_from_dict(doc["comic_page"] or {})
+        elif "chapter" in doc:
+            chapter = chapter_from_dict(doc["chapter"] or {})
+            for i in range(len(chapter.pages)):
+                yield chapter.page(i)
+        else:
+            raise ParseError("expected comic_page or chapter")
+
+
+def parse_page(text):
+    """
+    make_yaml_text の結果1つ分の文字列を Page に戻す
+    """
+    pages = list(iter_pages(text.split("\n")))
+    if len(pages) != 1:
+        raise ParseError(f"expected 1 page, got {len(pages)}")
+    return pages[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="このツールで作ったYAMLを読み込み、batch.py で使える JSONL に変換する")
+    parser.add_argument("input", nargs="+", help="YAMLファイル（複数可）")
+    parser.add_argument("-o", "--output", default="-", help="書き出す JSONL ファイル (既定: 標準出力)")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    count = 0
+    size = 0
+    start = time.perf_counter()
+    try:
+        for path in args.input:
+            size += os.path.getsize(path)
+            with open(path, encoding="utf-8") as f:
+                for page in iter_pages(f):
+                    out.write(json.dumps({"comic_page": page.to_dict()}, ensure_ascii=False) + "\n")
+                    count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = size / 1e6 / elapsed if elapsed > 0 else 0.0
+    print(f"{count} pages from {size / 1e6:.1f} MB in {elapsed:.2f}s ({rate:.1f} MB/s)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+変更しても元のデータが残る（永続的な）リスト
+
+中身は各ノードに乱数の優先度を持たせた平衡二分木（treap）。
+挿入・削除・切り出し・連結は新しいノードを O(log n) 個作るだけで、残りのノードは
+変更前のリストと共有する。元に戻す履歴で状態を丸ごとコピーせずに済むようにするためのもの。
+"""
+
+import random
+
+_rand = random.Random(0x6D616E6761).random
+
+
+class _Node:
+    __slots__ = ("value", "prio", "left", "right", "size")
+
+    def __init__(self, value, prio, left, right):
+        self.value = value
+        self.prio = prio
+        self.left = left
+        self.right = right
+        self.size = 1 + (left.size if left else 0) + (right.size if right else 0)
+
+
+def _merge(a, b):
+    """
+    a の後ろに b をつなげた木
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio > b.prio:
+        return _Node(a.value, a.prio, a.left, _merge(a.right, b))
+    return _Node(b.value, b.prio, _merge(a, b.left), b.right)
+
+
+def _split(node, k):
+    """
+    先頭 k 個の木と残りの木に分ける
+    """
+    if node is None:
+        return None, None
+    left_size = node.left.size if node.left else 0
+    if k <= left_size:
+        a, b = _split(node.left, k)
+        return a, _Node(node.value, node.prio, b, node.right)
+    a, b = _split(node.right, k - left_size - 1)
+    return _Node(node.value, node.prio, node.left, a), b
+
+
+def _build(values):
+    """
+    並び順どおりの木を O(n) で作る（右端のノードをスタックで持ちながら積み上げる）
+    """
+    stack = []
+    for value in values:
+        node = _Node(value, _rand(), None, None)
+        last = None
+        while stack and stack[-1].prio < node.prio:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    if not stack:
+        return None
+    _fix_sizes(stack[0])
+    return stack[0]
+
+
+def _fix_sizes(root):
+    # 作りたての木のサイズを下から計算し直す（再帰が深くならないようにスタックで回る）
+    order = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        order.append(node)
+        if node.left:
+            stack.append(node.left)
+        if node.right:
+            stack.append(node.right)
+    for node in reversed(order):
+        node.size = 1 + (node.left.size if node.left else 0) + (node.right.size if node.right else 0)
+
+
+class PVector:
+    """
+    永続的なリスト
+    変更するメソッドはすべて新しい PVector を返し、自分自身は変わらない
+    """
+    __slots__ = ("_root",)
+
+    def __init__(self, values=()):
+        self._root = _build(values)
+
+    @classmethod
+    def _of(cls, root):
+        v = cls.__new__(cls)
+        v._root = root
+        return v
+
+    def __len__(self):
+        return self._root.size if self._root else 0
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            yield node.value
+            node = node.right
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self.slice(start, stop)
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("PVector index out of range")
+        node = self._root
+        while True:
+            left_size = node.left.size if node.left else 0
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.value
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def __eq__(self, other):
+        if isinstance(other, PVector):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self):
+        return f"PVector({list(self)!r})"
+
+    def _index(self, index):
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("PVector index out of range")
+        return index
+
+    # --- 変更（新しい PVector を返す） ---
+    def append(self, value):
+        return PVector._of(_merge(self._root, _Node(value, _rand(), None, None)))
+
+    def insert(self, index, value):
+        return self.insert_all(index, PVector._of(_Node(value, _rand(), None, None)))
+
+    def insert_all(self, index, other):
+        """
+        index の位置に other（PVector）の中身をまとめて挿入する
+        """
+        a, b = _split(self._root, index)
+        return PVector._of(_merge(_merge(a, other._root), b))
+
+    def set(self, index, value):
+        index = self._index(index)
+        a, rest = _split(self._root, index)
+        _, b = _split(rest, 1)
+        return PVector._of(_merge(_merge(a, _Node(value, _rand(), None, None)), b))
+
+    def delete(self, index):
+        index = self._index(index)
+        return self.delete_range(index, index + 1)
+
+    def delete_range(self, start, stop):
+        a, rest = _split(self._root, start)
+        _, b = _split(rest, stop - start)
+        return PVector._of(_merge(a, b))
+
+    def slice(self, start, stop):
+        _, rest = _split(self._root, start)
+        a, _ = _split(rest, stop - start)
+        return PVector._of(a)
+
+    def concat(self, other):
+        return PVector._of(_merge(self._root, other._root))
@@ -0,0 +1,241 @@
+"""
+台本（テキスト / CSV）からパネルを作る
+
+テキストの台本は1行ずつ次のように読む（前後の空白は無視する）。
+    ---  または  # 説明        パネルの区切り。# のあとの文字はそのパネルの description になる
+    aichan: なのばなな…ぷろ？  セリフ（「:」は全角の「：」でもよい）
+    aichan「なのばなな…ぷろ？」 セリフ（かぎかっこで囲んだ書き方）
+    （彼女の旅は続く）          モノローグ（丸かっこで囲んだ行）
+    それ以外の行               ト書き。そのパネルの description に空白でつなげる
+空行は読み飛ばす。最初の区切りより前の行は1つ目のパネルになる。
+
+CSV の台本は panel / speaker / text の列を持つ（見出しの行が必要）。
+panel の値が変わったところでパネルを区切り、speaker が空の行はテキストと同じく
+丸かっこならモノローグ、それ以外はト書きにする。
+
+話者の名前は character_infos の名前と、全角・半角や大文字・小文字の違いを無視して照らし合わせ、
+登録されている書き方にそろえる（名前 -> 登録名 の辞書を1回だけ作って引く）。
+登録されていない名前はそのまま使い、unknown に数えておく。
+同じパネルで話す人の char_text_position は話した順に決める。vertical-rl は右から
+（先に読ませたいセリフほど右）、horizontal-tb は左から並べる。
+
+ファイルは1行ずつ読み、パネルも1つずつ返すので、台本が長くても（5万行でも）
+手元に持つのは作りかけのパネル1つ分だけになる。
+コマンドラインから使うと、パネルを --per-page 個ずつのページにして batch.py の入力（JSONL）を書き出す。
+
+使い方:
+    importer = ScriptImporter(page.character_infos)
+    with open("script.txt", encoding="utf-8") as f:
+        for panel in importer.iter_panels(f):
+            ...
+    python script_import.py script.txt -o pages.jsonl --cast school --per-page 6
+"""
+
+import argparse
+import csv
+import json
+import re
+import sys
+
+from character_library import CharacterLibrary
+from models import Line, Monologue, Panel, PanelCharacter
+from search import normalize
+
+# 話者の名前として読む長さの上限（これより長い「:」の前はト書きの一部とみなす）
+MAX_SPEAKER_LENGTH = 20
+_SPEECH = re.compile(rf"^([^:：「」]{{1,{MAX_SPEAKER_LENGTH}}}?)\s*(?:[:：]\s*(.*)|「(.*)」)$")
+_MONOLOGUE = re.compile(r"^[（(](.*)[)）]$")
+# 話した順の char_text_position（vertical-rl の場合。horizontal-tb は逆順に使う）
+TEXT_POSITIONS = {1: ("right",), 2: ("right", "left"), 3: ("right", "center", "left")}
+
+
+def parse_line(line):
+    """
+    テキストの台本の1行を (種類, 値...) にする。空行は None
+        ("panel", 説明)  ("line", 話者, セリフ)  ("monologue", 文)  ("direction", ト書き)
+    """
+    line = line.strip()
+    if not line:
+        return None
+    if line == "---":
+        return ("panel", "")
+    if line.startswith("#"):
+        return ("panel", line[1:].strip())
+    return _parse_text(line)
+
+
+def _parse_text(text):
+    found = _MONOLOGUE.match(text)
+    if found:
+        return ("monologue", found.group(1).strip())
+    found = _SPEECH.match(text)
+    if found:
+        speech = found.group(2) if found.group(2) is not None else found.group(3)
+        return ("line", found.group(1).strip(), speech.strip())
+    return ("direction", text)
+
+
+def iter_text_events(lines):
+    for line in lines:
+        event = parse_line(line)
+        if event is not None:
+            yield event
+
+
+def iter_csv_events(f):
+    """
+    CSV の台本（panel / speaker / text 列）を parse_line と同じ形にして1つずつ返す
+    """
+    current = None
+    for row in csv.DictReader(f):
+        panel = (row.get("panel") or "").strip()
+        if panel and panel != current:
+            if current is not None:
+                yield ("panel", "")
+            current = panel
+        speaker = (row.get("speaker") or "").strip()
+        text = (row.get("text") or "").strip()
+        if speaker:
+            yield ("line", speaker, text)
+        elif text:
+            yield _parse_text(text)
+
+
+def text_positions(count, writing_mode="vertical-rl"):
+    """
+    count 人が話すときの、話した順の char_text_position
+    """
+    positions = TEXT_POSITIONS.get(count)
+    if positions is None:
+        # 4人以上は両端を先に埋め、残りを中央にする
+        positions = ("right",) + ("center",) * (count - 2) + ("left",)
+    if writing_mode == "horizontal-tb":
+        positions = tuple(reversed(positions))
+    return positions
+
+
+class ScriptImporter:
+    """
+    登録キャラクターの一覧ごとに作る。lines_read は読んだ行（イベント）の数、
+    unknown は登録されていない話者の名前 -> 出てきた回数
+    """
+
+    def __init__(self, character_infos=(), writing_mode="vertical-rl"):
+        # 正規化した名前 -> 登録名
+        self.speakers = {normalize(c.name).strip(): c.name for c in character_infos if c.name}
+        self.writing_mode = writing_mode
+        self.lines_read = 0
+        self.unknown = {}
+
+    def resolve(self, name):
+        """
+        登録されている書き方の名前。登録されていなければ name のまま（unknown に数える）
+        """
+        found = self.speakers.get(normalize(name).strip())
+        if found is None:
+            self.unknown[name] = self.unknown.get(name, 0) + 1
+            return name
+        return found
+
+    def iter_panels(self, f, csv_format=False):
+        """
+        台本のファイル（1行ずつ読めるもの）から Panel を1つずつ返す
+        """
+        events = iter_csv_events(f) if csv_format else iter_text_events(f)
+        return self.iter_panels_from_events(events)
+
+    def iter_panels_from_events(self, events):
+        description = []
+        # 登録名 -> PanelCharacter（話した順）
+        speakers = {}
+        monologues = []
+        for event in events:
+            self.lines_read += 1
+            kind = event[0]
+            if kind == "line":
+                name = self.resolve(event[1])
+                char = speakers.get(name)
+                if char is None:
+                    char = speakers[name] = PanelCharacter(name=name)
+                char.lines.append(Line(event[2]))
+            elif kind == "monologue":
+                monologues.append(Monologue(event[1]))
+            elif kind == "direction":
+                description.append(event[1])
+            elif kind == "panel":
+                if description or speakers or monologues:
+                    yield self._panel(description, speakers, monologues)
+                description = [event[1]] if event[1] else []
+                speakers = {}
+                monologues = []
+        if description or speakers or monologues:
+            yield self._panel(description, speakers, monologues)
+
+    def _panel(self, description, speakers, monologues):
+        characters = list(speakers.values())
+        for char, position in zip(characters, text_positions(len(characters), self.writing_mode)):
+            for line in char.lines:
+                line.char_text_position = position
+        return Panel(description=" ".join(description), characters=characters, monologues=monologues)
+
+
+def iter_pages(panels, per_page):
+    """
+    パネルを per_page 個ずつのリストにして返す
+    """
+    page = []
+    for panel in panels:
+        page.append(panel)
+        if len(page) >= per_page:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="台本（テキスト / CSV）からパネルを作り、batch.py の入力 (JSONL) を書き出す")
+    parser.add_argument("input", help="台本のファイル (.txt / .csv、- で標準入力)")
+    parser.add_argument("-o", "--output", default="-", help="書き出す JSONL (既定: 標準出力)")
+    parser.add_argument("--cast", help="話者を照らし合わせるキャスト名 (character_library.py)")
+    parser.add_argument("--per-page", type=int, default=6, help="1ページのパネル数 (既定: 6)")
+    parser.add_argument("--writing-mode", default="vertical-rl", choices=["vertical-rl", "horizontal-tb"],
+                        help="セリフの並べ方 (既定: vertical-rl)")
+    args = parser.parse_args(argv)
+
+    characters = ()
+    if args.cast:
+        try:
+            characters = CharacterLibrary().get(args.cast)
+        except (KeyError, ValueError) as e:
+            parser.error(f"キャスト {args.cast} を読み込めませんでした: {e}")
+    importer = ScriptImporter(characters, args.writing_mode)
+
+    src = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", newline="")
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    n_panels = n_pages = 0
+    try:
+        panels = importer.iter_panels(src, csv_format=args.input.lower().endswith(".csv"))
+        for page in iter_pages(panels, args.per_page):
+            record = {"comic_page": {
+                "writing-mode": args.writing_mode,
+                "character_infos": [c.to_dict() for c in characters],
+                "panels": [p.to_dict(i) for i, p in enumerate(page, 1)],
+            }}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            n_panels += len(page)
+            n_pages += 1
+    finally:
+        if src is not sys.stdin:
+            src.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{importer.lines_read} lines -> {n_panels} panels in {n_pages} pages", file=sys.stderr)
+    for name, count in sorted(importer.unknown.items(), key=lambda item: -item[1]):
+        print(f"登録されていない話者: {name} ({count} 回)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+パネルの全文検索
+
+description・background・セリフ (lines[].text)・モノローグ・キャラクター名を、
+文字の2-gram（2文字ずつ）の転置インデックスで検索する。日本語は単語の区切りがないので、
+単語ではなく2文字の並びで引く（英数字も同じ扱いで、部分一致になる）。
+全角・半角や大文字・小文字の違いは NFKC と casefold でそろえる。
+
+空白で区切った語はすべて含むパネルを探す（AND）。2-gram で候補を絞ったあと、
+実際に文字列を含むかを確かめるので、結果に余計なものは入らない。
+1文字だけの語は 2-gram で引けないので、全パネルの文字列をそのまま調べる。
+
+インデックスはパネルのオブジェクトごとに作る。sync に今のパネル一覧を渡すと、
+前回から増えたパネルだけを登録し、消えたパネルだけを取り除く（パネルは書き換えられず、
+project.py の操作で置き換えられるので、オブジェクトが同じなら内容も同じ）。
+
+使い方:
+    index = SearchIndex()
+    index.sync(project.panels)
+    for position, panel, field, text in index.search("なのばなな"):
+        ...
+"""
+
+import re
+import unicodedata
+
+# 検索の区切りにしない文字（\w は漢字・かな・長音符・英数字を含む）
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text):
+    """
+    全角英数と半角カナをそろえ、大文字と小文字を区別しないようにする
+    """
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def _grams(words):
+    """
+    語のリストの 2-gram の集合（1文字の語は含めない）
+    """
+    grams = set()
+    for w in words:
+        grams.update([w[i:i + 2] for i in range(len(w) - 1)])
+    return grams
+
+
+def panel_fields(panel):
+    """
+    検索する (項目名, 文字列) のリスト
+    """
+    fields = [("description", panel.description), ("background", panel.background)]
+    for c in panel.characters:
+        if c.name:
+            fields.append(("name", c.name))
+        for l in c.lines:
+            fields.append(("セリフ", l.text))
+    for m in panel.monologues:
+        fields.append(("モノローグ", m.text))
+    return fields
+
+
+class SearchIndex:
+    """
+    2-gram -> その2文字を含むパネルの id の集合
+    """
+
+    def __init__(self):
+        self._postings = {}
+        # id(panel) -> (panel, 正規化した文字列をつないだもの)
+        # パネルへの参照を持っているので、登録中の id が別のパネルに使い回されることはない
+        self._panels = {}
+        # 最後に sync したパネル一覧と、その中での id(panel) -> 位置、並び順の id のリスト
+        self._synced = None
+        self._positions = {}
+        self._order = []
+
+    def __len__(self):
+        return len(self._panels)
+
+    def add(self, panel):
+        key = id(panel)
+        if key in self._panels:
+            return
+        text = "\n".join([normalize(t) for _, t in panel_fields(panel) if t])
+        grams = _grams(_WORD.findall(text))
+        postings = self._postings
+        for g in grams:
+            ids = postings.get(g)
+            if ids is None:
+                postings[g] = {key}
+            else:
+                ids.add(key)
+        # 2-gram はパネルごとに持たず、取り除くときに text から作り直す（メモリを食うので）
+        self._panels[key] = (panel, text)
+
+    def remove(self, panel_id):
+        entry = self._panels.pop(panel_id, None)
+        if entry is None:
+            return
+        postings = self._postings
+        for g in _grams(_WORD.findall(entry[1])):
+            ids = postings[g]
+            ids.discard(panel_id)
+            if not ids:
+                del postings[g]
+
+    def sync(self, panels):
+        """
+        インデックスを panels に合わせる（増えたパネルを登録し、消えたパネルを取り除く）
+        同じ一覧で続けて呼んだときは何もしない
+        """
+        if panels is self._synced:
+            return
+        order = [id(p) for p in panels]
+        positions = {key: i for i, key in enumerate(order)}
+        for key in [k for k in self._panels if k not in positions]:
+            self.remove(key)
+        if len(self._panels) != len(positions):
+            for p in panels:
+                self.add(p)
+        self._synced = panels
+        self._positions = positions
+        self._order = order
+
+    def search(self, query, limit=None):
+        """
+        (位置, パネル, 最初に見つかった項目名, その項目の文字列) のリストを位置の順に返す
+        位置は最後に sync した一覧での 0 始まりの位置。limit があれば前から limit 件まで
+        """
+        words = _WORD.findall(normalize(query))
+        if not words:
+            return []
+        grams = _grams(words)
+        if grams:
+            # 含むパネルの少ない 2-gram から絞り込む
+            sets = sorted([self._postings.get(g, ()) for g in grams], key=len)
+            if not sets[0]:
+                return []
+            candidates = set(sets[0])
+            for ids in sets[1:]:
+                candidates.intersection_update(ids)
+                if not candidates:
+                    return []
+            positions = self._positions
+            ordered = sorted([positions[k] for k in candidates if k in positions])
+            order = self._order
+            keys = [order[i] for i in ordered]
+            # 2文字の語1つなら、2-gram が一致した時点で含んでいる
+            exact = len(words) == 1 and len(words[0]) == 2
+        else:
+            # 1文字の語だけのときは 2-gram で引けないので、全パネルを順に調べる
+            keys = self._order
+            exact = False
+
+        panels = self._panels
+        positions = self._positions
+        results = []
+        for key in keys:
+            panel, text = panels[key]
+            if not exact and not all(w in text for w in words):
+                continue
+            field, value = next(((f, t) for f, t in panel_fields(panel) if words[0] in normalize(t)), ("", ""))
+            results.append((positions[key], panel, field, value))
+            if limit is not None and len(results) >= limit:
+                break
+        return results
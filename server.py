@@ -0,0 +1,304 @@
+"""
+ローカルで動くYAML生成の HTTP サービス
+
+画面を使わない他のツールから、画面と同じYAMLを作れるようにする。標準ライブラリ (asyncio) だけで動き、
+ネットワークには出ない（既定では 127.0.0.1 でだけ待ち受ける）。
+
+    POST /page      {"comic_page": {...}}   → YAML（batch.py の入力の1行と同じ形。省略した基本設定は既定値で埋める）
+                    ?compact=1 でコンパクト出力、?dedup=1 で重複する長文をアンカーにする
+                    ?format=json / ndjson で JSON（formats.py。ndjson はパネル1つを1行）
+    POST /chapter   {"chapter": {...}}      → chapter.py のまとめ出力と同じYAMLを、ページごとに chunked で送る
+    GET  /health    → ok
+
+HTTP/1.1 の keep-alive に対応していて、1本の接続で続けてリクエストを送れる。
+生成は CPU を使う処理なのでイベントループの中でそのまま行い、章はページごとに他の接続に順番を譲る。
+パネルの断片のキャッシュ (PanelCache) は全リクエストで共有する。
+複数コアを使うときは --processes で同じポートを待ち受けるプロセスを増やす（Linux の SO_REUSEPORT）。
+
+使い方:
+    python server.py                       # http://127.0.0.1:8765
+    python server.py --port 9000 --processes 4
+    curl -s --data-binary @page.json http://127.0.0.1:8765/page
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from multiprocessing import Process
+from urllib.parse import parse_qs, urlsplit
+
+from batch import record_to_page
+from chapter import iter_combined
+from formats import CONTENT_TYPES, FORMATS, render
+from prompt_core import AnchorTable, PanelCache, make_yaml_text
+from prompt_parser import chapter_from_dict
+
+DEFAULT_PORT = 8765
+# リクエストの本文の上限（バイト）
+MAX_BODY = 10 * 1024 * 1024
+# keep-alive の接続で次のリクエストを待つ秒数
+IDLE_TIMEOUT = 30
+# リクエスト行が来てから、ヘッダーと本文を読み終えるまでの秒数
+REQUEST_TIMEOUT = 30
+MAX_HEADERS = 100
+
+YAML_TYPE = "application/yaml; charset=utf-8"
+TEXT_TYPE = "text/plain; charset=utf-8"
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+    431: "Request Header Fields Too Large",
+    501: "Not Implemented",
+}
+
+
+class HTTPError(Exception):
+    """
+    エラーの応答にする例外（status と、本文にするメッセージ）
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def _readline(reader):
+    """
+    1行読む。StreamReader の上限より長い行は 431 にする
+    """
+    try:
+        return await reader.readline()
+    except ValueError:
+        # readline は上限を超えた行を LimitOverrunError ではなく ValueError にして投げる
+        raise HTTPError(431, "header line too long") from None
+
+
+async def read_request(reader):
+    """
+    リクエストを1つ読んで (メソッド, パス, クエリの辞書, ヘッダーの辞書, 本文) を返す
+    接続が閉じられたか、IDLE_TIMEOUT 秒なにも来なければ None
+    リクエスト行のあと REQUEST_TIMEOUT 秒でヘッダーと本文を読み終えなければ 408 にする
+    """
+    try:
+        line = await asyncio.wait_for(_readline(reader), IDLE_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        raise HTTPError(400, "bad request line")
+    method, target, version = parts
+    try:
+        # 1行ずつではなく全体で区切るので、少しずつ送ってくる相手にも接続を取られ続けない
+        headers, body = await asyncio.wait_for(_read_headers_and_body(reader, version), REQUEST_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPError(408, "request was not received in time") from None
+
+    url = urlsplit(target)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    return method, url.path, query, headers, body
+
+
+async def _read_headers_and_body(reader, version):
+    headers = {}
+    while True:
+        line = await _readline(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+        if len(headers) > MAX_HEADERS:
+            raise HTTPError(400, "too many headers")
+    # HTTP/1.0 は Connection: keep-alive があるときだけ、HTTP/1.1 は Connection: close がなければ続ける
+    connection = headers.get("connection", "").lower()
+    headers["keep-alive"] = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+
+    if "transfer-encoding" in headers:
+        raise HTTPError(501, "chunked request bodies are not supported")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "bad Content-Length") from None
+    if length > MAX_BODY:
+        raise HTTPError(413, f"body is larger than {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return headers, body
+
+
+def response_head(status, content_type, keep_alive, length=None):
+    """
+    応答の先頭（ステータス行とヘッダー）。length が None なら chunked で送る
+    """
+    lines = [
+        f"HTTP/1.1 {status} {REASONS[status]}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked",
+        "Connection: keep-alive" if keep_alive else "Connection: close",
+    ]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send(writer, status, text, content_type=TEXT_TYPE, keep_alive=True):
+    body = text.encode("utf-8")
+    writer.write(response_head(status, content_type, keep_alive, len(body)) + body)
+    await writer.drain()
+
+
+def _flag(query, name):
+    return query.get(name, "0").lower() in ("1", "true", "yes")
+
+
+def _decode(body):
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPError(400, "body is not UTF-8") from None
+
+
+class PromptServer:
+    """
+    接続ごとに handle が呼ばれる。requests は処理したリクエストの数
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache if cache is not None else PanelCache()
+        self.requests = 0
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    # どこまで読んだか分からないので、この接続は閉じる
+                    await send(writer, e.status, e.message + "\n", keep_alive=False)
+                    break
+                if request is None:
+                    break
+                self.requests += 1
+                method, path, query, headers, body = request
+                keep_alive = headers["keep-alive"]
+                try:
+                    keep_alive = await self.dispatch(writer, method, path, query, body, keep_alive)
+                except HTTPError as e:
+                    await send(writer, e.status, e.message + "\n", keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def dispatch(self, writer, method, path, query, body, keep_alive):
+        """
+        リクエストを処理して応答を送る。接続を続けられるかを返す
+        """
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "use GET")
+            await send(writer, 200, "ok\n", keep_alive=keep_alive)
+            return keep_alive
+        if path not in ("/page", "/chapter"):
+            raise HTTPError(404, f"no such path: {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        if path == "/page":
+            text, content_type = self.render_page(_decode(body), query)
+            await send(writer, 200, text, content_type, keep_alive)
+            return keep_alive
+        return await self.stream_chapter(writer, _decode(body), keep_alive)
+
+    def render_page(self, text, query):
+        """
+        (応答の本文, Content-Type) を返す
+        YAMLはパネルの断片のキャッシュを使える make_yaml_text で、JSON は formats.render で作る
+        """
+        fmt = query.get("format", "compact" if _flag(query, "compact") else "yaml")
+        if fmt not in FORMATS:
+            raise HTTPError(400, f"unknown format: {fmt} (choose from {', '.join(FORMATS)})")
+        anchors = AnchorTable() if _flag(query, "dedup") else None
+        try:
+            _, page = record_to_page(text)
+            if fmt in ("yaml", "compact"):
+                return make_yaml_text(page, self.cache, anchors, fmt == "compact"), YAML_TYPE
+            return render(page, (fmt,))[fmt], CONTENT_TYPES[fmt]
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise HTTPError(400, f"{type(e).__name__}: {e}") from None
+
+    async def stream_chapter(self, writer, text, keep_alive):
+        try:
+            chapter = chapter_from_dict(json.loads(text)["chapter"])
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise HTTPError(400, f"{type(e).__name__}: {e}") from None
+
+        writer.write(response_head(200, YAML_TYPE, keep_alive))
+        try:
+            for chunk in iter_combined(chapter):
+                data = chunk.encode("utf-8")
+                writer.write(f"{len(data):X}\r\n".encode("latin-1") + data + b"\r\n")
+                await writer.drain()
+                # 大きな章のあいだも他の接続を待たせない
+                await asyncio.sleep(0)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # 送り始めた後はエラーの応答にできないので、最後のチャンクを送らずに切る
+            return False
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, reuse_port=False, ready=None):
+    """
+    サーバーを起動して止められるまで動かす。ready があれば待ち受けを始めたときに set する
+    """
+    server = PromptServer()
+    srv = await asyncio.start_server(server.handle, host, port, reuse_port=reuse_port or None)
+    if ready is not None:
+        ready.set()
+    async with srv:
+        await srv.serve_forever()
+
+
+def run(host="127.0.0.1", port=DEFAULT_PORT, reuse_port=False, ready=None):
+    try:
+        asyncio.run(serve(host, port, reuse_port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="YAMLプロンプトを生成するローカル HTTP サービス")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス (既定: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"ポート番号 (既定: {DEFAULT_PORT})")
+    parser.add_argument("--processes", type=int, default=1, help="同じポートを待ち受けるプロセス数 (既定: 1)")
+    args = parser.parse_args(argv)
+
+    print(f"listening on http://{args.host}:{args.port} ({args.processes} process)", file=sys.stderr)
+    if args.processes <= 1:
+        run(args.host, args.port)
+        return 0
+    procs = [Process(target=run, args=(args.host, args.port, True)) for _ in range(args.processes)]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        for p in procs:
+            p.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import os
+import random
+import sys
+
+# テストはリポジトリの直下のモジュールを import する
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import CharacterInfo, Line, Monologue, Page, Panel, PanelCharacter  # noqa: E402
+from prompt_core import INSTRUCTIONS_BLOCK, LAYOUT_CONSTRAINTS_BLOCK  # noqa: E402
+
+
+# --- 架空のプロジェクト ---
+NAMES = ["aichan", "kouhai", "sensei", "るー", "ナノ"]
+LINES = [
+    "なのばなな…ぷろ？",
+    "え、もう締め切り明日なの！？",
+    "大丈夫、私に任せて。",
+    "……。",
+    "ちょっと待って、そのプロンプトもう一回見せて！",
+    "今日こそ完成させるんだから。",
+    "すごい…本当にこの絵が一瞬で？",
+    "まあまあね。",
+]
+BACKGROUNDS = ["暗い部屋に煌々と光るPCの画面", "放課後の教室", "夕暮れの帰り道", "ファミレスの窓際の席", ""]
+DESCRIPTIONS = ["ナノバナナProが世間を賑わしている", "主人公が驚いている", "二人が言い合いをしている", "静かな時間が流れる"]
+POSITIONS = ["top", "middle", "bottom", "top-right", "top-left", "bottom-right", "bottom-left"]
+SHOTS = ["バストアップ", "顔のアップ", "全身", "ニーアップ"]
+
+
+def make_project(n_panels, seed=0):
+    """
+    n_panels 個のパネルを持つ架空の Page を作る（同じ引数なら毎回同じ内容）
+    """
+    r = random.Random(seed)
+    chars = [CharacterInfo(n, f"1girl, solo, {n}, long hair, school uniform, smiling, detailed eyes") for n in NAMES]
+    panels = []
+    for i in range(n_panels):
+        p_chars = []
+        for _ in range(r.randint(0, 3)):
+            lines = [Line(r.choice(LINES), r.choice(["right", "center", "left"]), "speech")]
+            if r.random() < 0.2:
+                # セリフのみ
+                p_chars.append(PanelCharacter(name=r.choice(NAMES), lines=lines))
+            else:
+                p_chars.append(PanelCharacter(
+                    name=r.choice(NAMES),
+                    panel_position=r.choice(["center", "left", "right"]),
+                    facing="泣きながらモニターを見つめている",
+                    shot=r.choice(SHOTS),
+                    lines=lines if r.random() < 0.8 else [],
+                ))
+        monos = [Monologue("彼女の旅は続くのであった")] if r.random() < 0.2 else []
+        objects = ["モニター", "スマホ"] if r.random() < 0.4 else []
+        panels.append(Panel(i + 1, r.choice(POSITIONS), r.choice(BACKGROUNDS), r.choice(DESCRIPTIONS),
+                            objects, p_chars, [], monos, "from side, front"))
+    return Page("Japanese", "japanese syonen manga", "vertical-rl", "白黒", "1:1.41",
+                INSTRUCTIONS_BLOCK, LAYOUT_CONSTRAINTS_BLOCK, chars, panels)
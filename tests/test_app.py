@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+from conftest import make_project  # noqa: E402
+from history import History  # noqa: E402
+from project import Project  # noqa: E402
+
+INDEX = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "index.py")
+FRAGMENTS = {"panel_builder", "panel_list", "script_importer", "generation_tab"}
+
+
+def _app(n_panels=5):
+    page = make_project(n_panels, seed=n_panels)
+    at = AppTest.from_file(INDEX, default_timeout=60)
+    at.session_state["history"] = History(Project(page.character_infos, page.panels))
+    at.run()
+    return at
+
+
+def test_fragments_run():
+    at = _app()
+    assert not at.exception
+    phases = {row["phase"] for row in at.session_state["timings"].rows()}
+    assert FRAGMENTS <= phases
+
+
+def test_generate_and_debug_panel():
+    at = _app()
+    for b in at.button:
+        if b.label == "YAMLを生成する":
+            b.click()
+    at.run()
+    assert not at.exception
+    assert any("comic_page" in c.value for c in at.code)
+    assert "make_yaml_text" in {row["phase"] for row in at.session_state["timings"].rows()}
+
+    at.checkbox(key="debug_timing").check().run()
+    assert not at.exception
+    assert at.sidebar.dataframe
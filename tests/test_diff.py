@@ -0,0 +1,79 @@
+import copy
+
+import pytest
+
+from conftest import make_project
+from diff import apply_patch, apply_patch_to_store, diff, load_patch, make_patch, save_patch
+from models import CharacterInfo
+from project import Project
+from project_store import ProjectStore
+from prompt_core import make_yaml_text
+from prompt_parser import parse_page
+
+
+def _versions(n=100):
+    """
+    n パネルのプロジェクトと、数か所を直して範囲を移動し、キャラクターを足した版
+    """
+    page = make_project(n, seed=n)
+    old = Project(page.character_infos, page.panels)
+    new = old
+    for i in range(0, n, max(n // 20, 1)):
+        panel = copy.deepcopy(new.panels[i])
+        panel.description += "（修正）"
+        new = new.apply({"op": "update_panel", "index": i, "panel": panel})
+    new = new.apply({"op": "move_panels", "start": 10, "stop": 20, "to": n // 2})
+    new = new.apply({"op": "del_panels", "indices": [3, 4]})
+    new = new.apply({"op": "insert_char", "index": 1, "char": CharacterInfo("新キャラ", "1boy")})
+    return old, new
+
+
+def _parsed(project):
+    page = parse_page(_yaml(project))
+    return Project(page.character_infos, page.panels)
+
+
+def _yaml(project):
+    page = make_project(0)
+    page.character_infos = list(project.characters)
+    page.panels = list(project.panels)
+    return make_yaml_text(page)
+
+
+def _same(a, b):
+    return list(a.panels) == list(b.panels) and list(a.characters) == list(b.characters)
+
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_patch_turns_old_into_new(shared):
+    old, new = _versions()
+    if not shared:
+        # YAMLから読み込んだ版はオブジェクトを共有しない
+        old = _parsed(old)
+    assert _same(apply_patch(old, make_patch(old, new)), new)
+
+
+def test_no_changes():
+    old, _ = _versions()
+    assert diff(old, old) == []
+    assert make_patch(old, old) == []
+    assert diff(_parsed(old), old) == []
+
+
+def test_changed_fields():
+    old, _ = _versions()
+    panel = copy.deepcopy(old.panels[5])
+    panel.description = "別の状況"
+    new = old.apply({"op": "update_panel", "index": 5, "panel": panel})
+    assert diff(old, new) == [{"type": "panel", "change": "changed", "old": 5, "new": 5,
+                               "fields": [("description", old.panels[5].description, "別の状況")]}]
+
+
+def test_patch_file_and_store(tmp_path):
+    old, new = _versions()
+    path = str(tmp_path / "patch.json")
+    save_patch(make_patch(old, new), path)
+    store = ProjectStore("p", root=str(tmp_path))
+    store.save(old)
+    assert _same(apply_patch_to_store(store, load_patch(path)), new)
+    assert _same(ProjectStore("p", root=str(tmp_path)).load(), new)
@@ -0,0 +1,41 @@
+import json
+
+import pytest
+
+from conftest import make_project
+from formats import FORMATS, render
+from prompt_core import make_yaml_text
+from prompt_parser import page_from_dict
+
+
+@pytest.mark.parametrize("n", [0, 1, 10, 100])
+@pytest.mark.parametrize("as_dict", [False, True])
+def test_yaml_matches_make_yaml_text(n, as_dict):
+    page = make_project(n, seed=n)
+    data = {"comic_page": page.to_dict()} if as_dict else page
+    texts = render(data, ("yaml", "compact"))
+    assert texts["yaml"] == make_yaml_text(data)
+    assert texts["compact"] == make_yaml_text(data, compact=True)
+
+
+@pytest.mark.parametrize("n", [0, 1, 10])
+def test_json_and_ndjson(n):
+    page = make_project(n, seed=n)
+    texts = render(page, FORMATS)
+    tree = json.loads(texts["json"])
+    assert page_from_dict(tree["comic_page"]) == page
+    assert tree["comic_page"]["character_infos"] == [c.to_dict() for c in page.character_infos]
+    ndjson = texts["ndjson"].splitlines()
+    assert [json.loads(line) for line in ndjson] == tree["comic_page"]["panels"]
+    assert len(ndjson) == n
+
+
+def test_one_pass_matches_separate_calls():
+    page = make_project(20, seed=3)
+    together = render(page, FORMATS)
+    assert together == {f: render(page, (f,))[f] for f in FORMATS}
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        render(make_project(1), ("yaml", "toml"))
@@ -0,0 +1,50 @@
+import pytest
+
+from history import History
+from models import Panel
+from project import Project
+
+
+def _project(n_panels):
+    return Project([], [Panel(description=f"panel {i}") for i in range(n_panels)])
+
+
+def _descriptions(project):
+    return [p.description for p in project.panels]
+
+
+@pytest.mark.parametrize("start, stop", [(1, 10), (-1, 2), (4, 5)])
+def test_dup_panels_out_of_range(start, stop):
+    project = _project(3)
+    op = {"op": "dup_panels", "start": start, "stop": stop}
+    with pytest.raises(IndexError):
+        project.apply(op)
+    with pytest.raises(IndexError):
+        project.inverse(op)
+
+
+def test_dup_panels_reversed_range():
+    project = _project(3)
+    op = {"op": "dup_panels", "start": 2, "stop": 1}
+    with pytest.raises(IndexError):
+        project.apply(op)
+    with pytest.raises(IndexError):
+        project.inverse(op)
+
+
+def test_dup_panels_out_of_range_leaves_history_alone():
+    history = History(_project(3))
+    with pytest.raises(IndexError):
+        history.apply({"op": "dup_panels", "start": 1, "stop": 10})
+    assert len(history.current.panels) == 3
+    assert not history.can_undo()
+
+
+def test_undo_after_dup_panels():
+    history = History(_project(3))
+    history.apply({"op": "dup_panels", "start": 1, "stop": 3})
+    assert _descriptions(history.current) == ["panel 0", "panel 1", "panel 2", "panel 1", "panel 2"]
+    history.undo()
+    assert _descriptions(history.current) == ["panel 0", "panel 1", "panel 2"]
+    history.redo()
+    assert len(history.current.panels) == 5
@@ -0,0 +1,54 @@
+from models import CharacterInfo, Panel
+from project import Project
+from project_store import ProjectStore
+
+
+def _saved(tmp_path, n_panels):
+    store = ProjectStore("p", root=str(tmp_path))
+    project = Project([CharacterInfo("aichan", "1girl")], [])
+    for i in range(n_panels):
+        op = {"op": "add_panel", "panel": Panel(description=f"panel {i}")}
+        project = project.apply(op)
+        store.append(op, project)
+    return store, project
+
+
+def test_reload_matches_memory(tmp_path):
+    store, project = _saved(tmp_path, 3)
+    loaded = ProjectStore("p", root=str(tmp_path)).load()
+    assert [p.description for p in loaded.panels] == [p.description for p in project.panels]
+
+
+def test_torn_tail_is_dropped_before_next_append(tmp_path):
+    store, project = _saved(tmp_path, 3)
+    with open(store.journal_path, "a", encoding="utf-8") as f:
+        f.write('{"seq":4,"op":{"op":"add_pa')
+
+    store = ProjectStore("p", root=str(tmp_path))
+    project = store.load()
+    assert len(project.panels) == 3
+    op = {"op": "del_panel", "index": 0}
+    project = project.apply(op)
+    store.append(op, project)
+
+    loaded = ProjectStore("p", root=str(tmp_path)).load()
+    assert len(project.panels) == 2
+    assert [p.description for p in loaded.panels] == [p.description for p in project.panels]
+
+
+def test_complete_line_without_newline_is_treated_as_torn(tmp_path):
+    store, project = _saved(tmp_path, 2)
+    with open(store.journal_path, "rb+") as f:
+        data = f.read()
+        f.seek(0)
+        f.truncate()
+        f.write(data[:-1])
+
+    store = ProjectStore("p", root=str(tmp_path))
+    project = store.load()
+    assert len(project.panels) == 1
+    op = {"op": "add_panel", "panel": Panel(description="again")}
+    project = project.apply(op)
+    store.append(op, project)
+    loaded = ProjectStore("p", root=str(tmp_path)).load()
+    assert [p.description for p in loaded.panels] == ["panel 0", "again"]
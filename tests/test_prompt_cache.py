@@ -0,0 +1,131 @@
+import json
+import os
+import time
+
+import pytest
+
+from batch import run_batch
+from conftest import make_project
+from prompt_cache import STALE_TMP_AGE, PromptCache
+from prompt_core import fill_page_defaults, make_yaml_text
+
+
+def _line(n, seed):
+    return json.dumps({"comic_page": make_project(n, seed=seed).to_dict()}, ensure_ascii=False)
+
+
+def test_get_returns_what_was_put(tmp_path):
+    cache = PromptCache(str(tmp_path))
+    line = _line(10, 1)
+    key = cache.key(line)
+    assert cache.get(key) is None
+    text = make_yaml_text(json.loads(line))
+    cache.put(key, text)
+    assert cache.get(key) == text
+    assert (cache.hits, cache.misses, cache.writes) == (1, 1, 1)
+
+
+def _reencoded(line):
+    """
+    同じ内容で、キーの順番とエスケープと空白の書き方だけを変えた行
+    """
+    cp = json.loads(line)["comic_page"]
+    return json.dumps({"comic_page": dict(reversed(list(cp.items())))}, ensure_ascii=True, indent=1)
+
+
+def test_key():
+    line = _line(2, 1)
+    record = json.loads(line)
+    reordered = {"comic_page": dict(reversed(list(record["comic_page"].items())))}
+    assert PromptCache.key(record) == PromptCache.key(reordered) == PromptCache.key(line)
+    assert PromptCache.key(line) == PromptCache.key(_reencoded(line))
+    assert PromptCache.key(record) != PromptCache.key(record, compact=True)
+    assert PromptCache.key(line) != PromptCache.key(_line(2, 2))
+
+
+def test_key_fills_defaults():
+    record = json.loads(_line(2, 1))
+    del record["comic_page"]["style"]
+    filled = {"comic_page": fill_page_defaults(record["comic_page"])}
+    assert PromptCache.key(record) == PromptCache.key(filled)
+
+
+def test_line_key_is_only_a_shortcut(tmp_path):
+    cache = PromptCache(str(tmp_path))
+    line = _line(3, 1)
+    line_key = cache.line_key(line)
+    assert line_key != cache.key(line)
+    assert cache.line_key(line + "\n") == line_key
+    assert cache.get_line(line_key) is None
+    cache.put(cache.key(line), "yaml")
+    assert cache.get_line(line_key) is None
+    cache.put_line(line_key, cache.key(line))
+    assert cache.get_line(line_key) == "yaml"
+    # 行の書き方が違えば近道は使えないが、いつものキーで同じものが引ける
+    assert cache.get_line(cache.line_key(_reencoded(line))) is None
+    assert cache.get(cache.key(_reencoded(line))) == "yaml"
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    cache = PromptCache(str(tmp_path))
+    keys = [cache.key(_line(1, i)) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.put(key, "x" * 100)
+        path = cache._path(key)
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+    # 一番古いものを読むと、最近使ったものになる
+    assert cache.get(keys[0]) is not None
+    assert cache.prune(250) == 2
+    assert [cache.get(k) is not None for k in keys] == [True, False, False, True]
+    assert cache.size() == 200
+    assert cache.clear() == 2
+    assert cache.size() == 0
+
+
+def test_prune_removes_stale_tmp_files(tmp_path):
+    cache = PromptCache(str(tmp_path))
+    key = cache.key(_line(1, 0))
+    cache.put(key, "yaml")
+    tmp = cache._path(key) + ".tmp-12345"
+    with open(tmp, "w") as f:
+        f.write("書きかけ")
+    old = time.time() - STALE_TMP_AGE - 1
+    os.utime(tmp, (old, old))
+    cache.prune()
+    assert not os.path.exists(tmp)
+    assert cache.size() == 4
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+@pytest.mark.parametrize("compact", [False, True])
+def test_batch_output_is_the_same_with_the_cache(tmp_path, dedup, compact):
+    src = tmp_path / "pages.jsonl"
+    src.write_text("".join(_line(5, i % 3) + "\n" for i in range(6)), encoding="utf-8")
+    cache_dir = str(tmp_path / "cache")
+    outputs = []
+    for cache in (None, cache_dir, cache_dir):
+        out = tmp_path / "out.yaml"
+        ok, failed, _, _, stats = run_batch(str(src), combined=str(out), workers=1, dedup=dedup,
+                                            compact=compact, cache_dir=cache)
+        assert (ok, failed) == (6, 0)
+        outputs.append((out.read_text(encoding="utf-8"), stats))
+    assert outputs[0][0] == outputs[1][0] == outputs[2][0]
+    # 同じ内容のページは1回目から、2回目は全部キャッシュから
+    assert outputs[1][1]["hits"] == 3
+    assert outputs[2][1]["hits"] == 6
+
+
+def test_batch_hits_reordered_and_reescaped_lines(tmp_path):
+    lines = [_line(5, i) for i in range(4)]
+    cache_dir = str(tmp_path / "cache")
+    outputs = []
+    for text in ("".join(l + "\n" for l in lines), "".join(_reencoded(l).replace("\n", " ") + "\n" for l in lines)):
+        src = tmp_path / "pages.jsonl"
+        src.write_text(text, encoding="utf-8")
+        out = tmp_path / "out.yaml"
+        ok, failed, _, _, stats = run_batch(str(src), combined=str(out), workers=1, cache_dir=cache_dir)
+        assert (ok, failed) == (4, 0)
+        outputs.append((out.read_text(encoding="utf-8"), stats))
+    assert outputs[0][0] == outputs[1][0]
+    assert outputs[0][1]["hits"] == 0
+    assert outputs[1][1]["hits"] == 4
@@ -0,0 +1,132 @@
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import make_project
+from models import CharacterInfo, Line, Monologue, Page, Panel, PanelCharacter
+from prompt_core import (
+    INSTRUCTIONS_BLOCK,
+    LAYOUT_CONSTRAINTS_BLOCK,
+    PanelCache,
+    make_yaml_text,
+    settings_text,
+    size_report,
+)
+
+# prompt_core の import にかかる時間の上限（秒）
+IMPORT_BUDGET = 0.020
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE = (
+    "import json, sys, time\n"
+    "t = time.perf_counter()\n"
+    "import prompt_core\n"
+    "print(json.dumps({'seconds': time.perf_counter() - t, 'streamlit': 'streamlit' in sys.modules}))\n"
+)
+
+
+def _import_prompt_core():
+    out = subprocess.run([sys.executable, "-c", CODE], cwd=HERE, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout)
+
+
+def test_import_does_not_load_streamlit():
+    assert not _import_prompt_core()["streamlit"]
+
+
+def test_import_is_within_budget():
+    # 別プロセスの起動のばらつきを除くため、何回か測って一番速いものを見る
+    seconds = min(_import_prompt_core()["seconds"] for _ in range(5))
+    assert seconds < IMPORT_BUDGET, f"import prompt_core took {seconds * 1000:.1f} ms"
+
+
+# --- PanelCache を使っても出力が変わらないこと ---
+def _page(n_panels=6):
+    panels = []
+    for i in range(n_panels):
+        chars = [PanelCharacter(name="aichan", panel_position="center", emotion="笑顔",
+                                lines=[Line(f"セリフ {i % 3}", "right")])] if i % 2 == 0 else []
+        monos = [Monologue("彼女の旅は続く")] if i % 3 == 0 else []
+        # 同じ内容のパネルを混ぜておく（キャッシュの1つの項目を何度も使う）
+        panels.append(Panel(page_position="top", background="教室", description=f"状況 {i % 4}",
+                            objects=["スマホ"] if i % 4 == 1 else [], characters=chars, monologues=monos))
+    return Page("日本語", "manga", "vertical-rl", "モノクロ", "9:16", INSTRUCTIONS_BLOCK, LAYOUT_CONSTRAINTS_BLOCK,
+                [CharacterInfo("aichan", "1girl, long hair")], panels)
+
+
+def _edits(page):
+    """
+    page と、削除・編集・番号の付け直しをしたあとのページを順に返す
+    """
+    def with_panels(panels):
+        return Page(page.language, page.style, page.writing_mode, page.color_mode, page.aspect_ratio,
+                    page.instructions, page.layout_constraints, page.character_infos, panels)
+
+    panels = list(page.panels)
+    yield page
+    del panels[1]
+    yield with_panels(list(panels))
+    old = panels[2]
+    panels[2] = Panel(old.number, old.page_position, old.background, old.description + "（直した）", old.objects,
+                      [PanelCharacter(name="aichan", lines=[Line("直したセリフ")])], old.effects, old.monologues,
+                      old.camera_angle)
+    yield with_panels(list(panels))
+    panels = [Panel.from_dict(p.to_dict(len(panels) - i + 10)) for i, p in enumerate(panels)]
+    yield with_panels(panels)
+
+
+def test_panel_cache_keeps_output_identical():
+    for compact in (False, True):
+        # 編集のあいだもキャッシュは使い続ける（画面と同じ）
+        caches = {"page": (PanelCache(), PanelCache(maxsize=2)), "dict": (PanelCache(), PanelCache(maxsize=2))}
+        for step, page in enumerate(_edits(_page())):
+            for kind, data in (("page", page), ("dict", {"comic_page": page.to_dict()})):
+                expected = make_yaml_text(data, compact=compact)
+                for cache in caches[kind]:
+                    # 2回目は覚えた断片から作る
+                    for _ in range(2):
+                        assert make_yaml_text(data, cache, compact=compact) == expected, (step, kind, cache.maxsize)
+                assert len(caches[kind][1]) <= 2
+        assert caches["page"][0].hits > 0
+        assert caches["page"][1].misses > caches["page"][0].misses
+
+
+# --- コンパクト出力と size_report ---
+# 10パネル以上のサンプルのプロジェクトで、コンパクト出力が最低これだけ小さくなっていること
+COMPACT_MIN_SAVING = 0.15
+
+
+@pytest.mark.parametrize("n", [10, 100, 1000])
+def test_compact_output_is_smaller(n):
+    page = make_project(n, seed=n)
+    normal = len(make_yaml_text(page).encode())
+    compact = len(make_yaml_text(page, compact=True).encode())
+    assert 1 - compact / normal >= COMPACT_MIN_SAVING, f"{normal} B -> {compact} B"
+
+
+@pytest.mark.parametrize("n", [0, 1, 10])
+@pytest.mark.parametrize("compact", [False, True])
+def test_size_report_adds_up_to_output(n, compact):
+    page = make_project(n, seed=n)
+    report = size_report(page, compact=compact)
+    assert sum(r["bytes"] for r in report) == len(make_yaml_text(page, compact=compact).encode())
+    assert [r["section"] for r in report if r["section"].startswith("panel ")] == [f"panel {i}" for i in range(1, n + 1)]
+
+
+def test_settings_text_from_many_threads():
+    # 覚えておける数より多い設定を同時に作らせても、捨てるときに壊れない
+    pages = [Page("Japanese", f"style {i}", "vertical-rl", "白黒", "1:1.41", "a\nb", "c")
+             for i in range(200)]
+
+    def run(page):
+        return settings_text(page), settings_text(page, compact=True)
+
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(5):
+            for page, (text, compact) in zip(pages, pool.map(run, pages)):
+                assert f'style : "{page.style}"' in text
+                assert f' style: "{page.style}"' in compact
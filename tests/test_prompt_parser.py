@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import make_project
+from models import Line, PanelCharacter
+from prompt_core import AnchorTable, iter_pages_chunks, make_yaml_text
+from prompt_parser import ParseError, iter_pages, parse_page
+
+
+def _tricky_page():
+    """
+    " や # や空行を含む値を持つページ
+    """
+    page = make_project(5, seed=1)
+    page.instructions = "# 見出し\n\n- 箇条書き: \"引用\"\n  字下げした行\n\n# 最後"
+    page.layout_constraints = "  字下げで始まる行\n\n\n3行目 # コメントではない\n#"
+    page.panels[0].description = '彼は"やあ"と言った: # ではない'
+    page.panels[1].background = '"'
+    page.panels[2].characters.append(PanelCharacter(name="#x", lines=[Line('"「え？」"')]))
+    return page
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("dedup", [False, True])
+@pytest.mark.parametrize("n", [0, 1, 10, 100])
+def test_roundtrip(n, compact, dedup):
+    page = make_project(n, seed=n)
+    text = make_yaml_text(page, anchors=AnchorTable() if dedup else None, compact=compact)
+    assert parse_page(text) == page
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("dedup", [False, True])
+def test_roundtrip_quotes_comments_and_blank_lines(compact, dedup):
+    page = _tricky_page()
+    text = make_yaml_text(page, anchors=AnchorTable() if dedup else None, compact=compact)
+    assert parse_page(text) == page
+
+
+@pytest.mark.parametrize("dedup", [False, True])
+def test_roundtrip_comic_page_list(dedup):
+    pages = [make_project(3, seed=i) for i in range(3)] + [_tricky_page()]
+    text = "".join(iter_pages_chunks(pages, AnchorTable() if dedup else None))
+    assert text.startswith("- comic_page :")
+    assert list(iter_pages(text.split("\n"))) == pages
+
+
+def test_roundtrip_documents():
+    pages = [make_project(2, seed=i) for i in range(3)]
+    text = "".join("---\n" + make_yaml_text(page) + "\n" for page in pages)
+    assert list(iter_pages(text.splitlines(keepends=True))) == pages
+
+
+def test_parse_page_rejects_other_documents():
+    with pytest.raises(ParseError):
+        parse_page("panels :\n  - number : 1")
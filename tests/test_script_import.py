@@ -0,0 +1,110 @@
+import io
+import json
+
+import pytest
+
+from models import CharacterInfo, Line, Monologue, Panel, PanelCharacter
+from script_import import ScriptImporter, main, parse_line, text_positions
+
+CAST = [CharacterInfo("aichan", "1girl"), CharacterInfo("Kouhai", "1boy")]
+
+SCRIPT = """\
+放課後の教室
+ＡｉＣｈａｎ: なのばなな…ぷろ？
+
+# 二人が言い合いをしている
+kouhai「え、もう締め切り明日なの！？」
+aichan：大丈夫、私に任せて。
+aichan: 今日こそ完成させるんだから。
+---
+（彼女の旅は続く）
+sensei: 静かに。
+"""
+
+
+@pytest.mark.parametrize("line, event", [
+    ("", None),
+    ("   ", None),
+    ("---", ("panel", "")),
+    ("# 主人公が驚いている", ("panel", "主人公が驚いている")),
+    ("aichan: なのばなな…ぷろ？", ("line", "aichan", "なのばなな…ぷろ？")),
+    ("aichan：なのばなな", ("line", "aichan", "なのばなな")),
+    ("aichan「なのばなな」", ("line", "aichan", "なのばなな")),
+    ("（彼女の旅は続く）", ("monologue", "彼女の旅は続く")),
+    ("(独り言)", ("monologue", "独り言")),
+    ("夕暮れの帰り道", ("direction", "夕暮れの帰り道")),
+    # 「:」の前が長すぎるものは話者とみなさない
+    ("とても長いト書きの中にコロンがあるときは話者ではない: 続き",
+     ("direction", "とても長いト書きの中にコロンがあるときは話者ではない: 続き")),
+])
+def test_parse_line(line, event):
+    assert parse_line(line) == event
+
+
+def test_text_panels():
+    importer = ScriptImporter(CAST)
+    panels = list(importer.iter_panels(io.StringIO(SCRIPT)))
+    assert panels == [
+        Panel(description="放課後の教室",
+              characters=[PanelCharacter(name="aichan", lines=[Line("なのばなな…ぷろ？", "right")])]),
+        Panel(description="二人が言い合いをしている", characters=[
+            PanelCharacter(name="Kouhai", lines=[Line("え、もう締め切り明日なの！？", "right")]),
+            PanelCharacter(name="aichan", lines=[Line("大丈夫、私に任せて。", "left"),
+                                                 Line("今日こそ完成させるんだから。", "left")]),
+        ]),
+        Panel(characters=[PanelCharacter(name="sensei", lines=[Line("静かに。", "right")])],
+              monologues=[Monologue("彼女の旅は続く")]),
+    ]
+    assert importer.unknown == {"sensei": 1}
+    assert importer.lines_read == 9
+
+
+def test_csv_panels_match_text():
+    csv_script = (
+        "panel,speaker,text\n"
+        "1,,放課後の教室\n"
+        "1,ＡｉＣｈａｎ,なのばなな…ぷろ？\n"
+        "2,kouhai,え、もう締め切り明日なの！？\n"
+        "2,aichan,大丈夫、私に任せて。\n"
+        "2,aichan,今日こそ完成させるんだから。\n"
+        "3,,（彼女の旅は続く）\n"
+        "3,sensei,静かに。\n"
+    )
+    text = list(ScriptImporter(CAST).iter_panels(io.StringIO(SCRIPT)))
+    from_csv = list(ScriptImporter(CAST).iter_panels(io.StringIO(csv_script), csv_format=True))
+    # CSV には区切りの説明がないので、description 以外を比べる
+    assert [p.characters for p in from_csv] == [p.characters for p in text]
+    assert [p.monologues for p in from_csv] == [p.monologues for p in text]
+
+
+def test_text_positions():
+    assert text_positions(2) == ("right", "left")
+    assert text_positions(2, "horizontal-tb") == ("left", "right")
+    assert text_positions(4) == ("right", "center", "center", "left")
+    panel = next(ScriptImporter(CAST, "horizontal-tb").iter_panels(["aichan: a", "kouhai: b"]))
+    assert [c.lines[0].char_text_position for c in panel.characters] == ["left", "right"]
+
+
+def test_reads_lazily():
+    read = []
+
+    def lines():
+        for i in range(1000):
+            read.append(i)
+            yield f"# panel {i}"
+            yield "aichan: セリフ"
+
+    panels = ScriptImporter(CAST).iter_panels(lines())
+    next(panels)
+    # 1つ目のパネルを返すのに、2つ目の区切りまでしか読まない
+    assert len(read) == 2
+
+
+def test_cli_writes_pages(tmp_path, capsys):
+    src = tmp_path / "script.txt"
+    src.write_text(SCRIPT, encoding="utf-8")
+    out = tmp_path / "pages.jsonl"
+    assert main([str(src), "-o", str(out), "--per-page", "2"]) == 0
+    pages = [json.loads(line)["comic_page"] for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [[p["number"] for p in page["panels"]] for page in pages] == [[1, 2], [1]]
+    assert "9 lines -> 3 panels in 2 pages" in capsys.readouterr().err
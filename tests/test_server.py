@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+import server
+from server import HTTPError, PromptServer, read_request
+
+
+def _read(data, eof=True, limit=2 ** 16):
+    """
+    data を受け取った接続から read_request で1つ読む。eof が False なら接続は開いたまま
+    """
+    async def run():
+        reader = asyncio.StreamReader(limit=limit)
+        reader.feed_data(data)
+        if eof:
+            reader.feed_eof()
+        return await read_request(reader)
+    return asyncio.run(run())
+
+
+def test_read_request():
+    body = b'{"comic_page": {}}'
+    method, path, query, headers, got = _read(
+        b"POST /page?compact=1 HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % len(body) + body)
+    assert (method, path, query, got) == ("POST", "/page", {"compact": "1"}, body)
+    assert headers["keep-alive"]
+
+
+def test_header_line_too_long():
+    with pytest.raises(HTTPError) as e:
+        _read(b"GET /health HTTP/1.1\r\nX-Long: " + b"a" * 100 + b"\r\n\r\n", limit=64)
+    assert e.value.status == 431
+
+
+def test_slow_headers_time_out(monkeypatch):
+    monkeypatch.setattr(server, "REQUEST_TIMEOUT", 0.05)
+    # ヘッダーの途中で止まったまま、接続は閉じられない
+    with pytest.raises(HTTPError) as e:
+        _read(b"GET /health HTTP/1.1\r\nHost: x\r\n", eof=False)
+    assert e.value.status == 408
+
+
+def test_slow_body_times_out(monkeypatch):
+    monkeypatch.setattr(server, "REQUEST_TIMEOUT", 0.05)
+    with pytest.raises(HTTPError) as e:
+        _read(b"POST /page HTTP/1.1\r\nContent-Length: 100\r\n\r\n{", eof=False)
+    assert e.value.status == 408
+
+
+def test_oversize_header_is_answered_and_closed():
+    async def run():
+        srv = await asyncio.start_server(PromptServer().handle, "127.0.0.1", 0, limit=1024)
+        port = srv.sockets[0].getsockname()[1]
+        async with srv:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /health HTTP/1.1\r\nX-Long: " + b"a" * 4096 + b"\r\n\r\n")
+            await writer.drain()
+            data = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return data
+    data = asyncio.run(run())
+    assert data.startswith(b"HTTP/1.1 431 ")
+    assert b"Connection: close" in data
@@ -0,0 +1,153 @@
+"""
+画面の再実行と生成にかかった時間の記録
+
+どこが遅いのか（タブ1・2の部品作り、make_yaml_text、st.code での表示など）を見分けるため、
+区間ごとに回数・時間・出力サイズを記録する。記録は1行1件の JSON として
+ロガー "manga_prompt.timing" に書く（環境変数 MANGA_PROMPT_TIMING_LOG にファイル名、
+または - で標準エラーを指定したときだけ出力する）。
+
+Streamlit に依存しないので、バッチ処理などからも使える。
+
+使い方:
+    timings = Timings()
+    with timings.phase("make_yaml_text") as info:
+        text = make_yaml_text(page)
+        info["size"] = len(text)
+    timings.lap("tab1")          # 前の lap からの時間を tab1 として記録する
+    timings.finish()             # 全体の時間を記録して、まとめを1行書く
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger("manga_prompt.timing")
+
+LOG_ENV = "MANGA_PROMPT_TIMING_LOG"
+
+# ログの行をどの実行のものか見分けるための番号
+_run_numbers = itertools.count(1)
+
+
+def setup_logging():
+    """
+    環境変数 MANGA_PROMPT_TIMING_LOG があれば、記録をそこに書くようにする（何度呼んでもよい）
+    """
+    target = os.environ.get(LOG_ENV)
+    if not target or logger.handlers:
+        return
+    handler = logging.StreamHandler() if target == "-" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # Streamlit のログに同じ行が混ざらないようにする
+    logger.propagate = False
+
+
+class Timings:
+    """
+    1回の実行の区間ごとの記録
+    records は (区間名, 秒, サイズ) のリスト、recent は複数回の実行にまたがる最近の記録（辞書）
+    """
+
+    def __init__(self, recent=None, run=None):
+        self.run = run if run is not None else f"{os.getpid()}-{next(_run_numbers)}"
+        self.records = []
+        self.recent = recent if recent is not None else deque(maxlen=200)
+        self.started = self._last = time.perf_counter()
+        self.total = None
+
+    def record(self, name, seconds, size=None):
+        """
+        区間を1件記録してログに書く
+        """
+        self.records.append((name, seconds, size))
+        entry = {"event": "phase", "run": self.run, "phase": name, "ms": round(seconds * 1000, 3)}
+        if size is not None:
+            entry["size"] = size
+        self.recent.append(entry)
+        logger.info(json.dumps(entry, ensure_ascii=False))
+
+    @contextmanager
+    def phase(self, name):
+        """
+        with の中の時間を name として記録する
+        出力サイズがあれば、with で受け取った辞書の "size" に入れておく
+        st.rerun() などで途中で抜けたときも記録する
+        """
+        info = {}
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, time.perf_counter() - start, info.get("size"))
+
+    def lap(self, name):
+        """
+        前の lap（なければ開始）からの時間を name として記録する
+        """
+        now = time.perf_counter()
+        self.record(name, now - self._last)
+        self._last = now
+
+    def finish(self):
+        """
+        開始からの時間を記録し、区間ごとのまとめを1行書く
+        """
+        self.total = time.perf_counter() - self.started
+        summary = {"event": "run", "run": self.run, "ms": round(self.total * 1000, 3),
+                   "phases": {row["phase"]: row["ms"] for row in self.rows()}}
+        logger.info(json.dumps(summary, ensure_ascii=False))
+        return self.total
+
+    def rows(self):
+        """
+        区間ごとの {"phase", "count", "ms", "size"}（size は最後に記録したもの）
+        """
+        table = {}
+        for name, seconds, size in self.records:
+            row = table.get(name)
+            if row is None:
+                row = table[name] = {"phase": name, "count": 0, "ms": 0.0, "size": None}
+            row["count"] += 1
+            row["ms"] += seconds * 1000
+            if size is not None:
+                row["size"] = size
+        for row in table.values():
+            row["ms"] = round(row["ms"], 3)
+        return list(table.values())
+
+
+def profile_result(profiler, limit=30):
+    """
+    止めた cProfile.Profile から (pstats で開ける .prof の中身, 累積時間順の上位 limit 件の文字列) を作る
+    """
+    # dump_stats はファイルにしか書けないので、一時ファイルを経由する
+    fd, path = tempfile.mkstemp(suffix=".prof")
+    os.close(fd)
+    try:
+        profiler.dump_stats(path)
+        with open(path, "rb") as f:
+            data = f.read()
+    finally:
+        os.remove(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return data, out.getvalue()
+
+
+def start_profile():
+    """
+    プロファイルを始める。止めるときは profiler.disable() してから profile_result に渡す
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
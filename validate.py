@@ -0,0 +1,193 @@
+"""
+生成する前のページのチェック
+
+見つけた問題は次の形の辞書のリストで返す（panel は 1 始まりのパネル番号。ページ全体の問題なら None）。
+    {"level": "error" / "warning", "panel": 3, "field": "characters[0].lines[1].text",
+     "code": "unsafe_text", "message": "..."}
+
+error（このままではYAMLが壊れる）
+    unsafe_text       "..." で書く値に " \\ 改行 が入っている
+    not_text          文字列であるはずの値が文字列でない
+warning（YAMLは作れるが、たぶん意図と違う）
+    unknown_speaker   character_infos に登録されていない名前
+    empty_name        名前が空（「セリフのみ」で話者を選ばなかったときなど）
+    empty_line        セリフが空
+    shared_position   同じパネルの2人が同じ panel_position
+    duplicate_page_position  2つのパネルが同じ page_position
+    duplicate_character      character_infos に同じ名前が2つ
+
+チェックする項目の一覧と正規表現はモジュールを読み込んだときに1回だけ作る。
+Validator はパネルごとの結果をパネルのオブジェクトごとに覚えておくので、
+画面で1つのパネルを直したときは、そのパネルだけを調べ直す（page_position の重複だけは毎回全体を見る）。
+パネルは project.py の操作で置き換えられ、書き換えられないので、同じオブジェクトなら結果も同じになる。
+
+使い方:
+    issues = validate_page(page)            # 1ページをまとめて調べる
+    validator = Validator(characters)       # 画面では登録キャラクターが変わるまで使い回す
+    issues = validator.check_panels(panels)
+"""
+
+import re
+from collections import Counter
+
+# "..." の中に書くと YAML が壊れる文字
+_UNSAFE = re.compile(r'["\\\r\n]')
+# 基本設定のうち "..." で書く項目（長文ブロックは |- なのでどんな文字でもよい）
+HEADER_TEXT_FIELDS = ("language", "style", "writing_mode", "color_mode", "aspect_ratio")
+PANEL_TEXT_FIELDS = ("page_position", "background", "description", "camera_angle")
+CHARACTER_TEXT_FIELDS = ("name", "panel_position", "emotion", "facing", "shot", "pose")
+LINE_TEXT_FIELDS = ("text", "char_text_position", "type")
+MONOLOGUE_TEXT_FIELDS = ("text", "text_position", "balloon_shape")
+
+
+def _issue(level, code, field, message, panel=None):
+    return {"level": level, "panel": panel, "field": field, "code": code, "message": message}
+
+
+def _text_issues(value, field, out):
+    if not isinstance(value, str):
+        out.append(_issue("error", "not_text", field, f"文字列ではありません: {value!r}"))
+    else:
+        found = _UNSAFE.search(value)
+        if found:
+            out.append(_issue("error", "unsafe_text", field, f'{found.group()!r} は使えません（" \\ 改行 はYAMLが壊れます）'))
+
+
+def _panel_values(panel):
+    # "..." で書く値をすべて並べる（まとめて1回で正規表現にかけるため）
+    values = [panel.page_position, panel.background, panel.description, panel.camera_angle]
+    values += panel.objects
+    for c in panel.characters:
+        values += (c.name, c.panel_position, c.emotion, c.facing, c.shot, c.pose)
+        for l in c.lines:
+            values += (l.text, l.char_text_position, l.type)
+    for m in panel.monologues:
+        values += (m.text, m.text_position, m.balloon_shape)
+    return values
+
+
+def _panel_text_issues(panel, out):
+    """
+    1つずつ調べて、どの項目かを付けて報告する（まとめて調べて何か見つかったときだけ呼ぶ）
+    """
+    for f in PANEL_TEXT_FIELDS:
+        _text_issues(getattr(panel, f), f, out)
+    for i, o in enumerate(panel.objects):
+        _text_issues(o, f"objects[{i}]", out)
+    for ci, c in enumerate(panel.characters):
+        for f in CHARACTER_TEXT_FIELDS:
+            _text_issues(getattr(c, f), f"characters[{ci}].{f}", out)
+        for li, l in enumerate(c.lines):
+            for f in LINE_TEXT_FIELDS:
+                _text_issues(getattr(l, f), f"characters[{ci}].lines[{li}].{f}", out)
+    for mi, m in enumerate(panel.monologues):
+        for f in MONOLOGUE_TEXT_FIELDS:
+            _text_issues(getattr(m, f), f"monologues[{mi}].{f}", out)
+
+
+class Validator:
+    """
+    登録キャラクター一覧ごとに作るチェッカー
+    """
+
+    def __init__(self, character_infos=()):
+        self.names = frozenset(c.name for c in character_infos)
+        # id(panel) -> (panel, パネル番号なしの問題のリスト)
+        self._cache = {}
+        self.checked = 0
+
+    def panel_issues(self, panel):
+        """
+        パネル1つの問題（panel は None のまま）。同じパネルのオブジェクトなら前回の結果を返す
+        """
+        cached = self._cache.get(id(panel))
+        if cached is not None and cached[0] is panel:
+            return cached[1]
+        self.checked += 1
+        out = []
+        try:
+            unsafe = _UNSAFE.search("\x00".join(_panel_values(panel)))
+        except TypeError:
+            unsafe = True
+        if unsafe:
+            _panel_text_issues(panel, out)
+
+        names = self.names
+        positions = set()
+        for ci, c in enumerate(panel.characters):
+            name = c.name
+            if not name:
+                out.append(_issue("warning", "empty_name", f"characters[{ci}].name", "名前が空です"))
+            elif name not in names:
+                out.append(_issue("warning", "unknown_speaker", f"characters[{ci}].name",
+                                  f"{name} は登録されていないキャラクターです"))
+            pos = c.panel_position
+            if pos:
+                if pos in positions:
+                    out.append(_issue("warning", "shared_position", f"characters[{ci}].panel_position",
+                                      f"panel_position {pos} に2人以上います"))
+                positions.add(pos)
+            for li, l in enumerate(c.lines):
+                if not l.text:
+                    out.append(_issue("warning", "empty_line", f"characters[{ci}].lines[{li}].text", "セリフが空です"))
+        self._cache[id(panel)] = (panel, out)
+        return out
+
+    def check_panels(self, panels):
+        """
+        パネル一覧の問題（パネルごとの問題と page_position の重複）
+        """
+        issues = []
+        positions = Counter()
+        first = {}
+        for number, panel in enumerate(panels, 1):
+            for issue in self.panel_issues(panel):
+                issues.append(dict(issue, panel=number))
+            pos = panel.page_position
+            if pos:
+                positions[pos] += 1
+                if positions[pos] == 1:
+                    first[pos] = number
+                else:
+                    issues.append(_issue("warning", "duplicate_page_position", "page_position",
+                                         f"page_position {pos} は Panel {first[pos]} と同じです", number))
+        # 消えたパネルの結果を溜め込まないように、今のパネルの分だけ残す
+        if len(self._cache) > 2 * len(panels) + 64:
+            self._cache = {id(p): self._cache[id(p)] for p in panels if id(p) in self._cache}
+        return issues
+
+    def check_page(self, page):
+        """
+        基本設定・キャラクター一覧・パネル一覧の問題
+        """
+        issues = []
+        for f in HEADER_TEXT_FIELDS:
+            _text_issues(getattr(page, f), f, issues)
+        seen = set()
+        for i, c in enumerate(page.character_infos):
+            _text_issues(c.name, f"character_infos[{i}].name", issues)
+            _text_issues(c.base_prompt, f"character_infos[{i}].base_prompt", issues)
+            if not c.name:
+                issues.append(_issue("warning", "empty_name", f"character_infos[{i}].name", "名前が空です"))
+            elif c.name in seen:
+                issues.append(_issue("warning", "duplicate_character", f"character_infos[{i}].name",
+                                     f"{c.name} が2回登録されています"))
+            seen.add(c.name)
+        issues.extend(self.check_panels(page.panels))
+        return issues
+
+
+def validate_page(page):
+    """
+    1ページをまとめて調べる（バッチ処理用。結果は覚えておかない）
+    """
+    return Validator(page.character_infos).check_page(page)
+
+
+def has_errors(issues):
+    return any(issue["level"] == "error" for issue in issues)
+
+
+def format_issue(issue):
+    where = f"panel {issue['panel']} " if issue["panel"] is not None else ""
+    return f"{issue['level']}: {where}{issue['field']}: {issue['message']} ({issue['code']})"